@@ -1,11 +1,16 @@
 from app.components.layout import layout, header
 from app.components.dialogs import confirm_dialog, form_dialog
 from app.components.status_badge import status_badge
+from app.components.product_picker import ProductPicker, ProductOptions
+from app.components.job_progress import job_progress
 
 __all__ = [
     'layout',
     'header',
     'confirm_dialog',
     'form_dialog',
-    'status_badge'
+    'status_badge',
+    'ProductPicker',
+    'ProductOptions',
+    'job_progress',
 ]
@@ -0,0 +1,47 @@
+from typing import Callable
+
+from nicegui import ui
+
+from app.services.job_service import JobService, FINISHED_STATUSES
+from app.tracing import detach
+
+# Delay between two progress refreshes (seconds)
+POLL_INTERVAL = 0.5
+
+
+def job_progress(job_id: int, on_finished: Callable[[dict], None]):
+    """Card showing a background job's live progress, with a Cancel button.
+
+    The card polls the job until it finishes, then removes itself and calls
+    on_finished with the final job state.
+    """
+    job = JobService.get(job_id) or {}
+
+    with ui.card().classes('w-full mb-4') as card:
+        with ui.row().classes('w-full items-center justify-between'):
+            with ui.row().classes('gap-2 items-center'):
+                ui.spinner(size='sm')
+                title = ui.label(job.get('description', 'Job')).classes('font-medium')
+                detail = ui.label('').classes('text-sm text-gray-500')
+            cancel_btn = ui.button('Cancel', icon='stop', on_click=lambda: JobService.cancel(job_id)) \
+                .props('flat dense color=negative')
+        bar = ui.linear_progress(value=0, show_value=False).props('instant-feedback')
+
+        def poll():
+            current = JobService.get(job_id)
+            if current is None or current['status'] in FINISHED_STATUSES:
+                timer.cancel()
+                card.delete()
+                if current is not None:
+                    on_finished(current)
+                return
+            title.set_text(current['description'])
+            if current['total']:
+                bar.set_value(current['done'] / current['total'])
+                detail.set_text(f"{current['done']}/{current['total']} {current['message']}".strip())
+            else:
+                detail.set_text(current['message'] or current['status'].capitalize())
+            cancel_btn.set_enabled(current['message'] != 'Cancelling...')
+
+        # Polling must not extend the trace of the event that started the job
+        timer = ui.timer(POLL_INTERVAL, detach(poll))
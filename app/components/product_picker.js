@@ -0,0 +1,39 @@
+export default {
+  template: `
+    <q-select
+      v-bind="$attrs"
+      :model-value="value"
+      :options="options"
+      use-input
+      fill-input
+      hide-selected
+      emit-value
+      map-options
+      :input-debounce="debounce"
+      @filter="onFilter"
+      @virtual-scroll="onVirtualScroll"
+      @update:model-value="(v) => $emit('change', v)"
+    >
+      <template v-slot:no-option>
+        <q-item><q-item-section class="text-grey">No product found</q-item-section></q-item>
+      </template>
+    </q-select>
+  `,
+  props: {
+    value: null,
+    options: Array,
+    debounce: Number,
+  },
+  methods: {
+    onFilter(val, update) {
+      // Options are filtered on the server; just let the menu open
+      update();
+      this.$emit("search", val);
+    },
+    onVirtualScroll({ to }) {
+      if (to >= this.options.length - 1) {
+        this.$emit("more");
+      }
+    },
+  },
+};
@@ -0,0 +1,170 @@
+from typing import Callable, Optional
+
+from nicegui import ui
+
+from app.services import ProductService
+
+# Products fetched per request when typing or scrolling
+PAGE_SIZE = 30
+# Delay after the last keystroke before querying the server (ms)
+SEARCH_DEBOUNCE = 250
+
+
+class ProductOptions:
+    """Options source shared by every product picker of a dialog.
+
+    Pages of results are fetched from the server-side product index on demand
+    and cached, so 50 line items of the same supplier share one set of
+    results instead of each holding a full copy of the catalog. Unit prices
+    of the supplier's products are likewise loaded once, on first use. Both
+    are dropped when the catalog version changes. Callers run on the event
+    loop: until the catalog is loaded, searches return nothing and single
+    products are read from the database instead of waiting for it.
+    """
+
+    def __init__(self, supplier_id: Optional[int] = None):
+        self.supplier_id = supplier_id
+        self._pages: dict[tuple[str, int], list[dict]] = {}
+        self._prices: Optional[dict[int, float]] = None
+        self._version: Optional[int] = None
+
+    def set_supplier(self, supplier_id: Optional[int]) -> None:
+        """Switch to another supplier's catalog."""
+        if supplier_id != self.supplier_id:
+            self.supplier_id = int(supplier_id) if supplier_id else None
+            self._pages.clear()
+            self._prices = None
+
+    def price(self, product_id: Optional[int]) -> Optional[float]:
+        """Unit price of one of the supplier's products, from the shared price map."""
+        if not product_id:
+            return None
+        if not ProductService.is_loaded():
+            product = ProductService.get_by_id(int(product_id))
+            return product.get('unitprice') if product else None
+        self._check_version()
+        if self._prices is None:
+            if self.supplier_id is None:
+                self._prices = {}
+            else:
+                _, products = ProductService.get_cached_for_supplier(self.supplier_id)
+                self._prices = {p['idsupplierproduct']: p.get('unitprice') for p in products}
+        if int(product_id) in self._prices:
+            return self._prices[int(product_id)]
+        # Not one of this supplier's products (or added since): single in-memory lookup
+        product = ProductService.get_cached(int(product_id))
+        return product.get('unitprice') if product else None
+
+    def page(self, query: str, page: int) -> list[dict]:
+        """Get one page of ``{'label', 'value'}`` options matching the query (none while the catalog loads)."""
+        if not ProductService.is_loaded():
+            return []
+        self._check_version()
+        key = (query, page)
+        if key not in self._pages:
+            if query:
+                products = ProductService.search(
+                    query, supplier_id=self.supplier_id, limit=PAGE_SIZE, offset=page * PAGE_SIZE
+                )
+            else:
+                products = ProductService.browse(
+                    supplier_id=self.supplier_id, offset=page * PAGE_SIZE, limit=PAGE_SIZE
+                )
+            self._pages[key] = [_option(p) for p in products]
+        return self._pages[key]
+
+    def _check_version(self) -> None:
+        version = ProductService.catalog_version()
+        if version != self._version:
+            self._version = version
+            self._pages.clear()
+            self._prices = None
+
+    def option(self, product_id: Optional[int]) -> Optional[dict]:
+        """Get the option for a single product (e.g. a row's current value)."""
+        if not product_id:
+            return None
+        if ProductService.is_loaded():
+            product = ProductService.get_cached(int(product_id))
+        else:
+            product = ProductService.get_by_id(int(product_id))
+        return _option(product) if product else None
+
+
+class ProductPicker(ui.element, component='product_picker.js'):
+    """Typeahead product selector querying the server-side product index.
+
+    Args:
+        source: Options source, shared by all pickers of the same dialog
+        label: Field label
+        value: Initially selected product ID
+        on_change: Called with the newly selected product ID
+    """
+
+    def __init__(self, source: ProductOptions, label: str = 'Product',
+                 value: Optional[int] = None, on_change: Optional[Callable[[Optional[int]], None]] = None):
+        super().__init__()
+        self.source = source
+        self._on_change = on_change
+        self._query = ''
+        self._page = 0
+        self._exhausted = False
+
+        self._props['label'] = label
+        self._props['value'] = value
+        self._props['debounce'] = SEARCH_DEBOUNCE
+        current = source.option(value)
+        self._props['options'] = [current] if current else []
+
+        self.on('search', self._handle_search)
+        self.on('more', self._handle_more)
+        self.on('change', self._handle_change)
+
+    @property
+    def value(self) -> Optional[int]:
+        return self._props['value']
+
+    @value.setter
+    def value(self, value: Optional[int]) -> None:
+        self._props['value'] = value
+        current = self.source.option(value)
+        if current and current not in self._props['options']:
+            self._props['options'] = [current] + self._props['options']
+        self.update()
+
+    def _handle_search(self, e) -> None:
+        self._query = e.args or ''
+        self._page = 0
+        options = self.source.page(self._query, 0)
+        self._exhausted = len(options) < PAGE_SIZE
+        self._set_options(options)
+
+    def _handle_more(self, _) -> None:
+        if self._exhausted:
+            return
+        self._page += 1
+        options = self.source.page(self._query, self._page)
+        self._exhausted = len(options) < PAGE_SIZE
+        if options:
+            self._set_options(self._props['options'] + options)
+
+    def _handle_change(self, e) -> None:
+        self._props['value'] = e.args
+        self.update()
+        if self._on_change:
+            self._on_change(e.args)
+
+    def _set_options(self, options: list[dict]) -> None:
+        # Keep the selected product resolvable even when it is not in the results
+        current = self.source.option(self.value)
+        if current and current not in options:
+            options = [current] + options
+        self._props['options'] = options
+        self.update()
+
+
+def _option(product: dict) -> dict:
+    return {
+        'label': f"{product['code']} - {(product.get('designation') or '')[:50]}",
+        'value': product['idsupplierproduct'],
+    }
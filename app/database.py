@@ -1,33 +1,70 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
+import threading
 from contextlib import contextmanager
 
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import NullPool
+
 from app.config import config
+from app.tracing import instrument_engine
+
+# Engine and session factory, created on first use so importing the app does
+# not connect to MySQL (see _init())
+_db = {'engine': None, 'session_factory': None, 'kill_engine': None}
+_init_lock = threading.Lock()
+
+
+def _init() -> None:
+    """Create the engine and initialize Core's database, once."""
+    with _init_lock:
+        if _db['engine'] is not None:
+            return
+        # Core's Base carries all models; importing it is part of the deferred cost
+        import analysercomptacore.database as core_db
 
-# Import Base from Core - all models use this Base
-from analysercomptacore.database import Base
-import analysercomptacore.database as core_db
+        # Create engine with connection pooling
+        engine = create_engine(
+            config.get_connection_string(),
+            pool_pre_ping=True,
+            pool_recycle=3600,
+            echo=False
+        )
+        # SQL statements run inside a trace become spans
+        instrument_engine(engine)
+        # KILL QUERY runs on its own short-lived connection: with the pool exhausted
+        # by the very queries being killed, it would otherwise wait for one of them
+        _db['kill_engine'] = create_engine(config.get_connection_string(), poolclass=NullPool, echo=False)
+        # Initialize Core database with same connection string
+        core_db.init_database(config.get_connection_string())
+        _db['session_factory'] = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        _db['engine'] = engine
 
 
-# Create engine with connection pooling
-engine = create_engine(
-    config.get_connection_string(),
-    pool_pre_ping=True,
-    pool_recycle=3600,
-    echo=False
-)
+def get_engine():
+    """Get the SQLAlchemy engine, creating it on first use."""
+    if _db['engine'] is None:
+        _init()
+    return _db['engine']
 
-# Session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Initialize Core database with same connection string
-core_db.init_database(config.get_connection_string())
+def __getattr__(name: str):
+    # Module attributes of the former eager setup
+    if name == 'engine':
+        return get_engine()
+    if name == 'SessionLocal':
+        get_engine()
+        return _db['session_factory']
+    if name == 'Base':
+        from analysercomptacore.database import Base
+        return Base
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 @contextmanager
 def get_db() -> Session:
     """Context manager for database sessions."""
-    db = SessionLocal()
+    get_engine()
+    db = _db['session_factory']()
     try:
         yield db
         db.commit()
@@ -40,4 +77,22 @@ def get_db() -> Session:
 
 def get_session() -> Session:
     """Get a new database session."""
-    return SessionLocal()
+    get_engine()
+    return _db['session_factory']()
+
+
+def get_connection_id(db: Session) -> int:
+    """Get the MySQL connection ID of the connection a session is bound to."""
+    return db.execute(text('SELECT CONNECTION_ID()')).scalar()
+
+
+def kill_query(connection_id: int) -> None:
+    """Abort the statement currently running on another MySQL connection.
+
+    The connection itself stays open and returns to its pool; only the
+    running statement fails with "Query execution was interrupted". The KILL
+    is sent on a dedicated connection, outside the pool.
+    """
+    get_engine()
+    with _db['kill_engine'].connect() as conn:
+        conn.execute(text(f'KILL QUERY {int(connection_id)}'))
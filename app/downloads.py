@@ -0,0 +1,85 @@
+"""File download endpoints, streamed in chunks so large exports never sit in memory."""
+from datetime import date, datetime
+from typing import Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from nicegui import app
+
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+TRANSACTIONS_EXPORT_PATH = '/transactions/export'
+FEC_EXPORT_PATH = '/fec/export'
+
+
+def register_download_routes() -> None:
+    """Add the download endpoints."""
+    app.get(TRANSACTIONS_EXPORT_PATH)(export_transactions)
+    app.get(FEC_EXPORT_PATH)(export_fec)
+
+
+def export_transactions(
+    format: str = 'csv',
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    libelle: Optional[str] = None,
+    montant: Optional[float] = None,
+    filename: Optional[str] = None,
+):
+    """Every bank transaction matching the View Transactions filters, as CSV or XLSX."""
+    from app.services import BankInstructionService
+    from app.services.bank_instruction_service import EXPORT_COLUMNS
+    from app.services.tabular_export import csv_chunks, xlsx_chunks, CSV_MEDIA_TYPE, XLSX_MEDIA_TYPE
+
+    if format not in ('csv', 'xlsx'):
+        raise HTTPException(status_code=400, detail='format must be csv or xlsx')
+    start, end = _parse_date(date_from), _parse_date(date_to)
+
+    rows = BankInstructionService.iter_export(start, end, libelle or None, montant, filename or None)
+    if format == 'csv':
+        chunks, media_type = csv_chunks(EXPORT_COLUMNS, rows), CSV_MEDIA_TYPE
+    else:
+        chunks, media_type = xlsx_chunks(EXPORT_COLUMNS, rows, sheet_name='Transactions'), XLSX_MEDIA_TYPE
+
+    name = f"transactions_{start or 'start'}_{end or 'end'}.{format}"
+    logger.info(f"Exporting transactions as {name}")
+    # Starlette iterates a plain generator in its thread pool: the event loop is never blocked
+    return StreamingResponse(chunks, media_type=media_type,
+                             headers={'Content-Disposition': f'attachment; filename="{name}"'})
+
+
+def export_fec(year: int):
+    """FEC of the fiscal year starting in `year`, for the accountant.
+
+    Factures whose HT + TVA is too far from TTC are listed with a 422
+    before anything is sent. Entries are still checked to balance while the
+    file is written: if one does not, the download is aborted rather than
+    completed with an invalid FEC.
+    """
+    from app.services import FecService
+    from app.services.fec_service import FEC_MEDIA_TYPE
+
+    if not 2000 <= year <= date.today().year:
+        raise HTTPException(status_code=400, detail=f'Invalid fiscal year: {year}')
+    unbalanced = FecService.unbalanced_factures(year)
+    if unbalanced:
+        raise HTTPException(status_code=422, detail={
+            'message': f'{len(unbalanced)} facture(s) where HT + TVA differs from TTC must be corrected first',
+            'factures': unbalanced,
+        })
+
+    name = FecService.filename(year)
+    logger.info(f"Exporting FEC {name}")
+    return StreamingResponse(FecService.chunks(year), media_type=FEC_MEDIA_TYPE,
+                             headers={'Content-Disposition': f'attachment; filename="{name}"'})
+
+
+def _parse_date(value: Optional[str]) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f'Invalid date: {value}')
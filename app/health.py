@@ -0,0 +1,97 @@
+"""Liveness (/healthz) and readiness (/readyz) endpoints for the orchestrator."""
+import asyncio
+import os
+import threading
+import time
+
+from fastapi.responses import JSONResponse
+from nicegui import app, background_tasks
+
+from app.logging_config import get_logger
+from app.warmup import Warmup
+
+logger = get_logger(__name__)
+
+# Readiness thresholds - configurable via environment variables
+READY_POOL_CHECKOUT_MS = float(os.environ.get('READY_POOL_CHECKOUT_MS', '200'))
+READY_LOOP_LAG_MS = float(os.environ.get('READY_LOOP_LAG_MS', '500'))
+# Event loop lag sampling period
+LAG_INTERVAL = 0.5  # seconds
+# Pool probe results are reused this long, so frequent polling adds no database load
+PROBE_TTL = 2.0  # seconds
+
+_loop_lag = {'ms': 0.0, 'sampled_at': None}
+_pool_probe = {'ms': None, 'error': None, 'probed_at': 0.0}
+_probe_lock = threading.Lock()
+
+
+def register_health_routes() -> None:
+    """Add /healthz and /readyz, and start the event loop lag monitor with the server."""
+    app.get('/healthz')(healthz)
+    app.get('/readyz')(readyz)
+    app.on_startup(lambda: background_tasks.create(_monitor_loop_lag(), name='loop-lag'))
+
+
+async def healthz():
+    """Process alive: answered by the event loop without touching any dependency."""
+    return {'status': 'ok'}
+
+
+def readyz():
+    """Ready to serve: warm-up done, pool checkout and event loop lag under their thresholds.
+
+    Superset is reported but does not make the app unready: pages work
+    without it (the dashboard shows its KPIs and an error for the embed).
+    Runs in FastAPI's thread pool, so a slow checkout does not block the loop.
+    """
+    from app.services.superset_service import SupersetService
+
+    pool_ms, pool_error = _probe_pool()
+    lag_ms = _loop_lag['ms']
+    checks = {
+        'warmup': {'ok': Warmup.is_ready(), 'state': Warmup.status()['state']},
+        'pool': {
+            'ok': pool_error is None and pool_ms <= READY_POOL_CHECKOUT_MS,
+            'checkout_ms': None if pool_ms is None else round(pool_ms, 1),
+            'threshold_ms': READY_POOL_CHECKOUT_MS,
+            'error': pool_error,
+        },
+        'event_loop': {
+            'ok': _loop_lag['sampled_at'] is not None and lag_ms <= READY_LOOP_LAG_MS,
+            'lag_ms': round(lag_ms, 1),
+            'threshold_ms': READY_LOOP_LAG_MS,
+        },
+        'superset': {'breaker': SupersetService.breaker_state()},
+    }
+    ready = all(check.get('ok', True) for check in checks.values())
+    return JSONResponse({'status': 'ready' if ready else 'not ready', 'checks': checks},
+                        status_code=200 if ready else 503)
+
+
+def _probe_pool() -> tuple[float | None, str | None]:
+    """Time to check a connection out of the pool (pre-ping included), in ms."""
+    from app.database import get_engine
+
+    with _probe_lock:
+        if time.monotonic() - _pool_probe['probed_at'] < PROBE_TTL:
+            return _pool_probe['ms'], _pool_probe['error']
+        started = time.perf_counter()
+        try:
+            with get_engine().connect():
+                pass
+            _pool_probe['ms'], _pool_probe['error'] = (time.perf_counter() - started) * 1000, None
+        except Exception as e:
+            logger.error(f"Readiness pool probe failed: {e}")
+            _pool_probe['ms'], _pool_probe['error'] = None, str(e)
+        _pool_probe['probed_at'] = time.monotonic()
+        return _pool_probe['ms'], _pool_probe['error']
+
+
+async def _monitor_loop_lag() -> None:
+    """Measure how late the event loop wakes up from a fixed sleep."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        _loop_lag['ms'] = max(0.0, (loop.time() - started - LAG_INTERVAL) * 1000)
+        _loop_lag['sampled_at'] = time.time()
@@ -1,57 +1,203 @@
 """Logging configuration for AnalyzerComptaWeb."""
 
+import atexit
+import copy
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
+import queue
+import threading
+import time
 
 # Log file - configurable via environment variable
 LOG_FILE = os.environ.get('LOG_PATH', 'analyzercompta.log')
-LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s'
 LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# One JSON object per line instead of LOG_FORMAT
+LOG_JSON = os.environ.get('LOG_JSON', '0') == '1'
+# Per-logger sampling, "logger=count/seconds,...": at most `count` records with the
+# same message per `seconds` (connection reset tracebacks from asyncio flood the log)
+LOG_SAMPLING = os.environ.get('LOG_SAMPLING', 'asyncio=5/60')
 
 # Rollover settings
 MAX_BYTES = 5 * 1024 * 1024  # 5 MB
 BACKUP_COUNT = 3  # Keep 3 backup files
 
+_listener: QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, LOG_DATE_FORMAT),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        if getattr(record, 'span_id', None):
+            entry['trace_id'] = record.trace_id
+            entry['span_id'] = record.span_id
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    """Queue handler that keeps the traceback apart from the message.
+
+    The default one merges them into the message, so the JSON output could
+    not report the exception separately.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class TraceContextFilter(logging.Filter):
+    """Stamp records with the trace and span IDs of the code that logged them."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Imported here: app.tracing logs through this module
+        from app.tracing import current_ids
+        trace_id, span_id = current_ids()
+        record.trace_id = trace_id or '-'
+        record.span_id = span_id
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Let through at most `count` records per message and `seconds` for the configured loggers.
+
+    Records are grouped by logger and message template; when a window ends
+    with records dropped, the next record that passes says how many.
+    """
+
+    def __init__(self, rules: dict[str, tuple[int, float]]):
+        super().__init__()
+        self.rules = rules
+        self._windows: dict[tuple[str, str], list] = {}  # key -> [window start, passed, dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rule = self._rule(record.name)
+        if rule is None:
+            return True
+        count, seconds = rule
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= seconds:
+                dropped = window[2] if window else 0
+                self._windows[key] = window = [now, 0, 0]
+                if dropped:
+                    record.msg = f'{record.msg} ({dropped} similar message(s) suppressed)'
+            if window[1] >= count:
+                window[2] += 1
+                return False
+            window[1] += 1
+            return True
+
+    def _rule(self, name: str) -> tuple[int, float] | None:
+        while name:
+            if name in self.rules:
+                return self.rules[name]
+            name = name.rpartition('.')[0]
+        return None
+
+
+def parse_sampling(spec: str) -> dict[str, tuple[int, float]]:
+    """Parse "logger=count/seconds,..." sampling rules (invalid entries are ignored)."""
+    rules = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        try:
+            name, limit = item.split('=', 1)
+            count, seconds = limit.split('/', 1)
+            rules[name.strip()] = (int(count), float(seconds))
+        except ValueError:
+            logging.getLogger(__name__).warning("Ignoring invalid LOG_SAMPLING entry: %s", item)
+    return rules
+
 
 def setup_logging(level=logging.INFO):
     """
-    Setup logging with rotating file handler.
+    Setup logging through a queue drained by a background writer thread.
+
+    Log calls only enqueue the record; file writes, rollovers and console
+    output happen in the listener thread, so they never delay the event loop.
 
     Args:
         level: Logging level (default INFO)
     """
+    global _listener
+
     # Create root logger
     root_logger = logging.getLogger()
     root_logger.setLevel(level)
 
     # Clear any existing handlers
     root_logger.handlers.clear()
+    if _listener is not None:
+        _listener.stop()
+    else:
+        # Flush what is still queued on exit
+        atexit.register(_stop_listener)
 
     # Create formatter
-    formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
-
-    # Rotating file handler
+    formatter = JsonFormatter() if LOG_JSON else logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+
+    # Rotating file handler (one file per worker: rollover renames are not safe across processes)
+    log_file = LOG_FILE
+    worker_port = os.environ.get('WEB_WORKER_PORT')
+    if worker_port:
+        base, ext = os.path.splitext(LOG_FILE)
+        log_file = f'{base}.{worker_port}{ext}'
     file_handler = RotatingFileHandler(
-        LOG_FILE,
+        log_file,
         maxBytes=MAX_BYTES,
         backupCount=BACKUP_COUNT,
         encoding='utf-8'
     )
     file_handler.setLevel(level)
     file_handler.setFormatter(formatter)
-    root_logger.addHandler(file_handler)
 
     # Console handler (for development)
     console_handler = logging.StreamHandler()
     console_handler.setLevel(level)
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
+
+    # Callers only put records on the queue; the listener thread writes them
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sampling(LOG_SAMPLING)))
+    # Runs in the caller's thread, where the current span is known
+    queue_handler.addFilter(TraceContextFilter())
+    root_logger.addHandler(queue_handler)
+    _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
 
     # Suppress noisy asyncio logs on Windows
     logging.getLogger('asyncio').setLevel(logging.WARNING)
 
-    logging.info("Logging initialized - file: %s", os.path.abspath(LOG_FILE))
+    logging.info("Logging initialized - file: %s", os.path.abspath(log_file))
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
 
 
 def get_logger(name: str) -> logging.Logger:
@@ -1,13 +1,55 @@
-from app.pages.dashboard import dashboard_page
-from app.pages.suppliers import suppliers_page
-from app.pages.products import products_page
-from app.pages.factures import factures_page
-from app.pages.review import review_page
-from app.pages.transactions import transactions_page
-from app.pages.explore_transactions import explore_transactions_page
-from app.pages.explore_sales import explore_sales_page
+import importlib
+
+from nicegui import ui
+
+from app.tracing import span
+
+# Route -> (module, page function). Modules are imported on the first visit
+# of their page, so the server starts without loading every page and service.
+PAGES = {
+    '/': ('app.pages.dashboard', 'dashboard_page'),
+    '/suppliers': ('app.pages.suppliers', 'suppliers_page'),
+    '/products': ('app.pages.products', 'products_page'),
+    '/factures': ('app.pages.factures', 'factures_page'),
+    '/review': ('app.pages.review', 'review_page'),
+    '/transactions': ('app.pages.transactions', 'transactions_page'),
+    '/transactions/explore': ('app.pages.explore_transactions', 'explore_transactions_page'),
+    '/sales/explore': ('app.pages.explore_sales', 'explore_sales_page'),
+}
+
+
+def register_pages() -> None:
+    """Register every page route."""
+    for path, (module, name) in PAGES.items():
+        ui.page(path)(_lazy_page(path, module, name))
+
+
+def import_pages() -> None:
+    """Import every page module now (to warm up instead of on first visit)."""
+    for module, _ in PAGES.values():
+        importlib.import_module(module)
+
+
+def _lazy_page(path: str, module: str, name: str):
+    def page():
+        with span(f'page {path}'):
+            return getattr(importlib.import_module(module), name)()
+    page.__name__ = name
+    return page
+
+
+def __getattr__(name: str):
+    # Page functions stay importable from here, loading their module on access
+    for module, page_name in PAGES.values():
+        if page_name == name:
+            return getattr(importlib.import_module(module), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
+    'PAGES',
+    'register_pages',
+    'import_pages',
     'dashboard_page',
     'suppliers_page',
     'products_page',
@@ -1,6 +1,7 @@
-from nicegui import ui
+from nicegui import ui, run
 from app.components.layout import layout
-from app.services import SupersetService
+from app.tracing import traced, bind
+from app.services import SupersetService, KpiService
 from app.logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -10,9 +11,8 @@ SUPERSET_URL = 'http://localhost:8088'
 SUPERSET_DASHBOARD_SLUG = 'monthlydash'
 
 
-@ui.page('/')
 def dashboard_page():
-    """Dashboard page with embedded Superset dashboard."""
+    """Dashboard page with native KPIs and the embedded Superset dashboard."""
 
     def get_superset_embed_config() -> dict | None:
         """Get Superset embedding configuration with guest token."""
@@ -33,7 +33,40 @@ def dashboard_page():
             logger.error(f'Failed to get Superset embed config: {e}')
             return None
 
+    @traced()
+    async def load_kpis():
+        try:
+            data = await run.io_bound(bind(KpiService.get_dashboard))
+        except Exception as e:
+            logger.error(f'Failed to compute dashboard KPIs: {e}')
+            kpi_container.clear()
+            with kpi_container:
+                ui.label('KPIs unavailable. Check the database connection.').classes('text-red-500')
+            return
+        _render_kpis(kpi_container, data)
+
+    @traced()
+    async def mount_superset():
+        # Token requests go to Superset over HTTP: keep them off the event loop
+        embed_config = await run.io_bound(bind(get_superset_embed_config))
+        if embed_config:
+            embed_superset(embed_config)
+        else:
+            with embed_container:
+                ui.label('Failed to load dashboard. Check Superset connection.').classes(
+                    'text-red-500 p-4'
+                )
+
     with layout('Dashboard'):
+        # Native KPIs from cached rollups: fast, and shown even when Superset is down
+        kpi_container = ui.column().classes('w-full gap-4 mb-4')
+        if KpiService.is_warm():
+            _render_kpis(kpi_container, KpiService.get_dashboard())
+        else:
+            with kpi_container:
+                ui.spinner(size='lg')
+            ui.timer(0, load_kpis, once=True)
+
         # Embedded Superset Dashboard
         with ui.card().classes('w-full h-full').style('min-height: calc(100vh - 180px)'):
             with ui.row().classes('w-full items-center justify-between mb-2'):
@@ -49,19 +82,15 @@ def dashboard_page():
                 'w-full rounded-lg bg-gray-100'
             ).style('height: calc(100vh - 230px); min-height: 400px')
 
-            # Get embed config
-            embed_config = get_superset_embed_config()
+            # Load Superset Embedded SDK from jsdelivr
+            ui.add_head_html('''
+                <script src="https://cdn.jsdelivr.net/npm/@superset-ui/embedded-sdk@0.1.0-alpha.10/bundle/index.min.js"></script>
+            ''')
 
-            if embed_config:
-                # Load Superset Embedded SDK from jsdelivr
-                ui.add_head_html('''
-                    <script src="https://cdn.jsdelivr.net/npm/@superset-ui/embedded-sdk@0.1.0-alpha.10/bundle/index.min.js"></script>
-                ''')
-
-                # Container for the embedded dashboard
-                with embed_container:
-                    pass  # SDK will mount here
+            # Embed once the page is shown, instead of delaying the whole page on Superset
+            ui.timer(0, mount_superset, once=True)
 
+            def embed_superset(embed_config):
                 ui.run_javascript(f'''
                     (async function() {{
                         // Wait for SDK and container
@@ -105,8 +134,89 @@ def dashboard_page():
                         }}
                     }})();
                 ''')
-            else:
-                with embed_container:
-                    ui.label('Failed to load dashboard. Check Superset connection.').classes(
-                        'text-red-500 p-4'
-                    )
+
+
+def _render_kpis(container, data: dict):
+    """Render the KPI cards: bank flows, sales, pending staging and recent factures."""
+    bank, sales = data['bank'], data['sales']
+    month_label = data['month'].strftime('%B %Y')
+    previous_label = data['previous_month'].strftime('%B %Y')
+
+    container.clear()
+    with container:
+        with ui.row().classes('w-full gap-4'):
+            _kpi_card('Bank inflow', bank['current']['total_in'], bank['previous']['total_in'], 'south_west', 'green')
+            _kpi_card('Bank outflow', bank['current']['total_out'], bank['previous']['total_out'], 'north_east', 'red')
+            _kpi_card('Sales', sales['current']['total'], sales['previous']['total'], 'point_of_sale', 'blue')
+            with ui.card().classes('flex-1 min-w-[180px] cursor-pointer').on('click', lambda: ui.navigate.to('/review')):
+                with ui.row().classes('items-center gap-2'):
+                    ui.icon('rate_review', color='amber').classes('text-2xl')
+                    ui.label('Pending staging').classes('text-sm text-gray-500')
+                ui.label(str(data['pending_staging'])).classes('text-2xl font-bold')
+
+        with ui.row().classes('w-full gap-4 items-stretch'):
+            with ui.card().classes('flex-1 min-w-[300px]'):
+                ui.label(f'Bank by category - {month_label} vs {previous_label}').classes('font-semibold mb-2')
+                rows = []
+                for kind in ('IN', 'OUT'):
+                    names = set(bank['current'][kind]) | set(bank['previous'][kind])
+                    rows += [{
+                        'key': f'{kind}-{name}',
+                        'type': kind,
+                        'name': name,
+                        'current': round(bank['current'][kind].get(name, 0.0), 2),
+                        'previous': round(bank['previous'][kind].get(name, 0.0), 2),
+                    } for name in sorted(names)]
+                ui.table(
+                    columns=[
+                        {'name': 'type', 'label': 'Type', 'field': 'type', 'align': 'center'},
+                        {'name': 'name', 'label': 'Category', 'field': 'name', 'align': 'left'},
+                        {'name': 'current', 'label': month_label, 'field': 'current', 'align': 'right'},
+                        {'name': 'previous', 'label': previous_label, 'field': 'previous', 'align': 'right'},
+                    ],
+                    rows=rows,
+                    row_key='key',
+                    pagination=8,
+                ).classes('w-full').props('dense flat')
+
+            with ui.card().classes('min-w-[260px]'):
+                ui.label('Sales by payment type').classes('font-semibold mb-2')
+                ui.table(
+                    columns=[
+                        {'name': 'type', 'label': 'Type', 'field': 'type', 'align': 'left'},
+                        {'name': 'current', 'label': month_label, 'field': 'current', 'align': 'right'},
+                        {'name': 'previous', 'label': previous_label, 'field': 'previous', 'align': 'right'},
+                    ],
+                    rows=[{
+                        'type': payment_type,
+                        'current': round(sales['current'][payment_type], 2),
+                        'previous': round(sales['previous'][payment_type], 2),
+                    } for payment_type in KpiService.payment_types()],
+                    row_key='type',
+                ).classes('w-full').props('dense flat hide-bottom')
+
+            with ui.card().classes('min-w-[300px]'):
+                ui.label('Recent factures').classes('font-semibold mb-2')
+                for facture in data['recent_factures']:
+                    with ui.row().classes('w-full justify-between gap-4'):
+                        ui.label(f"{facture.get('factNum') or '-'} - {facture.get('supplier_name') or ''}").classes('text-sm')
+                        ui.label(f"{float(facture.get('factmontantttc') or 0):,.2f}").classes('text-sm font-medium')
+                if not data['recent_factures']:
+                    ui.label('No factures yet').classes('text-sm text-gray-500')
+                ui.link('All factures', '/factures').classes('text-sm text-blue-600 mt-2')
+
+
+def _kpi_card(label: str, current: float, previous: float, icon: str, color: str):
+    """Card with this month's value and the change from the previous month."""
+    with ui.card().classes('flex-1 min-w-[180px]'):
+        with ui.row().classes('items-center gap-2'):
+            ui.icon(icon, color=color).classes('text-2xl')
+            ui.label(label).classes('text-sm text-gray-500')
+        ui.label(f'{current:,.2f} EUR').classes('text-2xl font-bold')
+        if previous:
+            change = (current - previous) / abs(previous) * 100
+            ui.label(f'{change:+.1f}% vs previous month ({previous:,.2f})').classes(
+                'text-xs ' + ('text-green-600' if change >= 0 else 'text-red-600')
+            )
+        else:
+            ui.label('No data for previous month').classes('text-xs text-gray-500')
@@ -2,10 +2,10 @@ from nicegui import ui
 from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 from app.components.layout import layout
+from app.tracing import traced
 from app.services import SalesService
 
 
-@ui.page('/sales/explore')
 def explore_sales_page():
     """Explore Sales page - interactive exploration with payments and product summary."""
 
@@ -47,6 +47,7 @@ def explore_sales_page():
                 refs['selection_label'].set_text('Showing all products for period')
                 refs['selection_label'].classes(remove='text-blue-600 font-semibold', add='text-gray-500')
 
+    @traced()
     def load_data():
         """Load data for selected date range."""
         date_from = state['date_from']
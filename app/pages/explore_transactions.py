@@ -2,10 +2,10 @@ from nicegui import ui
 from datetime import date
 from dateutil.relativedelta import relativedelta
 from app.components.layout import layout
+from app.tracing import traced
 from app.services import BankInstructionService
 
 
-@ui.page('/transactions/explore')
 def explore_transactions_page():
     """Explore Transactions page - interactive exploration with summary and details."""
 
@@ -70,6 +70,7 @@ def explore_transactions_page():
                 refs['selection_label'].set_text('Showing all transactions')
                 refs['selection_label'].classes(remove='text-blue-600 font-semibold', add='text-gray-500')
 
+    @traced()
     def load_data():
         """Load data for selected month/year."""
         month = state['month']
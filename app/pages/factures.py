@@ -1,19 +1,21 @@
-from nicegui import ui
+from nicegui import ui, run
 from datetime import datetime
 from app.components.layout import layout
-from app.services import FactureService, SupplierService, ProductService
-from app.database import get_db
-from app.models import SupplierFacture, SupplierFactItem
+from app.tracing import traced, bind
+from app.components.product_picker import ProductPicker, ProductOptions
+from app.services import FactureService, SupplierService, FecService
+from app.downloads import FEC_EXPORT_PATH
 
 
-@ui.page('/factures')
 def factures_page():
     """Factures (invoices) management page."""
 
     # State
     factures_data = []
     table_ref = {'table': None}
-    filters = {'supplier': None, 'date_from': None, 'date_to': None}
+    filters = {'supplier': None, 'date_from': None, 'date_to': None, 'number': None}
+    pagination = {'page': 1, 'rowsPerPage': 20, 'sortBy': 'factDate', 'descending': True, 'rowsNumber': 0}
+    totals_label_ref = {'label': None}
     current_facture = {'data': None}
 
     # Get supplier filter from URL if present
@@ -37,28 +39,49 @@ def factures_page():
     }
     form_items = []  # List of line item widgets
     items_container = None
-    products_by_supplier = {}
+    # One options source per dialog, shared by all of its line item rows
+    create_product_options = ProductOptions()
+    edit_product_options = ProductOptions()
 
+    @traced()
     def load_factures():
+        """Load the current page of factures; filtering, sorting and paging happen in the database."""
         nonlocal factures_data
-        factures_data = FactureService.get_all(
+        rows_per_page = pagination['rowsPerPage'] or 20
+        page = FactureService.get_page(
             supplier_id=filters['supplier'],
             date_from=filters['date_from'],
-            date_to=filters['date_to']
+            date_to=filters['date_to'],
+            number_prefix=filters['number'],
+            sort_by=pagination['sortBy'] or 'factDate',
+            descending=bool(pagination['descending']),
+            offset=(pagination['page'] - 1) * rows_per_page,
+            limit=rows_per_page
         )
+        factures_data = page['rows']
+        pagination['rowsNumber'] = page['total']
         if table_ref['table']:
+            table_ref['table'].pagination = dict(pagination)
             table_ref['table'].update_rows(factures_data)
+        if totals_label_ref['label']:
+            totals = page['totals']
+            totals_label_ref['label'].set_text(
+                f"{page['total']} facture(s) - HT: {totals['ht']:,.2f} | TVA: {totals['tva']:,.2f} | TTC: {totals['ttc']:,.2f} EUR"
+            )
+
+    def on_table_request(e):
+        """Page, page size or sort changed in the table."""
+        requested = e.args['pagination']
+        pagination.update({k: requested.get(k, pagination[k]) for k in ('page', 'rowsPerPage', 'sortBy', 'descending')})
+        load_factures()
 
-    def load_products_for_supplier(supplier_id):
-        """Load products for the selected supplier."""
-        if supplier_id:
-            products = ProductService.get_all(supplier_id=supplier_id)
-            products_by_supplier[supplier_id] = {p['idsupplierproduct']: f"{p['code']} - {p['designation'][:50]}" for p in products}
-            return products_by_supplier[supplier_id]
-        return {}
+    def reload_first_page():
+        pagination['page'] = 1
+        load_factures()
 
+    @traced()
     def show_facture_detail(facture_id):
-        facture = FactureService.get_by_id(facture_id)
+        facture = FactureService.get_detail(facture_id)
         if facture:
             current_facture['data'] = facture
             detail_container.clear()
@@ -72,15 +95,19 @@ def factures_page():
 
     def on_supplier_filter(value):
         filters['supplier'] = value
-        load_factures()
+        reload_first_page()
 
     def on_date_from_filter(value):
         filters['date_from'] = datetime.strptime(value, '%Y-%m-%d') if value else None
-        load_factures()
+        reload_first_page()
 
     def on_date_to_filter(value):
         filters['date_to'] = datetime.strptime(value, '%Y-%m-%d') if value else None
-        load_factures()
+        reload_first_page()
+
+    def on_number_filter(value):
+        filters['number'] = value.strip() if value else None
+        reload_first_page()
 
     def open_create_dialog():
         # Reset form
@@ -111,7 +138,7 @@ def factures_page():
             return
 
         # Load full facture with items
-        facture = FactureService.get_by_id(current_facture['data']['idFacture'])
+        facture = FactureService.get_detail(current_facture['data']['idFacture'])
         if not facture:
             ui.notify('Facture not found', type='negative')
             return
@@ -132,8 +159,8 @@ def factures_page():
         edit_ttc_input.value = facture['factmontantttc']
         edit_filename_input.value = facture['filename'] or ''
 
-        # Load products for this supplier
-        load_products_for_supplier(facture['idsupplier'])
+        # Product pickers search this supplier's catalog
+        edit_product_options.set_supplier(facture['idsupplier'])
 
         # Populate items
         edit_items_container.clear()
@@ -145,7 +172,7 @@ def factures_page():
 
     def on_create_supplier_change(supplier_id):
         form_data['idsupplier'] = supplier_id
-        load_products_for_supplier(supplier_id)
+        create_product_options.set_supplier(supplier_id)
         # Clear items when supplier changes
         create_items_container.clear()
         form_items.clear()
@@ -159,14 +186,13 @@ def factures_page():
 
     def _add_item_row_create(supplier_id):
         """Add a new item row in create dialog."""
-        products = products_by_supplier.get(supplier_id, {})
         item_data = {'product_id': None, 'quantity': 1, 'unitprice': 0, 'itemprice': 0}
 
         with ui.row().classes('w-full items-end gap-2 p-2 bg-gray-50 dark:bg-gray-800 rounded') as row:
-            product_select = ui.select(
+            product_select = ProductPicker(
+                create_product_options,
                 label='Product',
-                options=products,
-                on_change=lambda e: _on_product_select_create(e.value, item_data, unitprice_input, supplier_id)
+                on_change=lambda value: _on_product_select(value, item_data, unitprice_input, create_product_options)
             ).classes('flex-1 min-w-[200px]')
 
             quantity_input = ui.number(
@@ -198,7 +224,6 @@ def factures_page():
 
     def _add_item_row_edit(item, supplier_id):
         """Add an existing item row in edit dialog."""
-        products = products_by_supplier.get(supplier_id, {})
         item_data = {
             'id': item.get('idsupplierfactitem'),
             'product_id': item.get('idsupplierproduct'),
@@ -208,11 +233,11 @@ def factures_page():
         }
 
         with ui.row().classes('w-full items-end gap-2 p-2 bg-gray-50 dark:bg-gray-800 rounded') as row:
-            product_select = ui.select(
+            product_select = ProductPicker(
+                edit_product_options,
                 label='Product',
-                options=products,
                 value=item.get('idsupplierproduct'),
-                on_change=lambda e: _on_product_select_create(e.value, item_data, unitprice_input, supplier_id)
+                on_change=lambda value: _on_product_select(value, item_data, unitprice_input, edit_product_options)
             ).classes('flex-1 min-w-[200px]')
 
             quantity_input = ui.number(
@@ -242,14 +267,13 @@ def factures_page():
             item_data['itemprice_input'] = itemprice_input
             form_items.append(item_data)
 
-    def _on_product_select_create(product_id, item_data, unitprice_input, supplier_id):
+    def _on_product_select(product_id, item_data, unitprice_input, product_options):
         item_data['product_id'] = product_id
-        # Get product unit price
-        if product_id:
-            product = ProductService.get_by_id(product_id)
-            if product:
-                item_data['unitprice'] = product['unitprice']
-                unitprice_input.value = product['unitprice']
+        # Unit price from the dialog's shared price map, no DB round trip
+        unitprice = product_options.price(product_id)
+        if unitprice is not None:
+            item_data['unitprice'] = unitprice
+            unitprice_input.value = unitprice
 
     def _on_unitprice_change(value, item_data, quantity, itemprice_input):
         item_data['unitprice'] = value or 0
@@ -269,6 +293,7 @@ def factures_page():
         row.delete()
         form_items[:] = [i for i in form_items if i.get('row') != row]
 
+    @traced()
     def save_create_facture():
         """Save new facture with items."""
         if not create_supplier_select.value:
@@ -282,32 +307,26 @@ def factures_page():
             return
 
         try:
-            with get_db() as db:
-                # Create facture
-                facture = SupplierFacture(
-                    idsupplier=create_supplier_select.value,
-                    factNum=create_factnum_input.value,
-                    factDate=datetime.strptime(create_factdate_input.value, '%Y-%m-%d') if create_factdate_input.value else None,
-                    factmontantHT=create_ht_input.value or 0,
-                    factmontantTVA=create_tva_input.value or 0,
-                    factmontantttc=create_ttc_input.value or 0,
-                    filename=create_filename_input.value or None
-                )
-                db.add(facture)
-                db.flush()
-
-                # Create items
-                for item in form_items:
-                    if item.get('product_id'):
-                        fact_item = SupplierFactItem(
-                            idsupplier=create_supplier_select.value,
-                            idsupplierfacture=facture.idFacture,
-                            idsupplierproduct=item['product_id'],
-                            quantity=item.get('quantity', 1),
-                            itemPrice=item.get('itemprice', 0),
-                            unitPriceSnap=item.get('unitprice', 0)
-                        )
-                        db.add(fact_item)
+            FactureService.create_facture(
+                create_supplier_select.value,
+                fields={
+                    'factNum': create_factnum_input.value,
+                    'factDate': datetime.strptime(create_factdate_input.value, '%Y-%m-%d') if create_factdate_input.value else None,
+                    'factmontantHT': create_ht_input.value or 0,
+                    'factmontantTVA': create_tva_input.value or 0,
+                    'factmontantttc': create_ttc_input.value or 0,
+                    'filename': create_filename_input.value or None,
+                },
+                items=[
+                    {
+                        'idsupplierproduct': item['product_id'],
+                        'quantity': item.get('quantity', 1),
+                        'itemPrice': item.get('itemprice', 0),
+                        'unitPriceSnap': item.get('unitprice', 0),
+                    }
+                    for item in form_items if item.get('product_id')
+                ],
+            )
 
             ui.notify('Facture created successfully', type='positive')
             create_dialog.close()
@@ -315,6 +334,7 @@ def factures_page():
         except Exception as e:
             ui.notify(f'Error: {e}', type='negative')
 
+    @traced()
     def save_edit_facture():
         """Save edited facture with items."""
         if not form_data.get('id'):
@@ -322,37 +342,30 @@ def factures_page():
             return
 
         try:
-            with get_db() as db:
-                # Update facture
-                facture = db.query(SupplierFacture).filter(
-                    SupplierFacture.idFacture == form_data['id']
-                ).first()
-
-                if facture:
-                    facture.factNum = edit_factnum_input.value
-                    facture.factDate = datetime.strptime(edit_factdate_input.value, '%Y-%m-%d') if edit_factdate_input.value else None
-                    facture.factmontantHT = edit_ht_input.value or 0
-                    facture.factmontantTVA = edit_tva_input.value or 0
-                    facture.factmontantttc = edit_ttc_input.value or 0
-                    facture.filename = edit_filename_input.value or None
-
-                    # Delete existing items
-                    db.query(SupplierFactItem).filter(
-                        SupplierFactItem.idsupplierfacture == form_data['id']
-                    ).delete()
-
-                    # Create new items
-                    for item in form_items:
-                        if item.get('product_id'):
-                            fact_item = SupplierFactItem(
-                                idsupplier=facture.idsupplier,
-                                idsupplierfacture=facture.idFacture,
-                                idsupplierproduct=item['product_id'],
-                                quantity=item.get('quantity', 1),
-                                itemPrice=item.get('itemprice', 0),
-                                unitPriceSnap=item.get('unitprice', 0)
-                            )
-                            db.add(fact_item)
+            result = FactureService.update_facture(
+                form_data['id'],
+                fields={
+                    'factNum': edit_factnum_input.value,
+                    'factDate': datetime.strptime(edit_factdate_input.value, '%Y-%m-%d') if edit_factdate_input.value else None,
+                    'factmontantHT': edit_ht_input.value or 0,
+                    'factmontantTVA': edit_tva_input.value or 0,
+                    'factmontantttc': edit_ttc_input.value or 0,
+                    'filename': edit_filename_input.value or None,
+                },
+                items=[
+                    {
+                        'idsupplierfactitem': item.get('id'),
+                        'idsupplierproduct': item['product_id'],
+                        'quantity': item.get('quantity', 1),
+                        'itemPrice': item.get('itemprice', 0),
+                        'unitPriceSnap': item.get('unitprice', 0),
+                    }
+                    for item in form_items if item.get('product_id')
+                ],
+            )
+            if result is None:
+                ui.notify('Facture not found', type='negative')
+                return
 
             ui.notify('Facture updated successfully', type='positive')
             edit_dialog.close()
@@ -360,6 +373,18 @@ def factures_page():
         except Exception as e:
             ui.notify(f'Error: {e}', type='negative')
 
+    @traced()
+    async def export_fec(year):
+        # Factures that would unbalance the FEC are listed here rather than failing the download
+        unbalanced = await run.io_bound(bind(FecService.unbalanced_factures), year)
+        if unbalanced:
+            shown = ', '.join(f"{f['factNum'] or f['idFacture']} ({f['supplier_name'] or '-'})" for f in unbalanced[:10])
+            more = f' and {len(unbalanced) - 10} more' if len(unbalanced) > 10 else ''
+            ui.notify(f'Cannot export FEC {year}: HT + TVA differs from TTC on {shown}{more}',
+                      type='negative', multi_line=True, timeout=15000)
+            return
+        ui.download.from_url(f'{FEC_EXPORT_PATH}?year={year}')
+
     def calc_totals_create():
         """Calculate totals from items."""
         total_ht = sum(item.get('itemprice', 0) or 0 for item in form_items)
@@ -503,7 +528,13 @@ def factures_page():
                 with date_to.add_slot('append'):
                     ui.icon('edit_calendar').on('click', menu.open).classes('cursor-pointer')
 
-            ui.button('Clear Filters', icon='clear', on_click=lambda: _clear_filters(filters, load_factures)).props('flat')
+            ui.input(
+                label='Invoice #',
+                placeholder='Starts with...',
+                on_change=lambda e: on_number_filter(e.value)
+            ).classes('w-40').props('debounce=300 clearable')
+
+            ui.button('Clear Filters', icon='clear', on_click=lambda: _clear_filters(filters, reload_first_page)).props('flat')
 
         # Action buttons
         with ui.row().classes('w-full gap-2 mb-4'):
@@ -511,15 +542,22 @@ def factures_page():
             ui.button('Edit', icon='edit', on_click=open_edit_dialog).props('flat')
             ui.button('View Details', icon='visibility', on_click=lambda: show_facture_detail(current_facture['data']['idFacture']) if current_facture['data'] else ui.notify('Select a facture', type='warning')).props('flat')
 
+            # FEC for the accountant: purchases, sales and bank journals of a fiscal year
+            with ui.button('Export FEC', icon='download').props('flat'):
+                with ui.menu():
+                    for year in range(datetime.now().year, datetime.now().year - 3, -1):
+                        ui.menu_item(f'Fiscal year {year}',
+                                     on_click=lambda y=year: export_fec(y))
+
         # Table
         columns = [
             {'name': 'idFacture', 'label': 'ID', 'field': 'idFacture', 'align': 'left', 'sortable': True},
             {'name': 'factNum', 'label': 'Invoice #', 'field': 'factNum', 'align': 'left', 'sortable': True},
             {'name': 'supplier_name', 'label': 'Supplier', 'field': 'supplier_name', 'align': 'left', 'sortable': True},
             {'name': 'factDate', 'label': 'Date', 'field': 'factDate', 'align': 'left', 'sortable': True},
-            {'name': 'factmontantHT', 'label': 'HT', 'field': 'factmontantHT', 'align': 'right'},
-            {'name': 'factmontantTVA', 'label': 'TVA', 'field': 'factmontantTVA', 'align': 'right'},
-            {'name': 'factmontantttc', 'label': 'TTC', 'field': 'factmontantttc', 'align': 'right'},
+            {'name': 'factmontantHT', 'label': 'HT', 'field': 'factmontantHT', 'align': 'right', 'sortable': True},
+            {'name': 'factmontantTVA', 'label': 'TVA', 'field': 'factmontantTVA', 'align': 'right', 'sortable': True},
+            {'name': 'factmontantttc', 'label': 'TTC', 'field': 'factmontantttc', 'align': 'right', 'sortable': True},
             {'name': 'filename', 'label': 'File', 'field': 'filename', 'align': 'left'},
         ]
 
@@ -528,9 +566,11 @@ def factures_page():
             rows=[],
             row_key='idFacture',
             selection='single',
-            pagination=20,
+            pagination=dict(pagination),
             on_select=handle_selection
         ).classes('w-full')
+        # Server-side mode: the table asks for pages/sorting instead of doing it client-side
+        table_ref['table'].on('request', on_table_request)
 
         # Clickable supplier name - navigates to supplier page
         table_ref['table'].add_slot('body-cell-supplier_name', '''
@@ -556,7 +596,9 @@ def factures_page():
         table_ref['table'].on('goto-supplier', lambda e: ui.navigate.to(f'/suppliers?highlight={e.args}') if e.args else None)
         table_ref['table'].on('view-detail', lambda e: show_facture_detail(e.args) if e.args else None)
 
-        ui.label('Select a row to edit or view details').classes('text-sm text-gray-500 mt-2')
+        with ui.row().classes('w-full justify-between mt-2'):
+            ui.label('Select a row to edit or view details').classes('text-sm text-gray-500')
+            totals_label_ref['label'] = ui.label('').classes('text-sm font-medium')
 
         # Load initial data
         load_factures()
@@ -618,4 +660,5 @@ def _clear_filters(filters, reload_callback):
     filters['supplier'] = None
     filters['date_from'] = None
     filters['date_to'] = None
+    filters['number'] = None
     reload_callback()
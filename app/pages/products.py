@@ -1,9 +1,9 @@
 from nicegui import ui
 from app.components.layout import layout
+from app.tracing import traced
 from app.services import ProductService, SupplierService
 
 
-@ui.page('/products')
 def products_page():
     """Products management page."""
 
@@ -21,6 +21,7 @@ def products_page():
         except (ValueError, TypeError):
             pass
 
+    @traced()
     def load_products():
         nonlocal products_data
         products_data = ProductService.get_all(
@@ -30,6 +31,7 @@ def products_page():
         if table_ref['table']:
             table_ref['table'].update_rows(products_data)
 
+    @traced()
     def create_product(values):
         try:
             ProductService.create(
@@ -45,6 +47,7 @@ def products_page():
         except Exception as e:
             ui.notify(f'Error: {e}', type='negative')
 
+    @traced()
     def update_product(values):
         if selected_product['id']:
             try:
@@ -62,6 +65,7 @@ def products_page():
             except Exception as e:
                 ui.notify(f'Error: {e}', type='negative')
 
+    @traced()
     def delete_product():
         if selected_product['id']:
             try:
@@ -98,10 +102,10 @@ def products_page():
         # Toolbar
         with ui.row().classes('w-full justify-between items-center mb-4'):
             with ui.row().classes('gap-4'):
-                ui.input(placeholder='Search code or designation...').classes('w-64').on(
-                    'keyup.enter',
-                    lambda e: _search_products(e.sender.value, table_ref)
-                )
+                ui.input(
+                    placeholder='Search code or designation...',
+                    on_change=lambda e: _search_products(e.value, filters, table_ref)
+                ).classes('w-64').props('debounce=200 clearable')
                 ui.select(
                     label='Supplier',
                     options={None: 'All', **supplier_options},
@@ -237,10 +241,10 @@ def _open_edit_dialog(selected, dialog, fields):
         dialog.open()
 
 
-def _search_products(query, table_ref):
+def _search_products(query, filters, table_ref):
     if query:
-        results = ProductService.search(query)
+        results = ProductService.search(query, supplier_id=filters['supplier'], category=filters['category'])
     else:
-        results = ProductService.get_all()
+        results = ProductService.get_all(supplier_id=filters['supplier'], category=filters['category'])
     if table_ref['table']:
         table_ref['table'].update_rows(results)
@@ -1,6 +1,9 @@
-from nicegui import ui
+from nicegui import ui, run, background_tasks
 from app.components.layout import layout
-from app.services import NewProductsService, SupplierService, ProductService
+from app.tracing import traced, bind
+from app.components.product_picker import ProductPicker, ProductOptions
+from app.components.job_progress import job_progress
+from app.services import NewProductsService, SupplierService, ProductMatchService, JobService
 from app.models import NEWPRODUCT_STATUS_CHOICES
 from app.logging_config import get_logger
 
@@ -17,8 +20,20 @@ STATUS_COLORS = {
     'INCOMPLETE': 'pink'
 }
 
+# Statuses that still need a decision, and therefore product suggestions
+UNRESOLVED_STATUSES = {'CREATE PRODUCT', 'IGNORE PRODUCT', 'INCOMPLETE'}
+
+# Staging maintenance operations run as background jobs
+STAGING_JOB_KINDS = ('resolve', 'undo', 'purge')
+
+# How each planned resolve action is shown in the preview
+PLAN_ACTIONS = {
+    'create': 'Create product',
+    'link': 'Link to product',
+    'duplicate': 'Auto-link duplicate',
+}
+
 
-@ui.page('/review')
 def review_page():
     """New Products Review page - core screen for managing staging table with inline editing."""
 
@@ -30,12 +45,14 @@ def review_page():
     temp_id_counter = {'value': -1}  # Negative IDs for unsaved duplicates
     table_ref = {'table': None}
     filters = {'status': None, 'supplier': None, 'facture': None, 'exclude_closed': True}
-    products_cache = {}  # Cache products by supplier for product selector
     save_btn_ref = {'btn': None}
     changes_label_ref = {'label': None}
     save_bar_ref = {'bar': None}
     inconsistent_rows = set()  # Track rows flagged as inconsistent
+    resolve_plan = {'plan': None}  # Plan shown in the resolve preview, executed as-is
+    row_versions = {}  # Version of each row as loaded: {row_id: version}, checked on save
 
+    @traced()
     def load_products():
         nonlocal products_data
         products_data = NewProductsService.get_all(
@@ -44,31 +61,54 @@ def review_page():
             facture_id=filters['facture'],
             exclude_closed=filters['exclude_closed']
         )
+        remember_versions(products_data)
         # Check for product consistency and auto-flag inconsistent rows
         check_and_flag_inconsistent()
+        attach_suggestions(products_data)
         if table_ref['table']:
             table_ref['table'].update_rows(products_data)
         update_stats()
 
+    def remember_versions(rows):
+        """Record the version of freshly loaded rows, keeping it for rows with unsaved edits."""
+        for row in rows:
+            row_id = row['idsuppliernewproducts']
+            if row_id not in modified_rows or row_id not in row_versions:
+                row_versions[row_id] = NewProductsService.row_version(row)
+
+    def attach_suggestions(rows):
+        """Score unresolved rows against existing products and attach the top candidates.
+
+        Scoring runs in a worker thread; the table is refreshed when it is done.
+        """
+        pending = [r for r in rows if r.get('Status') in UNRESOLVED_STATUSES]
+        if pending:
+            background_tasks.create(score_suggestions(rows, pending), name='review-suggestions')
+
+    async def score_suggestions(rows, pending):
+        try:
+            suggestions = await run.io_bound(bind(ProductMatchService.suggest), pending, top_k=3)
+        except Exception as e:
+            logger.error(f"Error computing product suggestions: {e}")
+            return
+        if rows is not products_data:
+            return  # Reloaded meanwhile: that load attaches its own suggestions
+        for row in pending:
+            row['_suggestions'] = suggestions.get(row['idsuppliernewproducts'], [])
+        if table_ref['table']:
+            table_ref['table'].update_rows(products_data)
+
     def check_and_flag_inconsistent():
         """Check for product consistency issues and auto-flag rows."""
         nonlocal products_data
         inconsistent_rows.clear()
 
-        # Get inconsistent records from service
-        inconsistent = NewProductsService.check_product_consistency(
-            facture_id=filters['facture'],
-            supplier_id=filters['supplier'],
-            exclude_closed=filters['exclude_closed']
-        )
+        # Only rows new or changed since the last check hit the database
+        inconsistent_lookup = NewProductsService.find_existing_products(products_data)
 
-        if not inconsistent:
+        if not inconsistent_lookup:
             return
 
-        # Build lookup for quick access
-        inconsistent_lookup = {item['idsuppliernewproducts']: item['existing_product_id']
-                               for item in inconsistent}
-
         flagged_count = 0
         for row in products_data:
             row_id = row['idsuppliernewproducts']
@@ -109,6 +149,7 @@ def review_page():
             facture_id=filters['facture'],
             exclude_closed=filters['exclude_closed']
         )
+        remember_versions(products_data)
         # Add pending duplicates to the display (at the top)
         for dup in pending_duplicates:
             dup['_duplicated'] = True  # Mark as new/unsaved
@@ -152,6 +193,7 @@ def review_page():
         }
         return duplicate
 
+    @traced()
     def duplicate_selected():
         if selected_rows:
             for row in selected_rows:
@@ -161,36 +203,134 @@ def review_page():
             refresh_table_with_pending()
             update_save_button()
 
+    @traced()
     def bulk_change_status(status):
         if selected_rows:
-            ids = [r['idsuppliernewproducts'] for r in selected_rows]
-            NewProductsService.bulk_update_status(ids, status)
-            ui.notify(f"Updated {len(ids)} row(s) to {status}", type='positive')
+            ids = [r['idsuppliernewproducts'] for r in selected_rows if r['idsuppliernewproducts'] > 0]
+            outcome = NewProductsService.bulk_save(
+                updates={row_id: {'Status': status} for row_id in ids},
+                versions={row_id: row_versions[row_id] for row_id in ids if row_id in row_versions},
+            )
+            # Our own change: the rows' new version is picked up on reload
+            for row_id in outcome['updated']:
+                row_versions.pop(row_id, None)
+            if outcome['conflicts']:
+                ui.notify(f"Updated {len(outcome['updated'])} row(s) to {status}; "
+                          f"{len(outcome['conflicts'])} row(s) were changed by someone else and left as is",
+                          type='warning', timeout=8000)
+            else:
+                ui.notify(f"Updated {len(outcome['updated'])} row(s) to {status}", type='positive')
             load_products()
 
-    def resolve_pending():
+    def run_job(kind, func, description, on_done, **params):
+        """Run a staging operation in the background and follow it in the jobs area."""
+        job_id = JobService.submit(kind, func, description=description, exclusive='staging', **params)
+        if job_id is None:
+            ui.notify('Another resolve/undo/purge is still running - wait for it to finish', type='warning')
+            return
+        with jobs_container:
+            job_progress(job_id, lambda job: on_job_finished(job, on_done))
+
+    def on_job_finished(job, on_done):
+        if job['status'] == 'done':
+            on_done(job['result'])
+        elif job['status'] == 'cancelled':
+            ui.notify(f"{job['description']} cancelled", type='warning')
+        else:
+            ui.notify(f"Error: {job['error'] or job['status']}", type='negative')
+        load_products()
+
+    @traced()
+    async def preview_resolve():
+        """Compute the resolve plan for the current filter and show it before running it."""
+        facture_id = filters['facture'] if filters['facture'] else None
         try:
-            facture_id = filters['facture'] if filters['facture'] else None
-            stats = NewProductsService.resolve_anomalies(facture_id)
-            dups = stats.get('duplicates_converted', 0)
-            full_ign = stats.get('full_ignored', 0)
-            parts = []
-            if stats['created'] > 0:
-                parts.append(f"{stats['created']} New Product&FactItem Created")
-            if stats['ignored'] > 0:
-                parts.append(f"{stats['ignored']} Product exists-FactItem created")
-            if full_ign > 0:
-                parts.append(f"{full_ign} Product&FactItems created during Ingestion, Nothing to do")
-            if dups > 0:
-                parts.append(f"{dups} duplicates auto-linked")
-            if stats['errors'] > 0:
-                parts.append(f"{stats['errors']} errors")
-            msg = "Resolved: " + ", ".join(parts) if parts else "Nothing to resolve"
-            ui.notify(msg, type='positive')
-            load_products()
+            plan = await run.io_bound(bind(NewProductsService.plan_resolve), facture_id)
         except Exception as e:
             ui.notify(f"Error: {e}", type='negative')
+            return
+        resolve_plan['plan'] = plan
+        render_resolve_preview(plan)
+        resolve_dialog.open()
+
+    def render_resolve_preview(plan):
+        stats = plan['stats']
+        resolve_preview.clear()
+        with resolve_preview:
+            scope = f"facture {plan['facture_id']}" if plan['facture_id'] else 'all factures'
+            ui.label(f"Resolving {scope} will:").classes('text-gray-600')
+            with ui.row().classes('gap-2 my-2'):
+                ui.chip(f"{len(plan['products'])} product(s) to create", icon='add_circle', color='primary').props('dense')
+                ui.chip(f"{stats['ignored']} item(s) to link", icon='link', color='positive').props('dense')
+                ui.chip(f"{stats['duplicates_converted']} duplicate(s) to auto-link", icon='content_copy', color='warning').props('dense')
+                ui.chip(f"{stats['full_ignored']} to skip", icon='cancel', color='grey').props('dense')
+                ui.chip(f"{stats['errors']} error(s)", icon='error', color='negative').props('dense')
+
+            rows = plan['rows']
+            preview_rows = [
+                {'row_id': row_id, 'action': 'Error', 'detail': reason, **rows[row_id]}
+                for row_id, reason in plan['errors'].items()
+            ]
+            preview_rows += [
+                {'row_id': item['row_id'], 'action': PLAN_ACTIONS[item['kind']],
+                 'detail': f"Product {item['idsupplierproduct']}" if item.get('idsupplierproduct') else 'New product',
+                 **rows[item['row_id']]}
+                for item in plan['items']
+            ]
+            preview_rows += [
+                {'row_id': row_id, 'action': 'Skip (FULL IGNORE)', 'detail': '', **rows[row_id]}
+                for row_id in plan['skipped']
+            ]
+            if preview_rows:
+                ui.table(
+                    columns=[
+                        {'name': 'action', 'label': 'Action', 'field': 'action', 'align': 'left', 'sortable': True},
+                        {'name': 'row_id', 'label': 'Row', 'field': 'row_id', 'align': 'left'},
+                        {'name': 'code', 'label': 'Code', 'field': 'code', 'align': 'left'},
+                        {'name': 'designation', 'label': 'Designation', 'field': 'designation', 'align': 'left'},
+                        {'name': 'detail', 'label': 'Detail', 'field': 'detail', 'align': 'left'},
+                    ],
+                    rows=preview_rows,
+                    row_key='row_id',
+                    pagination=10,
+                ).classes('w-full').props('dense flat')
+            else:
+                ui.label('Nothing to resolve').classes('text-gray-500 my-4')
+            if plan['errors']:
+                ui.label('Rows in error are left untouched.').classes('text-red-600 text-sm mt-2')
+
+    @traced()
+    def resolve_pending():
+        plan = resolve_plan['plan']
+        resolve_plan['plan'] = None
+        if plan is None:
+            return
+        run_job(
+            'resolve',
+            lambda job, facture_id: NewProductsService.resolve_anomalies_bulk(facture_id, job=job, plan=plan),
+            f"Resolving facture {plan['facture_id']}" if plan['facture_id'] else 'Resolving all pending items',
+            show_resolve_result,
+            facture_id=plan['facture_id'],
+        )
 
+    def show_resolve_result(stats):
+        dups = stats.get('duplicates_converted', 0)
+        full_ign = stats.get('full_ignored', 0)
+        parts = []
+        if stats.get('created', 0) > 0:
+            parts.append(f"{stats['created']} New Product&FactItem Created")
+        if stats.get('ignored', 0) > 0:
+            parts.append(f"{stats['ignored']} Product exists-FactItem created")
+        if full_ign > 0:
+            parts.append(f"{full_ign} Product&FactItems created during Ingestion, Nothing to do")
+        if dups > 0:
+            parts.append(f"{dups} duplicates auto-linked")
+        if stats.get('errors', 0) > 0:
+            parts.append(f"{stats['errors']} errors")
+        msg = "Resolved: " + ", ".join(parts) if parts else "Nothing to resolve"
+        ui.notify(msg, type='positive')
+
+    @traced()
     def undo_facture():
         # Use filter facture, or fall back to selected row's facture
         facture_id = filters['facture']
@@ -198,22 +338,24 @@ def review_page():
             facture_id = selected_rows[0].get('idFacture')
 
         if facture_id:
-            try:
-                NewProductsService.undo_facture(facture_id)
-                ui.notify(f"Facture {facture_id} undone", type='positive')
-                load_products()
-            except Exception as e:
-                ui.notify(f"Error: {e}", type='negative')
+            run_job(
+                'undo',
+                lambda job, facture_id: NewProductsService.undo_facture(facture_id, job=job),
+                f"Undoing facture {facture_id}",
+                lambda _: ui.notify(f"Facture {facture_id} undone", type='positive'),
+                facture_id=facture_id,
+            )
         else:
             ui.notify("Select a facture from the dropdown or select a row first", type='warning')
 
+    @traced()
     def purge_closed():
-        try:
-            count = NewProductsService.purge_closed()
-            ui.notify(f"Purged {count} CLOSED record(s)", type='positive')
-            load_products()
-        except Exception as e:
-            ui.notify(f"Error: {e}", type='negative')
+        run_job(
+            'purge',
+            lambda job: NewProductsService.purge_closed(job=job),
+            'Purging CLOSED records',
+            lambda count: ui.notify(f"Purged {count} CLOSED record(s)", type='positive'),
+        )
 
     def track_change(row_id, field, value):
         """Track a field change for later bulk save."""
@@ -256,36 +398,26 @@ def review_page():
                 save_btn_ref['btn'].set_visibility(False)
                 changes_label_ref['label'].set_visibility(False)
 
+    @traced()
     def save_all_changes():
         """Save all modified rows and new duplicates to the database."""
         if not modified_rows and not pending_duplicates:
             ui.notify('No changes to save', type='info')
             return
 
-        errors = 0
-        saved = 0
-        created = 0
-
-        # Save modified rows
-        for row_id, changes in modified_rows.items():
-            try:
-                NewProductsService.update(row_id, **changes)
-                saved += 1
-            except Exception as e:
-                errors += 1
-                logger.error(f"Error saving row {row_id}: {e}")
-
-        # Create new duplicates
-        for dup in pending_duplicates:
-            try:
-                # Remove internal tracking fields before saving
-                save_data = {k: v for k, v in dup.items()
-                            if not k.startswith('_') and k not in ['idsuppliernewproducts', 'supplier_name']}
-                NewProductsService.create(**save_data)
-                created += 1
-            except Exception as e:
-                errors += 1
-                logger.error(f"Error creating duplicate: {e}")
+        # Internal tracking fields (_duplicated...) and display-only columns are
+        # dropped by the service; everything is written in one transaction
+        outcome = NewProductsService.bulk_save(
+            updates=dict(modified_rows),
+            creates={dup['idsuppliernewproducts']: dup for dup in pending_duplicates},
+            versions={row_id: row_versions[row_id] for row_id in modified_rows if row_id in row_versions},
+        )
+        saved = len(outcome['updated'])
+        created = len(outcome['created'])
+        errors = len(outcome['errors'])
+        conflicts = outcome['conflicts']
+        for row_id, message in outcome['errors'].items():
+            logger.error(f"Error saving row {row_id}: {message}")
 
         modified_rows.clear()
         pending_duplicates.clear()
@@ -297,15 +429,43 @@ def review_page():
             results.append(f"{saved} updated")
         if created > 0:
             results.append(f"{created} created")
+        if conflicts:
+            results.append(f"{len(conflicts)} conflicts")
         if errors > 0:
             results.append(f"{errors} errors")
 
-        if errors > 0:
+        if errors > 0 or conflicts:
             ui.notify(f"Saved: {', '.join(results)}", type='warning')
         else:
             ui.notify(f"Saved: {', '.join(results)}", type='positive')
-        load_products()
+        if conflicts:
+            ui.notify(f"{len(conflicts)} row(s) were changed by another reviewer meanwhile and were not saved - "
+                      f"they have been reloaded, please review them again", type='warning', timeout=8000)
+
+        if created or errors:
+            load_products()
+        else:
+            refresh_saved_rows(outcome['updated'] + conflicts)
 
+    def refresh_saved_rows(row_ids):
+        """Bring the table in line with a save, refetching only the saved and conflicting rows.
+
+        Saved rows are reread rather than patched with the submitted values: the
+        database may have normalized them (DECIMAL scale, truncation), and their
+        version must be the one the next save will be checked against.
+        """
+        fresh = {r['idsuppliernewproducts']: r for r in NewProductsService.get_many(row_ids)} if row_ids else {}
+        for i, row in enumerate(products_data):
+            row_id = row['idsuppliernewproducts']
+            if row_id not in fresh:
+                continue
+            products_data[i] = fresh[row_id]
+            row_versions[row_id] = NewProductsService.row_version(fresh[row_id])
+        if table_ref['table']:
+            table_ref['table'].update_rows(products_data)
+        update_stats()
+
+    @traced()
     def discard_changes():
         """Discard all pending changes including unsaved duplicates."""
         modified_rows.clear()
@@ -315,18 +475,6 @@ def review_page():
         load_products()
         ui.notify('Changes discarded', type='info')
 
-    def get_products_for_supplier(supplier_id):
-        """Get products for a supplier (with caching)."""
-        if not supplier_id:
-            return {}
-        if supplier_id not in products_cache:
-            products = ProductService.get_all(supplier_id=int(supplier_id))
-            products_cache[supplier_id] = {
-                str(p['idsupplierproduct']): f"{p['code']} - {p['designation'][:40]}"
-                for p in products
-            }
-        return products_cache[supplier_id]
-
     with layout('Review Pending Products'):
         # Get filter options
         suppliers = SupplierService.get_all()
@@ -386,10 +534,16 @@ def review_page():
                         ui.menu_item(status, on_click=lambda s=status: bulk_change_status(s))
 
             with ui.row().classes('gap-2'):
-                ui.button('Resolve Pending', icon='check_circle', on_click=lambda: resolve_dialog.open()).props('color=primary')
+                ui.button('Resolve Pending', icon='check_circle', on_click=preview_resolve).props('color=primary')
                 ui.button('Undo Facture', icon='undo', on_click=lambda: undo_dialog.open()).props('color=negative outlined')
                 ui.button('Purge Closed', icon='delete_sweep', on_click=lambda: purge_dialog.open()).props('color=grey outlined')
 
+        # Background resolve/undo/purge jobs, including ones started before a page reload
+        jobs_container = ui.column().classes('w-full gap-0')
+        with jobs_container:
+            for job in [j for kind in STAGING_JOB_KINDS for j in JobService.active(kind)]:
+                job_progress(job['id'], lambda finished: on_job_finished(finished, lambda _: None))
+
         # Save changes bar (visible when there are pending changes)
         with ui.card().classes('w-full mb-4 bg-amber-50 dark:bg-amber-900') as save_bar:
             with ui.row().classes('w-full items-center justify-between'):
@@ -421,6 +575,7 @@ def review_page():
             {'name': 'tva', 'label': 'TVA', 'field': 'tva', 'align': 'center'},
             {'name': 'category', 'label': 'Category', 'field': 'category', 'align': 'left'},
             {'name': 'misc', 'label': 'Misc', 'field': 'misc', 'align': 'left'},
+            {'name': 'suggestions', 'label': 'Suggested Products', 'field': 'suggestions', 'align': 'left'},
             {'name': 'Status', 'label': 'Status', 'field': 'Status', 'align': 'center'},
             {'name': 'idFacture', 'label': 'Facture', 'field': 'idFacture', 'align': 'center'},
             {'name': 'facture_filename', 'label': 'Filename', 'field': 'facture_filename', 'align': 'left'},
@@ -581,6 +736,21 @@ def review_page():
             </q-td>
         ''')
 
+        # Top product candidates from the matching engine - click to link the product
+        table_ref['table'].add_slot('body-cell-suggestions', '''
+            <q-td :props="props">
+                <template v-if="props.row._suggestions && props.row._suggestions.length">
+                    <q-chip v-for="s in props.row._suggestions" :key="s.idsupplierproduct" dense clickable
+                        :color="s.score >= 0.9 ? 'green' : (s.score >= 0.6 ? 'blue' : 'grey')" text-color="white"
+                        @click.stop="$parent.$emit('use-suggestion', {id: props.row.idsuppliernewproducts, product: s.idsupplierproduct})">
+                        {{ s.code }} ({{ Math.round(s.score * 100) }}%)
+                        <q-tooltip>{{ s.designation }} - {{ s.unitprice }}</q-tooltip>
+                    </q-chip>
+                </template>
+                <span v-else class="text-grey-5">-</span>
+            </q-td>
+        ''')
+
         # Inline editable cell for Status with select dropdown
         table_ref['table'].add_slot('body-cell-Status', '''
             <q-td :props="props" class="cursor-pointer">
@@ -645,53 +815,55 @@ def review_page():
         product_select_data = {'row_id': None, 'supplier_id': None}
         with ui.dialog() as product_dialog, ui.card().classes('p-4 min-w-[500px]'):
             ui.label('Select Product Reference').classes('text-lg font-semibold mb-4')
-            product_select_options = {}
-            product_select = ui.select(
-                label='Product',
-                options=product_select_options,
-                with_input=True
-            ).classes('w-full')
+            product_options = ProductOptions()
+            product_select = ProductPicker(product_options, label='Product').classes('w-full')
 
             def on_product_confirm():
                 if product_select.value:
-                    row_id = product_select_data['row_id']
-                    # Find current misc value to preserve content after the separator
-                    current_misc = ''
-                    for row in products_data:
-                        if row['idsuppliernewproducts'] == row_id:
-                            current_misc = row.get('misc', '') or ''
-                            break
-                    # Also check pending duplicates
-                    for dup in pending_duplicates:
-                        if dup['idsuppliernewproducts'] == row_id:
-                            current_misc = dup.get('misc', '') or ''
-                            break
-
-                    # Build new misc: "Product Reference ID:{id}-" + preserved content
-                    new_ref = f"Product Reference ID:{product_select.value}-"
-                    # If there was existing content after "-", preserve it
-                    if 'Product Reference ID:' in current_misc and '-' in current_misc:
-                        existing_suffix = current_misc.split('-', 1)[1]
-                        new_misc = new_ref + existing_suffix
-                    else:
-                        new_misc = new_ref
-
-                    # Track the change
-                    track_change(row_id, 'misc', new_misc)
-
-                    # Also update the table row visually
-                    for row in products_data:
-                        if row['idsuppliernewproducts'] == row_id:
-                            row['misc'] = new_misc
-                            break
-                    for dup in pending_duplicates:
-                        if dup['idsuppliernewproducts'] == row_id:
-                            dup['misc'] = new_misc
-                            break
-                    table_ref['table'].update_rows(pending_duplicates + products_data)
+                    set_product_reference(product_select_data['row_id'], product_select.value)
                     product_dialog.close()
                     ui.notify('Product reference set', type='positive')
 
+            def set_product_reference(row_id, product_id, status=None):
+                """Point a row's misc at an existing product, optionally changing its status."""
+                # Find current misc value to preserve content after the separator
+                current_misc = ''
+                for row in products_data:
+                    if row['idsuppliernewproducts'] == row_id:
+                        current_misc = row.get('misc', '') or ''
+                        break
+                # Also check pending duplicates
+                for dup in pending_duplicates:
+                    if dup['idsuppliernewproducts'] == row_id:
+                        current_misc = dup.get('misc', '') or ''
+                        break
+
+                # Build new misc: "Product Reference ID:{id}-" + preserved content
+                new_ref = f"Product Reference ID:{product_id}-"
+                # If there was existing content after "-", preserve it
+                if 'Product Reference ID:' in current_misc and '-' in current_misc:
+                    existing_suffix = current_misc.split('-', 1)[1]
+                    new_misc = new_ref + existing_suffix
+                else:
+                    new_misc = new_ref
+
+                changes = {'misc': new_misc}
+                if status:
+                    changes['Status'] = status
+
+                # Track the change and update the table row visually
+                for field, value in changes.items():
+                    track_change(row_id, field, value)
+                for row in products_data:
+                    if row['idsuppliernewproducts'] == row_id:
+                        row.update(changes)
+                        break
+                for dup in pending_duplicates:
+                    if dup['idsuppliernewproducts'] == row_id:
+                        dup.update(changes)
+                        break
+                table_ref['table'].update_rows(pending_duplicates + products_data)
+
             with ui.row().classes('w-full justify-end gap-2 mt-4'):
                 ui.button('Cancel', on_click=product_dialog.close).props('flat')
                 ui.button('Set Reference', on_click=on_product_confirm).props('color=primary')
@@ -701,19 +873,24 @@ def review_page():
             data = e.args
             product_select_data['row_id'] = data['id']
             product_select_data['supplier_id'] = data['supplier']
-            # Load products for this supplier
-            products = get_products_for_supplier(data['supplier'])
-            product_select.options = products
+            # Products are searched on demand within this supplier's catalog
+            product_options.set_supplier(data['supplier'])
             product_select.value = None
-            product_select.update()
             product_dialog.open()
 
         table_ref['table'].on('select-product', on_select_product)
 
+        # Linking a suggested product means the product already exists
+        def on_use_suggestion(e):
+            set_product_reference(e.args['id'], e.args['product'], status='IGNORE PRODUCT')
+            ui.notify('Product reference set from suggestion', type='positive')
+
+        table_ref['table'].on('use-suggestion', on_use_suggestion)
+
         # Resolve confirmation dialog
-        with ui.dialog() as resolve_dialog, ui.card().classes('p-4'):
+        with ui.dialog() as resolve_dialog, ui.card().classes('p-4 min-w-[800px]'):
             ui.label('Resolve Pending Items?').classes('text-lg font-semibold')
-            ui.label('This will create products and facture items based on status.').classes('text-gray-600 my-4')
+            resolve_preview = ui.column().classes('w-full gap-0')
             with ui.row().classes('w-full justify-end gap-2'):
                 ui.button('Cancel', on_click=resolve_dialog.close).props('flat')
                 ui.button('Resolve', on_click=lambda: (resolve_dialog.close(), resolve_pending())).props('color=primary')
@@ -1,10 +1,10 @@
 from nicegui import ui
 from app.components.layout import layout
+from app.tracing import traced
 from app.services import SupplierService
 from urllib.parse import parse_qs
 
 
-@ui.page('/suppliers')
 def suppliers_page():
     """Suppliers management page."""
 
@@ -22,9 +22,10 @@ def suppliers_page():
         except (ValueError, TypeError):
             pass
 
+    @traced()
     def load_suppliers():
         nonlocal suppliers_data
-        suppliers_data = SupplierService.get_all_with_counts()
+        suppliers_data = SupplierService.get_all_with_stats()
         # Mark highlighted row
         for row in suppliers_data:
             if row['idsupplier'] == highlight_id['value']:
@@ -32,18 +33,21 @@ def suppliers_page():
         if table_ref['table']:
             table_ref['table'].update_rows(suppliers_data)
 
+    @traced()
     def create_supplier(values):
         if values.get('name'):
             SupplierService.create(values['name'])
             ui.notify(f"Supplier '{values['name']}' created", type='positive')
             load_suppliers()
 
+    @traced()
     def update_supplier(values):
         if selected_supplier['id'] and values.get('name'):
             SupplierService.update(selected_supplier['id'], values['name'])
             ui.notify('Supplier updated', type='positive')
             load_suppliers()
 
+    @traced()
     def delete_supplier():
         if selected_supplier['id']:
             try:
@@ -79,6 +83,9 @@ def suppliers_page():
             {'name': 'name', 'label': 'Name', 'field': 'name', 'align': 'left', 'sortable': True},
             {'name': 'product_count', 'label': 'Products', 'field': 'product_count', 'align': 'center'},
             {'name': 'facture_count', 'label': 'Factures', 'field': 'facture_count', 'align': 'center'},
+            {'name': 'last_facture_date', 'label': 'Last Facture', 'field': 'last_facture_date', 'align': 'left', 'sortable': True},
+            {'name': 'total_spend', 'label': 'Spend (HT)', 'field': 'total_spend', 'align': 'right', 'sortable': True,
+             ':format': 'value => value.toLocaleString(undefined, {minimumFractionDigits: 2, maximumFractionDigits: 2})'},
         ]
 
         table_ref['table'] = ui.table(
@@ -175,9 +182,6 @@ def _open_edit_dialog(selected, dialog, name_input):
 
 
 def _search_suppliers(query, table_ref):
-    if query:
-        results = SupplierService.search(query)
-    else:
-        results = SupplierService.get_all_with_counts()
+    results = SupplierService.get_all_with_stats(query or None)
     if table_ref['table']:
         table_ref['table'].update_rows(results)
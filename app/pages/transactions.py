@@ -1,10 +1,13 @@
 from nicegui import ui
 from datetime import date
+from urllib.parse import urlencode
 from app.components.layout import layout
+from app.tracing import traced
 from app.services import BankInstructionService
+from app.services.query_runner import QueryRunner, QuerySuperseded
+from app.downloads import TRANSACTIONS_EXPORT_PATH
 
 
-@ui.page('/transactions')
 def transactions_page():
     """View Transactions page - read-only view of bank instructions."""
 
@@ -25,15 +28,33 @@ def transactions_page():
         'filename': None
     }
 
-    def load_transactions():
+    # Newer filter states supersede (and kill) queries still running for older ones
+    query_runner = QueryRunner()
+    ui.context.client.on_disconnect(query_runner.cancel)
+
+    @traced()
+    async def load_transactions():
         nonlocal transactions_data
-        transactions_data = BankInstructionService.get_all(
-            date_from=filters['date_from'],
-            date_to=filters['date_to'],
-            libelle=filters['libelle'] if filters['libelle'] else None,
-            montant=filters['montant'],
-            filename=filters['filename'] if filters['filename'] else None
-        )
+        query = {
+            'date_from': filters['date_from'],
+            'date_to': filters['date_to'],
+            'libelle': filters['libelle'] if filters['libelle'] else None,
+            'montant': filters['montant'],
+            'filename': filters['filename'] if filters['filename'] else None,
+        }
+        if count_label_ref['label']:
+            count_label_ref['label'].set_text('Loading...')
+        try:
+            transactions_data = await query_runner.run(
+                ('transactions', *query.values()),
+                BankInstructionService.get_all,
+                **query
+            )
+        except QuerySuperseded:
+            return
+        except Exception as e:
+            ui.notify(f'Error loading transactions: {e}', type='negative')
+            return
         if table_ref['table']:
             table_ref['table'].update_rows(transactions_data)
         update_count()
@@ -43,38 +64,47 @@ def transactions_page():
         if count_label_ref['label']:
             count_label_ref['label'].set_text(f"Showing {count} transaction(s)")
 
-    def on_date_from_change(value):
+    async def on_date_from_change(value):
         from datetime import datetime
         try:
             filters['date_from'] = datetime.strptime(value, '%Y-%m-%d').date() if value else None
-            load_transactions()
         except (ValueError, TypeError):
-            pass  # Invalid date format, ignore
+            return  # Invalid date format, ignore
+        await load_transactions()
 
-    def on_date_to_change(value):
+    async def on_date_to_change(value):
         from datetime import datetime
         try:
             filters['date_to'] = datetime.strptime(value, '%Y-%m-%d').date() if value else None
-            load_transactions()
         except (ValueError, TypeError):
-            pass  # Invalid date format, ignore
+            return  # Invalid date format, ignore
+        await load_transactions()
 
-    def on_libelle_change(e):
+    async def on_libelle_change(e):
         filters['libelle'] = e.value if e.value else None
-        load_transactions()
+        await load_transactions()
 
-    def on_montant_change(e):
+    async def on_montant_change(e):
         try:
             filters['montant'] = float(e.value) if e.value else None
         except (ValueError, TypeError):
             filters['montant'] = None
-        load_transactions()
+        await load_transactions()
 
-    def on_filename_change(e):
+    async def on_filename_change(e):
         filters['filename'] = e.value if e.value else None
-        load_transactions()
-
-    def clear_filters():
+        await load_transactions()
+
+    def export(file_format):
+        # Streamed by the download endpoint: every matching row, not just the 500 shown
+        params = {'format': file_format}
+        for key in ('date_from', 'date_to', 'libelle', 'montant', 'filename'):
+            value = filters[key]
+            if value is not None and value != '':
+                params[key] = value.strftime('%Y-%m-%d') if isinstance(value, date) else value
+        ui.download.from_url(f'{TRANSACTIONS_EXPORT_PATH}?{urlencode(params)}')
+
+    async def clear_filters():
         filters['date_from'] = default_from
         filters['date_to'] = default_to
         filters['libelle'] = None
@@ -86,7 +116,7 @@ def transactions_page():
         libelle_input.value = ''
         montant_input.value = ''
         filename_select.value = None
-        load_transactions()
+        await load_transactions()
 
     with layout('View Transactions'):
         # Filter card
@@ -141,6 +171,12 @@ def transactions_page():
                 # Clear filters button
                 ui.button('Clear Filters', icon='clear', on_click=clear_filters).props('flat')
 
+                # Export every row matching the filters
+                with ui.button('Export', icon='download').props('outline'):
+                    with ui.menu():
+                        ui.menu_item('CSV', on_click=lambda: export('csv'))
+                        ui.menu_item('Excel (XLSX)', on_click=lambda: export('xlsx'))
+
         # Results count
         count_label_ref['label'] = ui.label('Loading...').classes('text-sm text-gray-500 mb-2')
 
@@ -187,5 +223,5 @@ def transactions_page():
             </q-td>
         ''')
 
-        # Load initial data
-        load_transactions()
+        # Load initial data once the page is served
+        ui.timer(0, load_transactions, once=True)
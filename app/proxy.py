@@ -0,0 +1,107 @@
+"""Local reverse proxy spreading browser sessions over the web workers, with sticky sessions."""
+import asyncio
+import itertools
+import re
+from typing import Optional
+
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Cookie pinning a browser to its worker (a NiceGUI page and its websocket must hit the same process)
+STICKY_COOKIE = 'aw_worker'
+# Largest request/response head accepted
+MAX_HEAD_SIZE = 64 * 1024
+# Data copied per read
+CHUNK_SIZE = 64 * 1024
+
+_COOKIE_PATTERN = re.compile(rb'^cookie:.*?\b' + STICKY_COOKIE.encode() + rb'=(\d+)', re.IGNORECASE | re.MULTILINE)
+
+
+class StickyProxy:
+    """TCP level HTTP proxy: the first request of each connection picks the worker.
+
+    A browser without the sticky cookie is given the next worker in turn and
+    the cookie is added to the first response; its later connections
+    (pages, websocket, uploads) go to that same worker. Bytes are copied
+    as-is after the first request, so websocket upgrades work unchanged.
+    """
+
+    def __init__(self, host: str, port: int, worker_ports: list[int]):
+        self.host = host
+        self.port = port
+        self.worker_ports = worker_ports
+        self._next_worker = itertools.cycle(range(len(worker_ports)))
+
+    async def serve(self) -> None:
+        server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_HEAD_SIZE)
+        logger.info(f"Proxy listening on {self.host}:{self.port} for {len(self.worker_ports)} worker(s)")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter) -> None:
+        upstream_writer = None
+        try:
+            try:
+                head = await client_reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            sticky = self._sticky_worker(head)
+            upstream_reader, upstream_writer, worker = await self._connect(sticky)
+            if upstream_writer is None:
+                client_writer.write(b'HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                await client_writer.drain()
+                return
+            upstream_writer.write(head)
+            # New browser, or its worker is down: (re)pin it
+            cookie = worker if worker != sticky else None
+            await asyncio.gather(
+                _pipe(client_reader, upstream_writer),
+                _pipe(upstream_reader, client_writer, cookie),
+            )
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for writer in (client_writer, upstream_writer):
+                if writer is not None:
+                    writer.close()
+
+    def _sticky_worker(self, head: bytes) -> Optional[int]:
+        match = _COOKIE_PATTERN.search(head)
+        if match and int(match.group(1)) < len(self.worker_ports):
+            return int(match.group(1))
+        return None
+
+    async def _connect(self, worker: Optional[int]):
+        """Open a connection to the worker, or to the next live one if it is down."""
+        first = next(self._next_worker)
+        candidates = [worker] if worker is not None else []
+        candidates += [candidate for candidate in
+                       ((first + i) % len(self.worker_ports) for i in range(len(self.worker_ports)))
+                       if candidate != worker]
+        for candidate in candidates:
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', self.worker_ports[candidate])
+                return reader, writer, candidate
+            except OSError:
+                logger.warning(f"Worker {candidate} (port {self.worker_ports[candidate]}) unreachable")
+        return None, None, None
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, cookie: Optional[int] = None) -> None:
+    """Copy one direction of a connection, adding the sticky cookie to the first response if asked."""
+    try:
+        if cookie is not None:
+            head = await reader.readuntil(b'\r\n\r\n')
+            writer.write(head[:-2] + f'Set-Cookie: {STICKY_COOKIE}={cookie}; Path=/; HttpOnly; SameSite=Lax\r\n\r\n'.encode())
+        while data := await reader.read(CHUNK_SIZE):
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        pass
+    finally:
+        if writer.can_write_eof():
+            try:
+                writer.write_eof()
+            except OSError:
+                pass
@@ -5,6 +5,11 @@ from app.services.newproducts_service import NewProductsService
 from app.services.bank_instruction_service import BankInstructionService
 from app.services.sales_service import SalesService
 from app.services.superset_service import SupersetService
+from app.services.product_matcher import ProductMatchService
+from app.services.job_service import JobService
+from app.services.kpi_service import KpiService
+from app.services.fec_service import FecService
+from app.tracing import instrument
 
 __all__ = [
     'SupplierService',
@@ -14,4 +19,13 @@ __all__ = [
     'BankInstructionService',
     'SalesService',
     'SupersetService',
+    'ProductMatchService',
+    'JobService',
+    'KpiService',
+    'FecService',
 ]
+
+# Service calls made inside a trace (page build, UI event, job) become spans
+for _service in (SupplierService, ProductService, FactureService, NewProductsService, BankInstructionService,
+                 SalesService, SupersetService, ProductMatchService, JobService, KpiService, FecService):
+    instrument(_service)
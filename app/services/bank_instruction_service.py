@@ -1,9 +1,49 @@
+import threading
+import time
+from collections import OrderedDict
 from datetime import date
 from dateutil.relativedelta import relativedelta
-from typing import Optional
+from contextlib import nullcontext
+from typing import Iterator, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
 
 from analysercomptacore.services import BankService as CoreBankService
 from app.database import get_db
+from app.logging_config import get_logger
+from app.models import BankInstruction
+from app.services.query_runner import QueryToken
+from app.services.search_index import TrigramIndex
+
+logger = get_logger(__name__)
+
+# Delay between two checks of the bank table for newly imported rows
+INDEX_SYNC_INTERVAL = 5.0  # seconds
+# Delay between two full rebuilds of the search index (picks up edited rows)
+INDEX_REBUILD_INTERVAL = 900.0  # seconds
+# Longest a search waits for the first build of the index
+INDEX_BUILD_TIMEOUT = 120.0  # seconds
+
+# In-process Libelle/Reference search index, kept up to date by the 'bank-index' thread
+_libelle_index = TrigramIndex()
+_libelle_index_state = {'max_id': 0, 'count': 0, 'built_at': 0.0, 'thread': None}
+_libelle_index_lock = threading.Lock()
+_libelle_index_ready = threading.Event()
+
+# Rows fetched per round trip when streaming an export
+EXPORT_BATCH_SIZE = 2000
+# Columns of an export, in order
+EXPORT_COLUMNS = ('TransactionID', 'Compte', 'Date_de_comptabilisation', 'Date_operation', 'Libelle',
+                  'Reference', 'Date_valeur', 'Montant', 'filename')
+
+# Number of monthly summaries / classified transaction lists kept in memory
+MAX_CACHED_MONTHS = 24
+
+# {(kind, year, month): (bank table signature, rows)}, reused until the bank table changes
+_month_cache: OrderedDict[tuple[str, int, int], tuple[tuple[int, int], list[dict]]] = OrderedDict()
+_month_cache_state = {'signature': None, 'checked_at': 0.0}
+_month_cache_lock = threading.Lock()
 
 
 class BankInstructionService:
@@ -25,17 +65,21 @@ class BankInstructionService:
         libelle: Optional[str] = None,
         montant: Optional[float] = None,
         filename: Optional[str] = None,
-        limit: int = 500
+        limit: int = 500,
+        query_token: Optional[QueryToken] = None
     ) -> list[dict]:
         """Get transactions with optional filters.
 
         Args:
             date_from: Start date for Date de comptabilisation filter
             date_to: End date for Date de comptabilisation filter
-            libelle: Text search in Libelle field (case-insensitive)
+            libelle: Text search in Libelle and Reference (case/accent-insensitive,
+                results ranked by relevance); Core's Libelle filter is used
+                instead while the search index is being built
             montant: Filter by exact Montant value
             filename: Filter by filename (case-insensitive contains)
             limit: Maximum number of records to return (default 500)
+            query_token: Optional token allowing the statement to be killed when superseded
 
         Returns:
             List of transaction dictionaries
@@ -44,7 +88,16 @@ class BankInstructionService:
         date_from_str = date_from.strftime('%Y-%m-%d') if date_from else None
         date_to_str = date_to.strftime('%Y-%m-%d') if date_to else None
 
-        with get_db() as db:
+        with get_db() as db, (query_token.bound(db) if query_token else nullcontext()):
+            ranked_ids = _search_ids(db, libelle, date_from_str, date_to_str, montant, filename,
+                                     limit=limit) if libelle else None
+            if ranked_ids is not None:
+                if not ranked_ids:
+                    return []
+                rank = {tid: i for i, tid in enumerate(ranked_ids)}
+                rows = _filtered_query(db, ranked_ids, date_from_str, date_to_str, montant, filename).all()
+                rows.sort(key=lambda t: rank[t.TransactionID])
+                return [_transaction_to_dict(t) for t in rows]
             return CoreBankService.get_transactions_by_date_range(
                 db,
                 date_from=date_from_str,
@@ -55,6 +108,92 @@ class BankInstructionService:
                 limit=limit
             )
 
+    @staticmethod
+    def iter_export(
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+        libelle: Optional[str] = None,
+        montant: Optional[float] = None,
+        filename: Optional[str] = None
+    ) -> Iterator[tuple]:
+        """Stream every transaction matching the filters, for export.
+
+        Same filters as get_all() but without a limit, ordered by date. Rows
+        come from a server-side cursor EXPORT_BATCH_SIZE at a time, so memory
+        stays flat however many rows match; with a text search, rows are kept
+        if they are among the (uncapped) index hits.
+
+        Yields:
+            Tuples of values in EXPORT_COLUMNS order (dates as date objects,
+            Montant as Decimal)
+        """
+        date_from_str = date_from.strftime('%Y-%m-%d') if date_from else None
+        date_to_str = date_to.strftime('%Y-%m-%d') if date_to else None
+        columns = [getattr(BankInstruction, column) for column in EXPORT_COLUMNS]
+
+        with get_db() as db:
+            # Every hit over the whole table: the other filters are applied by the query below
+            hits = _search_ids(db, libelle, None, None, None, None, limit=None) if libelle else None
+            hits = set(hits) if hits is not None else None
+            query = _filtered_query(db, None, date_from_str, date_to_str, montant, filename, columns=columns,
+                                    libelle=libelle if hits is None else None)
+            query = query.order_by(BankInstruction.Date_de_comptabilisation, BankInstruction.TransactionID)
+            for row in query.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE):
+                # TransactionID is the first export column
+                if hits is None or row[0] in hits:
+                    yield tuple(row)
+
+    @staticmethod
+    def search(query: str, limit: int = 50) -> list[dict]:
+        """Ranked text search over Libelle and Reference.
+
+        Matching is case and accent insensitive; every word of the query must
+        appear, either as a substring (3+ characters) or as a word prefix.
+
+        Args:
+            query: Search text, e.g. "URSSAF" or "prlv urss"
+            limit: Maximum number of hits to return
+
+        Returns:
+            List of transaction dictionaries with an extra 'score' key, best first
+        """
+        BankInstructionService.start_search_index(wait=True)
+        hits = _libelle_index.search(query, limit=limit)
+        if not hits:
+            return []
+        scores = dict(hits)
+        with get_db() as db:
+            rows = db.query(BankInstruction).filter(
+                BankInstruction.TransactionID.in_(list(scores))
+            ).all()
+        results = [{**_transaction_to_dict(t), 'score': scores[t.TransactionID]} for t in rows]
+        results.sort(key=lambda r: -r['score'])
+        return results
+
+    @staticmethod
+    def start_search_index(wait: bool = False) -> None:
+        """Start the thread building and maintaining the Libelle/Reference index.
+
+        Newly imported rows (higher TransactionID) are added every
+        INDEX_SYNC_INTERVAL; the index is rebuilt from scratch every
+        INDEX_REBUILD_INTERVAL, and when rows were deleted or re-imported, so
+        edited rows are reindexed too. Searches keep using the previous index
+        while a rebuild runs.
+
+        Args:
+            wait: Block until the first build is done (at most INDEX_BUILD_TIMEOUT)
+
+        Raises:
+            RuntimeError: With wait, if the first build is not done in time
+        """
+        state = _libelle_index_state
+        with _libelle_index_lock:
+            if state['thread'] is None:
+                state['thread'] = threading.Thread(target=_index_loop, name='bank-index', daemon=True)
+                state['thread'].start()
+        if wait and not _libelle_index_ready.wait(INDEX_BUILD_TIMEOUT):
+            raise RuntimeError("The bank search index is still being built, try again shortly")
+
     @staticmethod
     def get_by_id(transaction_id: int) -> Optional[dict]:
         """Get a transaction by ID."""
@@ -73,14 +212,19 @@ class BankInstructionService:
         date_to: Optional[date] = None,
         libelle: Optional[str] = None,
         montant: Optional[float] = None,
-        filename: Optional[str] = None
+        filename: Optional[str] = None,
+        query_token: Optional[QueryToken] = None
     ) -> int:
         """Get count of transactions matching filters."""
         # Convert date objects to strings for Core
         date_from_str = date_from.strftime('%Y-%m-%d') if date_from else None
         date_to_str = date_to.strftime('%Y-%m-%d') if date_to else None
 
-        with get_db() as db:
+        with get_db() as db, (query_token.bound(db) if query_token else nullcontext()):
+            ranked_ids = _search_ids(db, libelle, date_from_str, date_to_str, montant, filename,
+                                     limit=None) if libelle else None
+            if ranked_ids is not None:
+                return len(ranked_ids)
             return CoreBankService.get_transaction_count(
                 db,
                 date_from=date_from_str,
@@ -113,8 +257,7 @@ class BankInstructionService:
             Type, Qualifier, Libelle, Montant, Date_comptabilisation,
             Date_operation, Date_valeur, TransactionID, Reference
         """
-        with get_db() as db:
-            return CoreBankService.get_classified_transactions_for_month_year(db, month, year)
+        return _cached_month('classified', month, year, CoreBankService.get_classified_transactions_for_month_year)
 
     @staticmethod
     def get_monthly_summary(month: int, year: int) -> list[dict]:
@@ -127,5 +270,171 @@ class BankInstructionService:
         Returns:
             List of dicts with Type, Name, Montant
         """
-        with get_db() as db:
-            return CoreBankService.build_monthly_summary(db, month, year)
+        return _cached_month('summary', month, year, CoreBankService.build_monthly_summary)
+
+
+def _index_loop() -> None:
+    """Body of the 'bank-index' thread."""
+    while True:
+        try:
+            if time.monotonic() - _libelle_index_state['built_at'] >= INDEX_REBUILD_INTERVAL:
+                _rebuild_index()
+            else:
+                _add_new_rows()
+        except Exception as e:
+            logger.error(f"Bank search index update failed: {e}")
+        time.sleep(INDEX_SYNC_INTERVAL)
+
+
+def _rebuild_index() -> None:
+    """Index every bank row into a new index, then swap it in."""
+    global _libelle_index
+    started = time.perf_counter()
+    index = TrigramIndex()
+    with get_db() as db:
+        max_id = 0
+        rows = db.query(BankInstruction.TransactionID, BankInstruction.Libelle, BankInstruction.Reference)
+        for transaction_id, libelle, reference in rows.execution_options(stream_results=True, yield_per=5000):
+            index.add(transaction_id, libelle, reference)
+            max_id = max(max_id, transaction_id)
+    with _libelle_index_lock:
+        _libelle_index = index
+        _libelle_index_state.update(max_id=max_id, count=len(index), built_at=time.monotonic())
+    _libelle_index_ready.set()
+    logger.info(f"Built bank search index: {len(index)} rows in {time.perf_counter() - started:.1f}s")
+
+
+def _add_new_rows() -> None:
+    """Add rows imported since the last update, or rebuild if rows were removed."""
+    state = _libelle_index_state
+    with get_db() as db:
+        max_id, count = db.query(
+            func.max(BankInstruction.TransactionID), func.count(BankInstruction.TransactionID)
+        ).one()
+        max_id, count = max_id or 0, count or 0
+        if max_id < state['max_id'] or count < state['count']:
+            logger.info("Bank rows removed since last sync, rebuilding search index")
+            removed = True
+        else:
+            removed = False
+            if max_id > state['max_id']:
+                new_rows = db.query(
+                    BankInstruction.TransactionID, BankInstruction.Libelle, BankInstruction.Reference
+                ).filter(BankInstruction.TransactionID > state['max_id']).yield_per(5000)
+                added = 0
+                for transaction_id, libelle, reference in new_rows:
+                    _libelle_index.add(transaction_id, libelle, reference)
+                    added += 1
+                state['max_id'] = max_id
+                state['count'] = len(_libelle_index)
+                logger.info(f"Indexed {added} bank transaction(s) for Libelle search")
+    if removed:
+        _rebuild_index()
+
+
+def _cached_month(kind: str, month: int, year: int, load) -> list[dict]:
+    """Rows of a per-month Core query, recomputed only when bank rows were imported or removed."""
+    signature = _bank_signature()
+    key = (kind, year, month)
+    with _month_cache_lock:
+        cached = _month_cache.get(key)
+        if cached is not None and cached[0] == signature:
+            _month_cache.move_to_end(key)
+            return [dict(row) for row in cached[1]]
+
+    with get_db() as db:
+        rows = load(db, month, year)
+
+    with _month_cache_lock:
+        _month_cache[key] = (signature, rows)
+        _month_cache.move_to_end(key)
+        while len(_month_cache) > MAX_CACHED_MONTHS:
+            _month_cache.popitem(last=False)
+    return [dict(row) for row in rows]
+
+
+def _bank_signature() -> tuple[int, int]:
+    """(max TransactionID, row count) of the bank table, checked at most every INDEX_SYNC_INTERVAL."""
+    state = _month_cache_state
+    now = time.monotonic()
+    with _month_cache_lock:
+        if state['signature'] is not None and now - state['checked_at'] < INDEX_SYNC_INTERVAL:
+            return state['signature']
+    with get_db() as db:
+        max_id, count = db.query(
+            func.max(BankInstruction.TransactionID), func.count(BankInstruction.TransactionID)
+        ).one()
+    with _month_cache_lock:
+        state['signature'] = (max_id or 0, count or 0)
+        state['checked_at'] = now
+        return state['signature']
+
+
+def _search_ids(db: Session, libelle: str, date_from: Optional[str], date_to: Optional[str],
+                montant: Optional[float], filename: Optional[str], limit: Optional[int]) -> Optional[list[int]]:
+    """Transaction IDs matching a Libelle search and the other filters, best first.
+
+    The other filters are applied before the hits are ranked and cut to
+    `limit`, so a broad search never hides matching rows of the selected
+    period.
+
+    Returns:
+        The IDs, or None while the search index is still being built (the
+        caller then falls back to Core's Libelle filter)
+    """
+    if not _libelle_index_ready.is_set():
+        BankInstructionService.start_search_index()
+        return None
+    where = None
+    if date_from or date_to or montant is not None or filename:
+        query = _filtered_query(db, None, date_from, date_to, montant, filename,
+                                columns=[BankInstruction.TransactionID])
+        allowed = {tid for tid, in query.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)}
+        where = allowed.__contains__
+    return [tid for tid, _ in _libelle_index.search(libelle, limit=limit, where=where)]
+
+
+def _filtered_query(db: Session, transaction_ids: Optional[list[int]], date_from: Optional[str],
+                    date_to: Optional[str], montant: Optional[float], filename: Optional[str],
+                    columns: Optional[list] = None, libelle: Optional[str] = None):
+    """Query bank rows applying the same filters as Core, the table and the export.
+
+    Args:
+        transaction_ids: Text search hits to restrict the rows to, or None
+        columns: Columns to select instead of whole BankInstruction rows
+        libelle: Substring of Libelle, as Core's filter (used while the search
+            index is being built)
+    """
+    query = db.query(*columns) if columns else db.query(BankInstruction)
+    if transaction_ids is not None:
+        query = query.filter(BankInstruction.TransactionID.in_(transaction_ids))
+    if libelle:
+        query = query.filter(BankInstruction.Libelle.ilike(f'%{libelle}%'))
+    if date_from:
+        query = query.filter(BankInstruction.Date_de_comptabilisation >= date_from)
+    if date_to:
+        query = query.filter(BankInstruction.Date_de_comptabilisation <= date_to)
+    if montant is not None:
+        query = query.filter(BankInstruction.Montant == montant)
+    if filename:
+        query = query.filter(BankInstruction.filename.ilike(f'%{filename}%'))
+    return query
+
+
+def _format_date(value) -> Optional[str]:
+    return value.strftime('%Y-%m-%d') if hasattr(value, 'strftime') else value
+
+
+def _transaction_to_dict(t: BankInstruction) -> dict:
+    """Convert a BankInstruction to the dictionary shape returned by Core."""
+    return {
+        'TransactionID': t.TransactionID,
+        'Compte': t.Compte,
+        'Date_de_comptabilisation': _format_date(t.Date_de_comptabilisation),
+        'Date_operation': _format_date(t.Date_operation),
+        'Libelle': t.Libelle,
+        'Reference': t.Reference,
+        'Date_valeur': _format_date(t.Date_valeur),
+        'Montant': float(t.Montant) if t.Montant is not None else None,
+        'filename': t.filename,
+    }
@@ -1,8 +1,40 @@
+import copy
+import threading
+from collections import OrderedDict
 from typing import Optional
 from datetime import datetime
 
+from sqlalchemy import func, insert, update
+
 from analysercomptacore.services import SupplierService as CoreSupplierService
 from app.database import get_db
+from app.logging_config import get_logger
+from app.models import Supplier, SupplierFacture, SupplierFactItem, SupplierProduct
+from app.services.supplier_stats import SupplierStats
+from app.shared_cache import SharedCache
+
+logger = get_logger(__name__)
+
+# Facture item fields an edit can change
+ITEM_FIELDS = ('idsupplierproduct', 'quantity', 'itemPrice', 'unitPriceSnap')
+
+# Number of facture details (header + items) kept in memory
+DETAIL_CACHE_SIZE = 256
+
+# LRU cache of facture details: {facture_id: detail dict}, most recently used last
+_detail_cache: OrderedDict[int, dict] = OrderedDict()
+_detail_lock = threading.Lock()
+
+# Columns the facture list can be sorted by (table column name -> model column)
+SORT_COLUMNS = {
+    'idFacture': SupplierFacture.idFacture,
+    'factNum': SupplierFacture.factNum,
+    'supplier_name': Supplier.name,
+    'factDate': SupplierFacture.factDate,
+    'factmontantHT': SupplierFacture.factmontantHT,
+    'factmontantTVA': SupplierFacture.factmontantTVA,
+    'factmontantttc': SupplierFacture.factmontantttc,
+}
 
 
 class FactureService:
@@ -16,12 +48,126 @@ class FactureService:
         with get_db() as db:
             return CoreSupplierService.get_all_factures(db, supplier_id, date_from, date_to)
 
+    @staticmethod
+    def get_page(supplier_id: Optional[int] = None,
+                 date_from: Optional[datetime] = None,
+                 date_to: Optional[datetime] = None,
+                 number_prefix: Optional[str] = None,
+                 sort_by: str = 'factDate',
+                 descending: bool = True,
+                 offset: int = 0,
+                 limit: int = 20) -> dict:
+        """Get one page of factures, filtered and sorted by the database.
+
+        Args:
+            supplier_id: Restrict to one supplier
+            date_from: Earliest facture date
+            date_to: Latest facture date
+            number_prefix: Invoice numbers starting with this text
+            sort_by: Sort column (see SORT_COLUMNS), ties broken by ID
+            descending: Sort order
+            offset: Number of factures to skip
+            limit: Page size
+
+        Returns:
+            Dict with 'rows' (facture dictionaries with supplier_name), 'total'
+            (number of matching factures) and 'totals' (sums of HT, TVA and TTC
+            over all matching factures, from a single aggregate query)
+        """
+        conditions = []
+        if supplier_id:
+            conditions.append(SupplierFacture.idsupplier == supplier_id)
+        if date_from:
+            conditions.append(SupplierFacture.factDate >= date_from)
+        if date_to:
+            conditions.append(SupplierFacture.factDate <= date_to)
+        if number_prefix:
+            escaped = number_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append(SupplierFacture.factNum.like(f'{escaped}%'))
+
+        sort_column = SORT_COLUMNS.get(sort_by, SupplierFacture.factDate)
+        order = [sort_column.desc(), SupplierFacture.idFacture.desc()] if descending \
+            else [sort_column.asc(), SupplierFacture.idFacture.asc()]
+
+        with get_db() as db:
+            total, sum_ht, sum_tva, sum_ttc = db.query(
+                func.count(SupplierFacture.idFacture),
+                func.coalesce(func.sum(SupplierFacture.factmontantHT), 0),
+                func.coalesce(func.sum(SupplierFacture.factmontantTVA), 0),
+                func.coalesce(func.sum(SupplierFacture.factmontantttc), 0),
+            ).filter(*conditions).one()
+            rows = db.query(SupplierFacture, Supplier.name).outerjoin(
+                Supplier, Supplier.idsupplier == SupplierFacture.idsupplier
+            ).filter(*conditions).order_by(*order).offset(offset).limit(limit).all()
+            return {
+                'rows': [_facture_to_dict(facture, supplier_name) for facture, supplier_name in rows],
+                'total': total,
+                'totals': {'ht': float(sum_ht), 'tva': float(sum_tva), 'ttc': float(sum_ttc)},
+            }
+
     @staticmethod
     def get_by_id(facture_id: int) -> Optional[dict]:
         """Get a facture by ID with items."""
         with get_db() as db:
             return CoreSupplierService.get_facture_by_id(db, facture_id)
 
+    @staticmethod
+    def get_detail(facture_id: int) -> Optional[dict]:
+        """Get a facture with its items and their product code/designation.
+
+        Header, items and products are loaded with a single joined query, and
+        the result is kept in an LRU cache until the facture is written.
+
+        Returns:
+            Same shape as get_by_id(), or None if the facture does not exist
+        """
+        with _detail_lock:
+            detail = _detail_cache.get(facture_id)
+            if detail is not None:
+                _detail_cache.move_to_end(facture_id)
+                return copy.deepcopy(detail)
+
+        with get_db() as db:
+            rows = db.query(SupplierFacture, Supplier.name, SupplierFactItem, SupplierProduct.code,
+                            SupplierProduct.designation).outerjoin(
+                Supplier, Supplier.idsupplier == SupplierFacture.idsupplier
+            ).outerjoin(
+                SupplierFactItem, SupplierFactItem.idsupplierfacture == SupplierFacture.idFacture
+            ).outerjoin(
+                SupplierProduct, SupplierProduct.idsupplierproduct == SupplierFactItem.idsupplierproduct
+            ).filter(
+                SupplierFacture.idFacture == facture_id
+            ).order_by(SupplierFactItem.idsupplierfactitem).all()
+            if not rows:
+                return None
+            facture, supplier_name = rows[0][0], rows[0][1]
+            detail = _facture_to_dict(facture, supplier_name)
+            detail['items'] = [
+                {
+                    'idsupplierfactitem': item.idsupplierfactitem,
+                    'idsupplierproduct': item.idsupplierproduct,
+                    'product_code': code,
+                    'product_designation': designation,
+                    'quantity': float(item.quantity or 0),
+                    'unitPriceSnap': float(item.unitPriceSnap or 0),
+                    'itemPrice': float(item.itemPrice or 0),
+                }
+                for _, _, item, code, designation in rows if item is not None
+            ]
+
+        with _detail_lock:
+            _detail_cache[facture_id] = detail
+            _detail_cache.move_to_end(facture_id)
+            while len(_detail_cache) > DETAIL_CACHE_SIZE:
+                _detail_cache.popitem(last=False)
+        return copy.deepcopy(detail)
+
+    @staticmethod
+    def invalidate_detail(facture_id: Optional[int] = None) -> None:
+        """Drop a facture's cached detail, or all of them (after bulk item changes)."""
+        _drop_detail(facture_id)
+        SharedCache.publish('facture_detail', facture_id)
+
     @staticmethod
     def get_items(facture_id: int) -> list[dict]:
         """Get all items for a facture."""
@@ -39,3 +185,128 @@ class FactureService:
         """Get most recent factures."""
         with get_db() as db:
             return CoreSupplierService.get_recent_factures(db, limit)
+
+    @staticmethod
+    def create_facture(supplier_id: int, fields: dict, items: list[dict]) -> int:
+        """Create a facture and its items in one transaction.
+
+        Args:
+            supplier_id: Supplier ID
+            fields: Facture columns (factNum, factDate, amounts, filename)
+            items: Item dictionaries with idsupplierproduct, quantity,
+                itemPrice, unitPriceSnap
+
+        Returns:
+            The new facture ID
+        """
+        with get_db() as db:
+            facture = SupplierFacture(idsupplier=supplier_id, **fields)
+            db.add(facture)
+            db.flush()
+            facture_id = facture.idFacture
+            if items:
+                db.execute(insert(SupplierFactItem), [
+                    {'idsupplier': supplier_id, 'idsupplierfacture': facture_id,
+                     **{field: item.get(field) for field in ITEM_FIELDS}}
+                    for item in items
+                ])
+        SupplierStats.facture_added(supplier_id, fields.get('factDate'), fields.get('factmontantHT'))
+        logger.info(f"Facture {facture_id} created with {len(items)} item(s)")
+        return facture_id
+
+    @staticmethod
+    def update_facture(facture_id: int, fields: dict, items: list[dict]) -> Optional[dict]:
+        """Update a facture and its items, writing only what changed.
+
+        Submitted items are matched with stored ones by idsupplierfactitem:
+        changed ones are updated in one executemany, new ones (no ID) inserted
+        in one multi-row INSERT, and stored items no longer submitted deleted
+        in one statement. Unchanged items are not touched, so their IDs stay
+        stable.
+
+        Args:
+            facture_id: Facture ID
+            fields: Facture columns to set (factNum, factDate, amounts, filename)
+            items: Item dictionaries with idsupplierfactitem (None for new
+                items), idsupplierproduct, quantity, itemPrice, unitPriceSnap
+
+        Returns:
+            Dict with 'inserted', 'updated' and 'deleted' item counts, or None
+            if the facture does not exist
+        """
+        with get_db() as db:
+            facture = db.query(SupplierFacture).filter(SupplierFacture.idFacture == facture_id).first()
+            if not facture:
+                return None
+            supplier_id = facture.idsupplier
+            # The ORM only issues an UPDATE for columns whose value actually changed
+            for field, value in fields.items():
+                setattr(facture, field, value)
+
+            stored = {
+                item.idsupplierfactitem: item
+                for item in db.query(SupplierFactItem).filter(SupplierFactItem.idsupplierfacture == facture_id)
+            }
+            to_insert, to_update, kept = [], [], set()
+            for item in items:
+                values = {field: item.get(field) for field in ITEM_FIELDS}
+                current = stored.get(item.get('idsupplierfactitem'))
+                if current is None:
+                    to_insert.append({'idsupplier': facture.idsupplier, 'idsupplierfacture': facture_id, **values})
+                    continue
+                kept.add(current.idsupplierfactitem)
+                if any(not _same_value(getattr(current, field), value) for field, value in values.items()):
+                    to_update.append({'idsupplierfactitem': current.idsupplierfactitem, **values})
+            to_delete = [item_id for item_id in stored if item_id not in kept]
+
+            if to_update:
+                db.execute(update(SupplierFactItem), to_update)
+            if to_insert:
+                db.execute(insert(SupplierFactItem), to_insert)
+            if to_delete:
+                db.query(SupplierFactItem).filter(
+                    SupplierFactItem.idsupplierfactitem.in_(to_delete)
+                ).delete(synchronize_session=False)
+
+        FactureService.invalidate_detail(facture_id)
+        # Amounts or date may have changed: recount this supplier only
+        SupplierStats.refresh([supplier_id])
+        result = {'inserted': len(to_insert), 'updated': len(to_update), 'deleted': len(to_delete)}
+        logger.info(f"Facture {facture_id} saved: {result}")
+        return result
+
+
+def _facture_to_dict(facture, supplier_name: Optional[str]) -> dict:
+    return {
+        'idFacture': facture.idFacture,
+        'idsupplier': facture.idsupplier,
+        'supplier_name': supplier_name,
+        'factNum': facture.factNum,
+        'factDate': facture.factDate.strftime('%Y-%m-%d') if facture.factDate else None,
+        'factmontantHT': float(facture.factmontantHT or 0),
+        'factmontantTVA': float(facture.factmontantTVA or 0),
+        'factmontantttc': float(facture.factmontantttc or 0),
+        'filename': facture.filename,
+    }
+
+
+def _same_value(stored, submitted) -> bool:
+    """Compare a stored column value with a submitted one (Decimal vs float, int vs str IDs)."""
+    if stored is None or submitted is None:
+        return stored is None and submitted is None
+    try:
+        return abs(float(stored) - float(submitted)) < 1e-9
+    except (TypeError, ValueError):
+        return stored == submitted
+
+
+def _drop_detail(facture_id: Optional[int] = None) -> None:
+    with _detail_lock:
+        if facture_id is None:
+            _detail_cache.clear()
+        else:
+            _detail_cache.pop(facture_id, None)
+
+
+# Factures written by other workers
+SharedCache.subscribe('facture_detail', _drop_detail)
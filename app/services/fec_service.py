@@ -0,0 +1,292 @@
+"""FEC (Fichier des Écritures Comptables) export, streamed journal by journal."""
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, Iterator, Optional
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func
+
+from app.database import get_db
+from app.logging_config import get_logger
+from app.models import BankInstruction, Supplier, SupplierFacture
+from app.services.sales_service import SalesService
+
+logger = get_logger(__name__)
+
+# FEC settings - configurable via environment variables
+FEC_SIREN = os.environ.get('FEC_SIREN', '000000000')
+# First month of the fiscal year (1 = calendar year)
+FISCAL_YEAR_START_MONTH = int(os.environ.get('FISCAL_YEAR_START_MONTH', '1'))
+# Rows fetched per round trip from the server-side cursors
+FEC_BATCH_SIZE = 2000
+# FEC lines written between two yielded chunks
+CHUNK_LINES = 2000
+# The norm allows ASCII, ISO 8859-15 or EBCDIC
+FEC_ENCODING = 'iso-8859-15'
+FEC_MEDIA_TYPE = 'text/plain; charset=iso-8859-15'
+# Largest HT + TVA vs TTC difference of a facture posted as a rounding gap (658/758);
+# factures further off must be corrected before the FEC can be exported
+MAX_ROUNDING_GAP = Decimal('0.05')
+
+# The 18 mandatory columns (article A47 A-1 of the Livre des procédures fiscales), in order
+FEC_COLUMNS = ('JournalCode', 'JournalLib', 'EcritureNum', 'EcritureDate', 'CompteNum', 'CompteLib',
+               'CompAuxNum', 'CompAuxLib', 'PieceRef', 'PieceDate', 'EcritureLib', 'Debit', 'Credit',
+               'EcritureLet', 'DateLet', 'ValidDate', 'Montantdevise', 'Idevise')
+
+# Journals, in export order: code -> label
+JOURNALS = {'AC': 'Achats', 'VE': 'Ventes', 'BQ': 'Banque'}
+
+# Chart of accounts used by the entries: number -> label
+ACCOUNTS = {
+    'purchases': ('607000', 'Achats de marchandises'),
+    'deductible_vat': ('445660', 'TVA déductible sur autres biens et services'),
+    'suppliers': ('401000', 'Fournisseurs'),
+    'sales': ('707000', 'Ventes de marchandises'),
+    'bank': ('512000', 'Banque'),
+    'suspense': ('471000', "Compte d'attente"),
+    'rounding_loss': ('658000', 'Charges diverses de gestion courante'),
+    'rounding_gain': ('758000', 'Produits divers de gestion courante'),
+}
+# Sales payment type -> account receiving the takings
+PAYMENT_ACCOUNTS = {
+    'CB': ('511200', 'Cartes bancaires à encaisser'),
+    'CASH': ('530000', 'Caisse'),
+    'CHEQUE': ('511100', 'Chèques à encaisser'),
+    'TR': ('511300', 'Titres-restaurant à encaisser'),
+    'AX': ('511400', 'American Express à encaisser'),
+    'CTR': ('511800', 'Autres valeurs à encaisser'),
+}
+
+_CENT = Decimal('0.01')
+_ZERO = Decimal('0.00')
+
+
+class FecBalanceError(ValueError):
+    """An entry or a journal whose debits and credits differ."""
+
+
+class FecService:
+    """Build the FEC of a fiscal year from factures, sales payments and bank transactions.
+
+    Lines are produced as the database cursors are read, so memory does not
+    grow with the year; every entry is checked to balance when it is
+    complete, and every journal when it ends.
+    """
+
+    @staticmethod
+    def fiscal_year(year: int) -> tuple[date, date]:
+        """First and last day of the fiscal year starting in `year`."""
+        start = date(year, FISCAL_YEAR_START_MONTH, 1)
+        return start, start + relativedelta(years=1, days=-1)
+
+    @staticmethod
+    def filename(year: int) -> str:
+        """Name required by the norm: <SIREN>FEC<closing date AAAAMMJJ>.txt"""
+        return f'{FEC_SIREN}FEC{FecService.fiscal_year(year)[1]:%Y%m%d}.txt'
+
+    @staticmethod
+    def unbalanced_factures(year: int) -> list[dict]:
+        """Factures of a fiscal year whose HT + TVA differs from TTC by more than MAX_ROUNDING_GAP.
+
+        Their entries cannot balance: the FEC is only exported once they are
+        corrected.
+        """
+        date_from, date_to = FecService.fiscal_year(year)
+        ht = func.round(func.coalesce(SupplierFacture.factmontantHT, 0), 2)
+        tva = func.round(func.coalesce(SupplierFacture.factmontantTVA, 0), 2)
+        ttc = func.round(func.coalesce(SupplierFacture.factmontantttc, 0), 2)
+        with get_db() as db:
+            rows = db.query(
+                SupplierFacture.idFacture, SupplierFacture.factNum, SupplierFacture.factDate, Supplier.name,
+                SupplierFacture.factmontantHT, SupplierFacture.factmontantTVA, SupplierFacture.factmontantttc,
+            ).outerjoin(
+                Supplier, Supplier.idsupplier == SupplierFacture.idsupplier
+            ).filter(
+                SupplierFacture.factDate >= date_from, SupplierFacture.factDate <= date_to,
+                func.abs(ht + tva - ttc) > MAX_ROUNDING_GAP,
+            ).order_by(SupplierFacture.factDate, SupplierFacture.idFacture).all()
+        return [
+            {'idFacture': facture_id, 'factNum': number, 'factDate': _fec_date(_as_date(fact_date)),
+             'supplier_name': supplier_name, 'ht': float(_amount(ht)), 'tva': float(_amount(tva)),
+             'ttc': float(_amount(ttc))}
+            for facture_id, number, fact_date, supplier_name, ht, tva, ttc in rows
+        ]
+
+    @staticmethod
+    def iter_lines(year: int) -> Iterator[str]:
+        """Stream the FEC lines of a fiscal year, header first.
+
+        Journals come one after the other (AC, VE, BQ), each in date order,
+        with entries numbered per journal. Lines are tab separated, with
+        decimal commas and AAAAMMJJ dates.
+
+        Raises:
+            FecBalanceError: An entry or journal does not balance; lines
+                already yielded must be discarded
+        """
+        date_from, date_to = FecService.fiscal_year(year)
+        sources = {
+            'AC': _purchase_entries(date_from, date_to),
+            'VE': _sales_entries(date_from, date_to),
+            'BQ': _bank_entries(date_from, date_to),
+        }
+        yield '\t'.join(FEC_COLUMNS)
+        for code, label in JOURNALS.items():
+            yield from _journal_lines(code, label, sources[code])
+
+    @staticmethod
+    def chunks(year: int) -> Iterator[bytes]:
+        """The FEC file of a fiscal year, encoded, CHUNK_LINES lines at a time."""
+        lines = []
+        for line in FecService.iter_lines(year):
+            lines.append(line)
+            if len(lines) >= CHUNK_LINES:
+                yield ('\r\n'.join(lines) + '\r\n').encode(FEC_ENCODING, errors='replace')
+                lines.clear()
+        if lines:
+            yield ('\r\n'.join(lines) + '\r\n').encode(FEC_ENCODING, errors='replace')
+
+
+# An entry: (date, piece reference, label, [(account, label, aux number, aux label, debit, credit), ...])
+
+def _journal_lines(code: str, label: str, entries: Iterable[tuple]) -> Iterator[str]:
+    """Number and format the entries of a journal, checking they, and the journal, balance."""
+    total_debit = total_credit = _ZERO
+    count = 0
+    for count, (entry_date, piece_ref, entry_label, lines) in enumerate(entries, 1):
+        number = f'{code}{count:06d}'
+        debit = sum((line[4] for line in lines), _ZERO)
+        credit = sum((line[5] for line in lines), _ZERO)
+        if debit != credit:
+            raise FecBalanceError(f"Entry {number} ({piece_ref}) does not balance: debit {debit}, credit {credit}")
+        total_debit += debit
+        total_credit += credit
+        # Columns shared by the lines of the entry are formatted once
+        day = _fec_date(entry_date)
+        head = f'{code}\t{label}\t{number}\t{day}\t'
+        piece = f'\t{_fec_text(piece_ref)}\t{day}\t{_fec_text(entry_label)}\t'
+        tail = f'\t\t\t{day}\t\t'
+        for account, account_label, aux_num, aux_label, line_debit, line_credit in lines:
+            yield (f'{head}{account}\t{account_label}\t{_fec_text(aux_num)}\t{_fec_text(aux_label)}'
+                   f'{piece}{_fec_amount(line_debit)}\t{_fec_amount(line_credit)}{tail}')
+    if total_debit != total_credit:
+        raise FecBalanceError(f"Journal {code} does not balance: debit {total_debit}, credit {total_credit}")
+    logger.info(f"FEC journal {code}: {count} entries, {total_debit} debit/credit")
+
+
+def _purchase_entries(date_from: date, date_to: date) -> Iterator[tuple]:
+    """One entry per supplier facture: HT and TVA debited, TTC credited to the supplier.
+
+    A rounding gap between HT + TVA and TTC (up to MAX_ROUNDING_GAP) is
+    posted to the rounding loss or gain account so the entry balances.
+    """
+    purchases, vat, suppliers = ACCOUNTS['purchases'], ACCOUNTS['deductible_vat'], ACCOUNTS['suppliers']
+    loss, gain = ACCOUNTS['rounding_loss'], ACCOUNTS['rounding_gain']
+    with get_db() as db:
+        query = db.query(
+            SupplierFacture.idFacture, SupplierFacture.factNum, SupplierFacture.factDate,
+            SupplierFacture.idsupplier, Supplier.name, SupplierFacture.factmontantHT,
+            SupplierFacture.factmontantTVA, SupplierFacture.factmontantttc,
+        ).outerjoin(
+            Supplier, Supplier.idsupplier == SupplierFacture.idsupplier
+        ).filter(
+            SupplierFacture.factDate >= date_from, SupplierFacture.factDate <= date_to
+        ).order_by(SupplierFacture.factDate, SupplierFacture.idFacture)
+
+        for facture_id, number, fact_date, supplier_id, supplier_name, ht, tva, ttc in query.execution_options(
+                stream_results=True, yield_per=FEC_BATCH_SIZE):
+            ht, tva, ttc = _amount(ht), _amount(tva), _amount(ttc)
+            piece_ref = number or str(facture_id)
+            aux_num = f'F{supplier_id}' if supplier_id is not None else ''
+            aux_label = supplier_name or ''
+            lines = [(*purchases, '', '', ht, _ZERO)]
+            if tva:
+                lines.append((*vat, '', '', tva, _ZERO))
+            gap = ttc - ht - tva
+            if gap and abs(gap) <= MAX_ROUNDING_GAP:
+                lines.append((*loss, '', '', gap, _ZERO) if gap > 0 else (*gain, '', '', _ZERO, -gap))
+            lines.append((*suppliers, aux_num, aux_label, _ZERO, ttc))
+            yield _as_date(fact_date), piece_ref, f'Facture {piece_ref} {aux_label}'.strip(), _signed(lines)
+
+
+def _sales_entries(date_from: date, date_to: date) -> Iterator[tuple]:
+    """One entry per day of sales: takings debited by payment type, sales credited.
+
+    Core only returns sales payments as lists, so they are read a month at a
+    time to keep memory bounded.
+    """
+    sales = ACCOUNTS['sales']
+    month = date_from
+    while month <= date_to:
+        month_end = min(month + relativedelta(months=1, days=-1), date_to)
+        days: dict[str, dict[str, Decimal]] = {}
+        for payment in SalesService.get_payments_for_date_range(month, month_end):
+            day = str(payment.get('startDate') or '')[:10]
+            if not day:
+                continue
+            totals = days.setdefault(day, {})
+            for payment_type in PAYMENT_ACCOUNTS:
+                totals[payment_type] = totals.get(payment_type, _ZERO) + _amount(payment.get(payment_type))
+        for day in sorted(days):
+            lines = [(*PAYMENT_ACCOUNTS[payment_type], '', '', amount, _ZERO)
+                     for payment_type, amount in days[day].items() if amount]
+            if not lines:
+                continue
+            total = sum((line[4] for line in lines), _ZERO)
+            lines.append((*sales, '', '', _ZERO, total))
+            yield datetime.strptime(day, '%Y-%m-%d').date(), f'Z{day.replace("-", "")}', f'Ventes du {day}', \
+                _signed(lines)
+        month += relativedelta(months=1)
+
+
+def _bank_entries(date_from: date, date_to: date) -> Iterator[tuple]:
+    """One entry per bank transaction, against the suspense account until it is allocated."""
+    bank, suspense = ACCOUNTS['bank'], ACCOUNTS['suspense']
+    with get_db() as db:
+        query = db.query(
+            BankInstruction.TransactionID, BankInstruction.Date_de_comptabilisation, BankInstruction.Libelle,
+            BankInstruction.Reference, BankInstruction.Montant,
+        ).filter(
+            BankInstruction.Date_de_comptabilisation >= date_from,
+            BankInstruction.Date_de_comptabilisation <= date_to,
+        ).order_by(BankInstruction.Date_de_comptabilisation, BankInstruction.TransactionID)
+
+        for transaction_id, booked, libelle, reference, montant in query.execution_options(
+                stream_results=True, yield_per=FEC_BATCH_SIZE):
+            amount = _amount(montant)
+            if not amount:
+                continue
+            lines = [(*bank, '', '', amount, _ZERO), (*suspense, '', '', _ZERO, amount)]
+            yield _as_date(booked), reference or str(transaction_id), libelle or '', _signed(lines)
+
+
+def _signed(lines: list[tuple]) -> list[tuple]:
+    """Move negative amounts to the other side: FEC debits and credits are positive."""
+    return [(*line[:4], abs(line[5]), abs(line[4])) if line[4] < 0 or line[5] < 0 else line for line in lines]
+
+
+def _amount(value) -> Decimal:
+    if value is None:
+        return _ZERO
+    amount = Decimal(str(value)).quantize(_CENT)
+    # No "-0,00" in the file
+    return amount if amount else _ZERO
+
+
+def _as_date(value) -> Optional[date]:
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _fec_date(value: Optional[date]) -> str:
+    return f'{value.year:04d}{value.month:02d}{value.day:02d}' if value else ''
+
+
+def _fec_amount(value: Decimal) -> str:
+    # Amounts are already quantized to cents
+    return str(value).replace('.', ',')
+
+
+def _fec_text(value: str) -> str:
+    # Tabs and line breaks would shift the columns
+    return ' '.join(value.split()) if value else ''
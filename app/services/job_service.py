@@ -0,0 +1,365 @@
+"""In-process background jobs with progress, cancellation and a persistent history."""
+import contextvars
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.logging_config import get_logger
+from app.shared_cache import SharedCache
+from app.tracing import span
+from app.workers import is_worker
+
+logger = get_logger(__name__)
+
+# Job history database - configurable via environment variable
+JOBS_DB_PATH = os.environ.get('JOBS_DB_PATH', 'jobs.sqlite3')
+# Long jobs run side by side with at most this many others
+MAX_WORKERS = 2
+# Finished jobs kept in memory for pages still polling them
+MAX_FINISHED_IN_MEMORY = 100
+# An exclusive group's shared lock expires this long after its last renewal, so a worker
+# dying mid-job does not block the group; running jobs renew it every third of that
+EXCLUSIVE_LOCK_TTL = 60.0  # seconds
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+INTERRUPTED = 'interrupted'
+FINISHED_STATUSES = {DONE, FAILED, CANCELLED, INTERRUPTED}
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation was requested."""
+
+
+class JobContext:
+    """Handle given to a running job to report progress and check for cancellation."""
+
+    def __init__(self, job: dict, cancel_event: threading.Event):
+        self._job = job
+        self._cancel_event = cancel_event
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self) -> None:
+        """Stop the job here if cancellation was requested."""
+        if self._cancel_event.is_set():
+            raise JobCancelled()
+
+    def progress(self, done: int, total: int, message: Optional[str] = None) -> None:
+        """Report that `done` out of `total` steps are complete."""
+        with JobService._lock:
+            self._job['done'] = done
+            self._job['total'] = total
+            if message is not None:
+                self._job['message'] = message
+
+
+class JobService:
+    """Runs long operations on a worker pool so the UI stays responsive.
+
+    Jobs are plain functions taking a :class:`JobContext` as first argument.
+    Their state (progress, result, error) is kept in memory for live display
+    and recorded in a local SQLite table, so the history survives restarts.
+    """
+
+    _executor: Optional[ThreadPoolExecutor] = None
+    _jobs: dict[int, dict] = {}
+    _cancel_events: dict[int, threading.Event] = {}
+    _lock = threading.RLock()
+    # Exclusive groups with a queued or running job in this worker
+    _claimed: set[str] = set()
+    _ids = itertools.count(1)
+    _db_ready = False
+    # History updates, written by the 'job-history' thread: (job ID, column values)
+    _writes: queue.SimpleQueue = queue.SimpleQueue()
+    _writer: Optional[threading.Thread] = None
+    _renewer: Optional[threading.Thread] = None
+
+    @staticmethod
+    def submit(kind: str, func: Callable[..., Any], description: str = '', exclusive: Optional[str] = None,
+               **params) -> Optional[int]:
+        """Queue a job.
+
+        Args:
+            kind: Job type (e.g. 'resolve', 'undo', 'purge')
+            func: Function called as func(context, **params); its return value
+                (JSON serializable) is recorded as the job result
+            description: Human readable summary shown in the UI
+            exclusive: Group of jobs that must never run concurrently, in this
+                worker or any other (e.g. 'staging')
+            **params: Job parameters, recorded with the job
+
+        Returns:
+            Job ID, or None if a job of the same exclusive group is still
+            queued or running
+        """
+        if exclusive is not None and not JobService._claim(exclusive):
+            logger.info(f"Job {kind} not queued: a {exclusive} job is already running")
+            return None
+        job = {
+            'id': None,
+            'kind': kind,
+            'description': description or kind,
+            'params': params,
+            'status': QUEUED,
+            'done': 0,
+            'total': 0,
+            'message': '',
+            'result': None,
+            'error': None,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'exclusive': exclusive,
+        }
+        job['id'] = JobService._insert(job)
+        cancel_event = threading.Event()
+        with JobService._lock:
+            JobService._jobs[job['id']] = job
+            JobService._cancel_events[job['id']] = cancel_event
+            if JobService._executor is None:
+                JobService._executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='job')
+            # The job's spans join the trace of the UI event that submitted it
+            JobService._executor.submit(contextvars.copy_context().run, JobService._run, job, func,
+                                        JobContext(job, cancel_event))
+        logger.info(f"Job {job['id']} ({kind}) queued: {job['description']}")
+        return job['id']
+
+    @staticmethod
+    def get(job_id: int) -> Optional[dict]:
+        """Get a snapshot of a job (from memory, or the history for old jobs)."""
+        with JobService._lock:
+            job = JobService._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        rows = JobService._query('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        return rows[0] if rows else None
+
+    @staticmethod
+    def cancel(job_id: int) -> bool:
+        """Request cancellation; the job stops at its next checkpoint."""
+        with JobService._lock:
+            job = JobService._jobs.get(job_id)
+            event = JobService._cancel_events.get(job_id)
+            if job is None or event is None or job['status'] in FINISHED_STATUSES:
+                return False
+            event.set()
+            job['message'] = 'Cancelling...'
+        logger.info(f"Job {job_id} cancellation requested")
+        return True
+
+    @staticmethod
+    def active(kind: Optional[str] = None) -> list[dict]:
+        """Get queued and running jobs, oldest first."""
+        with JobService._lock:
+            return [dict(job) for job in JobService._jobs.values()
+                    if job['status'] not in FINISHED_STATUSES and (kind is None or job['kind'] == kind)]
+
+    @staticmethod
+    def history(limit: int = 50) -> list[dict]:
+        """Get the most recent jobs, newest first."""
+        return JobService._query('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,))
+
+    @staticmethod
+    def init_history() -> None:
+        """Create the history table, mark jobs of previous processes as interrupted and free their groups.
+
+        Runs on first use; in multi-worker mode the supervisor calls it once
+        instead, as a worker starting up must not touch its siblings' jobs.
+        """
+        conn = sqlite3.connect(JOBS_DB_PATH, timeout=10)
+        try:
+            with conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        kind TEXT NOT NULL,
+                        description TEXT,
+                        params TEXT,
+                        status TEXT NOT NULL,
+                        done INTEGER,
+                        total INTEGER,
+                        result TEXT,
+                        error TEXT,
+                        created_at REAL,
+                        started_at REAL,
+                        finished_at REAL
+                    )
+                ''')
+                if not is_worker():
+                    # Jobs of a previous process that never finished
+                    conn.execute('UPDATE jobs SET status = ? WHERE status IN (?, ?)', (INTERRUPTED, QUEUED, RUNNING))
+        finally:
+            conn.close()
+        if not is_worker():
+            # ... and the exclusive groups they held
+            SharedCache.clear_locks('job:')
+        JobService._db_ready = True
+
+    @staticmethod
+    def _run(job: dict, func: Callable[..., Any], context: JobContext) -> None:
+        with JobService._lock:
+            if context.cancelled:
+                job['status'] = CANCELLED
+            else:
+                job['status'] = RUNNING
+                job['started_at'] = time.time()
+        if job['status'] == RUNNING:
+            JobService._record(job)
+            try:
+                with span(f"job {job['kind']}", **{'job.id': job['id']}):
+                    result = func(context, **job['params'])
+                with JobService._lock:
+                    job['result'] = result
+                    job['status'] = DONE
+            except JobCancelled:
+                with JobService._lock:
+                    job['status'] = CANCELLED
+            except Exception as e:
+                logger.exception(f"Job {job['id']} ({job['kind']}) failed")
+                with JobService._lock:
+                    job['error'] = str(e)
+                    job['status'] = FAILED
+
+        with JobService._lock:
+            job['finished_at'] = time.time()
+            job['message'] = ''
+            JobService._cancel_events.pop(job['id'], None)
+            JobService._forget_old_jobs()
+            if job['exclusive'] is not None:
+                JobService._claimed.discard(job['exclusive'])
+                SharedCache.release(f"job:{job['exclusive']}")
+        JobService._record(job)
+        logger.info(f"Job {job['id']} ({job['kind']}) {job['status']}")
+
+    @staticmethod
+    def _claim(group: str) -> bool:
+        """Reserve an exclusive group for a new job, in this worker and in the shared store."""
+        with JobService._lock:
+            if group in JobService._claimed or not SharedCache.acquire(f'job:{group}', EXCLUSIVE_LOCK_TTL):
+                return False
+            JobService._claimed.add(group)
+            if JobService._renewer is None:
+                JobService._renewer = threading.Thread(target=JobService._renew_loop, name='job-locks', daemon=True)
+                JobService._renewer.start()
+            return True
+
+    @staticmethod
+    def _renew_loop() -> None:
+        """Keep the shared locks of the exclusive groups running here from expiring."""
+        while True:
+            time.sleep(EXCLUSIVE_LOCK_TTL / 3)
+            with JobService._lock:
+                groups = list(JobService._claimed)
+            for group in groups:
+                SharedCache.renew(f'job:{group}', EXCLUSIVE_LOCK_TTL)
+
+    @staticmethod
+    def _forget_old_jobs() -> None:
+        finished = [job_id for job_id, job in JobService._jobs.items() if job['status'] in FINISHED_STATUSES]
+        for job_id in finished[:-MAX_FINISHED_IN_MEMORY]:
+            del JobService._jobs[job_id]
+
+    @staticmethod
+    def _connect() -> sqlite3.Connection:
+        conn = sqlite3.connect(JOBS_DB_PATH, timeout=10)
+        conn.row_factory = sqlite3.Row
+        if not JobService._db_ready:
+            JobService.init_history()
+        return conn
+
+    @staticmethod
+    def _values(job: dict) -> tuple:
+        """Snapshot of a job's history columns (taken under the lock: jobs change while running)."""
+        with JobService._lock:
+            return (
+                job['kind'], job['description'], json.dumps(job['params'], default=str), job['status'],
+                job['done'], job['total'], json.dumps(job['result'], default=str), job['error'],
+                job['created_at'], job['started_at'], job['finished_at'],
+            )
+
+    @staticmethod
+    def _insert(job: dict) -> int:
+        """Add a new job to the history; returns its ID."""
+        values = JobService._values(job)
+        try:
+            conn = JobService._connect()
+            try:
+                with conn:
+                    return conn.execute(
+                        'INSERT INTO jobs (kind, description, params, status, done, total, result, error, '
+                        'created_at, started_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        values
+                    ).lastrowid
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            # History is best effort: never fail a job because it could not be recorded
+            logger.error(f"Could not record job in {JOBS_DB_PATH}: {e}")
+            return -next(JobService._ids)
+
+    @staticmethod
+    def _record(job: dict) -> None:
+        """Queue an update of a job's history row; the disk write happens in the 'job-history' thread."""
+        if job['id'] < 0:
+            return  # Never made it to the history
+        JobService._writes.put((job['id'], JobService._values(job)))
+        if JobService._writer is None:
+            with JobService._lock:
+                if JobService._writer is None:
+                    JobService._writer = threading.Thread(target=JobService._write_loop, name='job-history',
+                                                          daemon=True)
+                    JobService._writer.start()
+
+    @staticmethod
+    def _write_loop() -> None:
+        while True:
+            updates = [JobService._writes.get()]
+            while not JobService._writes.empty():
+                updates.append(JobService._writes.get())
+            # Only the latest state of each job matters
+            latest = {job_id: values for job_id, values in updates}
+            try:
+                conn = JobService._connect()
+                try:
+                    with conn:
+                        conn.executemany(
+                            'UPDATE jobs SET kind = ?, description = ?, params = ?, status = ?, done = ?, total = ?, '
+                            'result = ?, error = ?, created_at = ?, started_at = ?, finished_at = ? WHERE id = ?',
+                            [values + (job_id,) for job_id, values in latest.items()]
+                        )
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Could not record job in {JOBS_DB_PATH}: {e}")
+
+    @staticmethod
+    def _query(sql: str, params: tuple) -> list[dict]:
+        try:
+            conn = JobService._connect()
+            try:
+                rows = conn.execute(sql, params).fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.error(f"Could not read job history from {JOBS_DB_PATH}: {e}")
+            return []
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job['params'] = json.loads(job['params']) if job['params'] else {}
+            job['result'] = json.loads(job['result']) if job['result'] else None
+            job['message'] = ''
+            jobs.append(job)
+        return jobs
@@ -0,0 +1,131 @@
+"""Dashboard KPIs computed from cached monthly rollups."""
+import threading
+import time
+from datetime import date
+from typing import Optional
+
+from dateutil.relativedelta import relativedelta
+
+from app.logging_config import get_logger
+from app.services.bank_instruction_service import BankInstructionService
+from app.services.facture_service import FactureService
+from app.services.newproducts_service import NewProductsService
+from app.services.sales_service import SalesService
+
+logger = get_logger(__name__)
+
+# Age after which the figures are recomputed (in the background)
+KPI_TTL = 300.0  # seconds
+# Sales payment columns, in display order
+PAYMENT_TYPES = ('CB', 'CASH', 'CHEQUE', 'TR', 'AX', 'CTR')
+
+# Last computed KPI set and when it was computed
+_kpis = {'data': None, 'computed_at': 0.0, 'refreshing': False}
+_lock = threading.Lock()
+
+
+class KpiService:
+    """Key figures for the dashboard, served from memory.
+
+    Month rollups (bank summaries come from BankInstructionService's
+    per-month cache), pending staging count and recent factures are
+    recomputed at most every KPI_TTL seconds, in a background thread, while
+    the previous values keep being served (stale-while-revalidate).
+    """
+
+    @staticmethod
+    def get_dashboard(wait: bool = True) -> Optional[dict]:
+        """Get the dashboard KPIs.
+
+        Args:
+            wait: Compute them synchronously if nothing is cached yet;
+                otherwise return None and let a background refresh run
+
+        Returns:
+            Dict with 'month', 'previous_month' (date of the first day),
+            'bank' and 'sales' ({'current', 'previous'} rollups),
+            'pending_staging', 'recent_factures' and 'computed_at', or None
+        """
+        with _lock:
+            data = _kpis['data']
+            stale = data is None or time.monotonic() - _kpis['computed_at'] > KPI_TTL
+            start_refresh = stale and not _kpis['refreshing'] and (data is not None or not wait)
+            if start_refresh:
+                _kpis['refreshing'] = True
+        if start_refresh:
+            threading.Thread(target=KpiService._refresh, name='kpi-refresh', daemon=True).start()
+        if data is None and wait:
+            return KpiService.refresh()
+        return data
+
+    @staticmethod
+    def is_warm() -> bool:
+        """Whether KPIs are cached (the dashboard can render them without waiting)."""
+        return _kpis['data'] is not None
+
+    @staticmethod
+    def payment_types() -> tuple[str, ...]:
+        """Sales payment types, in display order."""
+        return PAYMENT_TYPES
+
+    @staticmethod
+    def refresh() -> dict:
+        """Recompute the KPIs now."""
+        started = time.perf_counter()
+        today = date.today()
+        current = today.replace(day=1)
+        previous = current - relativedelta(months=1)
+        data = {
+            'month': current,
+            'previous_month': previous,
+            'bank': {
+                'current': _bank_rollup(current),
+                'previous': _bank_rollup(previous),
+            },
+            'sales': {
+                'current': _sales_rollup(current, today),
+                'previous': _sales_rollup(previous, current - relativedelta(days=1)),
+            },
+            'pending_staging': NewProductsService.get_pending_count(),
+            'recent_factures': FactureService.get_recent(5),
+            'computed_at': time.time(),
+        }
+        with _lock:
+            _kpis['data'] = data
+            _kpis['computed_at'] = time.monotonic()
+            _kpis['refreshing'] = False
+        logger.info(f"Dashboard KPIs computed in {time.perf_counter() - started:.2f}s")
+        return data
+
+    @staticmethod
+    def _refresh() -> None:
+        try:
+            KpiService.refresh()
+        except Exception as e:
+            logger.error(f"Dashboard KPI refresh failed: {e}")
+            with _lock:
+                _kpis['refreshing'] = False
+
+
+def _bank_rollup(month: date) -> dict:
+    """Bank inflow/outflow of a month, in total and by category."""
+    rollup = {'IN': {}, 'OUT': {}, 'total_in': 0.0, 'total_out': 0.0}
+    for row in BankInstructionService.get_monthly_summary(month.month, month.year):
+        kind = 'IN' if row.get('Type') == 'IN' else 'OUT'
+        amount = float(row.get('Montant') or 0)
+        name = row.get('Name') or '-'
+        rollup[kind][name] = rollup[kind].get(name, 0.0) + amount
+        rollup['total_in' if kind == 'IN' else 'total_out'] += amount
+    return rollup
+
+
+def _sales_rollup(month: date, until: date) -> dict:
+    """Sales totals of a month by payment type."""
+    rollup = {payment_type: 0.0 for payment_type in PAYMENT_TYPES}
+    rollup['total'] = 0.0
+    for day in SalesService.get_payments_for_date_range(month, until):
+        for payment_type in PAYMENT_TYPES:
+            rollup[payment_type] += float(day.get(payment_type) or 0)
+        rollup['total'] += float(day.get('TotalCaisse') or 0)
+    return rollup
+
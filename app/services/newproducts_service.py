@@ -1,12 +1,29 @@
+import threading
+from decimal import Decimal
 from typing import Optional
 
+from sqlalchemy import and_, func, insert, inspect, update
+
 from analysercomptacore.services import SupplierService as CoreSupplierService
 from analysercomptacore.models.suppliers import NEWPRODUCT_STATUS_CHOICES
 from app.database import get_db
 from app.logging_config import get_logger
+from app.models import SupplierNewProducts, SupplierProduct
+from app.services.facture_service import FactureService
+from app.services.job_service import JobContext
+from app.services.product_service import ProductService
+from app.services.staging_resolver import VERSIONED_FIELDS, execute_plan, plan_resolution, row_version
+from app.services.supplier_stats import SupplierStats
 
 logger = get_logger(__name__)
 
+# Consistency results per staging row: {row_id: (row fingerprint, existing product ID or None)}
+_consistency_cache: dict[int, tuple[tuple, Optional[int]]] = {}
+_consistency_state = {'catalog_version': None}
+_consistency_lock = threading.Lock()
+# Safety valve: forget everything rather than grow without bound
+MAX_CONSISTENCY_CACHE = 100_000
+
 
 class NewProductsService:
     """Service for SupplierNewProducts operations - wraps Core's SupplierService."""
@@ -50,6 +67,124 @@ class NewProductsService:
         with get_db() as db:
             return CoreSupplierService.update_staging(db, product_id, **kwargs)
 
+    @staticmethod
+    def get_many(product_ids: list[int]) -> list[dict]:
+        """Get several new products by ID (missing IDs are skipped)."""
+        with get_db() as db:
+            rows = [CoreSupplierService.get_staging_by_id(db, product_id) for product_id in product_ids]
+        return [row for row in rows if row]
+
+    @staticmethod
+    def row_version(row: dict) -> str:
+        """Version token of a staging row, as loaded by get_all().
+
+        Pass it back to bulk_save() to detect edits made by someone else in
+        the meantime.
+        """
+        return row_version(row.get(f) for f in VERSIONED_FIELDS)
+
+    @staticmethod
+    def bulk_save(updates: dict[int, dict], creates: Optional[dict[int, dict]] = None,
+                  versions: Optional[dict[int, str]] = None) -> dict:
+        """Apply many staging edits and inserts in a single transaction.
+
+        Updates are sent as one executemany per set of changed fields, and new
+        rows as one multi-row INSERT. Invalid rows (unknown ID or field, or a
+        numeric field that is not a number) are reported and skipped; if the
+        database rejects a batch, the whole transaction is rolled back and
+        every row is reported as failed.
+
+        When versions are given, the rows to update are locked and their
+        current version compared with the one the caller loaded: rows changed
+        in the meantime are left untouched and reported as conflicts, the
+        others are saved.
+
+        Args:
+            updates: {idsuppliernewproducts: {field: value}} for existing rows
+            creates: {temporary key: {field: value}} for new rows
+            versions: {idsuppliernewproducts: row_version()} as loaded
+
+        Returns:
+            Dict with 'updated' (list of row IDs), 'created' (list of temporary
+            keys), 'conflicts' (list of row IDs changed by someone else) and
+            'errors' ({row ID or temporary key: message})
+        """
+        creates = creates or {}
+        versions = versions or {}
+        columns = _staging_columns()
+        errors = {}
+        conflicts = []
+
+        update_params = []
+        for row_id, changes in updates.items():
+            unknown = set(changes) - columns.keys()
+            if unknown:
+                errors[row_id] = f"Unknown field(s): {', '.join(sorted(unknown))}"
+                continue
+            try:
+                coerced = {f: _coerce(columns[f], v) for f, v in changes.items()}
+            except ValueError as e:
+                # Would fail the whole batched transaction
+                errors[row_id] = str(e)
+                continue
+            update_params.append({'idsuppliernewproducts': row_id, **coerced})
+
+        insert_keys, insert_params = [], []
+        for key, values in creates.items():
+            # Joined/display fields (supplier_name, facture_filename...) are not columns
+            try:
+                params = {f: _coerce(columns[f], v) for f, v in values.items()
+                          if f in columns and f != 'idsuppliernewproducts'}
+            except ValueError as e:
+                errors[key] = str(e)
+                continue
+            insert_keys.append(key)
+            insert_params.append(params)
+
+        try:
+            with get_db() as db:
+                if update_params:
+                    # Row locks (not table locks) on the rows about to change,
+                    # so nobody can slip an edit between the check and the update
+                    current = {
+                        row[0]: row_version(row[1:])
+                        for row in db.query(
+                            SupplierNewProducts.idsuppliernewproducts,
+                            *(getattr(SupplierNewProducts, f) for f in VERSIONED_FIELDS)
+                        ).filter(
+                            SupplierNewProducts.idsuppliernewproducts.in_([p['idsuppliernewproducts'] for p in update_params])
+                        ).with_for_update()
+                    }
+                    accepted = []
+                    for params in update_params:
+                        row_id = params['idsuppliernewproducts']
+                        if row_id not in current:
+                            errors[row_id] = 'Row no longer exists'
+                        elif row_id in versions and versions[row_id] != current[row_id]:
+                            conflicts.append(row_id)
+                        else:
+                            accepted.append(params)
+                    update_params = accepted
+
+                # ORM bulk UPDATE by primary key: one executemany per distinct set of fields
+                if update_params:
+                    db.execute(update(SupplierNewProducts), update_params)
+                if insert_params:
+                    _insert_rows(db, insert_params)
+        except Exception as e:
+            logger.error(f"Bulk save of staging rows failed: {e}")
+            message = str(e)
+            for params in update_params:
+                errors[params['idsuppliernewproducts']] = message
+            for key in insert_keys:
+                errors[key] = message
+            return {'updated': [], 'created': [], 'conflicts': conflicts, 'errors': errors}
+
+        updated = [p['idsuppliernewproducts'] for p in update_params]
+        logger.info(f"Bulk saved staging rows: {len(updated)} updated, {len(insert_keys)} created, "
+                    f"{len(conflicts)} conflicts, {len(errors)} errors")
+        return {'updated': updated, 'created': insert_keys, 'conflicts': conflicts, 'errors': errors}
+
     @staticmethod
     def duplicate(product_id: int) -> Optional[dict]:
         """Duplicate a new product record."""
@@ -89,10 +224,52 @@ class NewProductsService:
     @staticmethod
     def resolve_anomalies(facture_id: Optional[str] = None) -> dict:
         """Resolve new products anomalies - creates products and facture items based on status."""
+        try:
+            with get_db() as db:
+                result = CoreSupplierService.resolve_staging_anomalies(db, facture_id)
+        finally:
+            _on_resolved()
+        logger.info(f"Resolved staging anomalies: {result}")
+        return result
+
+    @staticmethod
+    def plan_resolve(facture_id: Optional[str] = None) -> dict:
+        """Dry run of resolve_anomalies_bulk(): what would be created, linked, skipped or fail.
+
+        The returned plan can be passed back to resolve_anomalies_bulk() to
+        execute it without reading the staging rows again.
+        """
         with get_db() as db:
-            result = CoreSupplierService.resolve_staging_anomalies(db, facture_id)
-            logger.info(f"Resolved staging anomalies: {result}")
-            return result
+            return plan_resolution(db, facture_id)
+
+    @staticmethod
+    def resolve_anomalies_bulk(facture_id: Optional[str] = None, job: Optional[JobContext] = None,
+                               plan: Optional[dict] = None) -> dict:
+        """Set-based variant of resolve_anomalies().
+
+        All actions are planned in memory from three reads, then applied with
+        one multi-row INSERT for products, one for facture items and one
+        UPDATE to close the rows, in a single transaction. Rows that cannot be
+        resolved (e.g. IGNORE PRODUCT without a valid product reference in
+        misc) are left untouched and counted as errors.
+
+        Args:
+            facture_id: Restrict to one facture
+            job: Optional JobContext for progress and cancellation
+            plan: Plan from plan_resolve() to execute as-is; raises
+                PlanOutdated if its rows changed in the meantime
+        """
+        try:
+            with get_db() as db:
+                if plan is None:
+                    plan = plan_resolution(db, facture_id, lock=True)
+                result = execute_plan(db, plan, job=job)
+        finally:
+            _on_resolved(_plan_suppliers(plan) if plan is not None else None)
+        for row_id, reason in plan['errors'].items():
+            logger.warning(f"Staging row {row_id} not resolved: {reason}")
+        logger.info(f"Resolved staging anomalies (bulk): {result}")
+        return result
 
     @staticmethod
     def check_product_consistency(facture_id: Optional[str] = None,
@@ -103,15 +280,161 @@ class NewProductsService:
             return CoreSupplierService.check_staging_consistency(db, facture_id, supplier_id)
 
     @staticmethod
-    def purge_closed() -> int:
-        """Delete all records with STATUS = 'CLOSED'."""
+    def find_existing_products(rows: list[dict]) -> dict[int, int]:
+        """Find staging rows to be created whose product already exists.
+
+        Incremental version of :meth:`check_product_consistency`: results are
+        cached per row fingerprint (the fields the check depends on), so only
+        rows that are new or changed since the last call are re-checked, all
+        of them with a single join query. The cache is dropped whenever the
+        product catalog changes.
+
+        Args:
+            rows: Staging row dictionaries as returned by get_all()
+
+        Returns:
+            Dict mapping idsuppliernewproducts to the existing idsupplierproduct
+            for 'CREATE PRODUCT' rows whose supplier already has a product with
+            the same code
+        """
+        catalog_version = ProductService.catalog_version()
+        with _consistency_lock:
+            if (_consistency_state['catalog_version'] != catalog_version
+                    or len(_consistency_cache) > MAX_CONSISTENCY_CACHE):
+                _consistency_cache.clear()
+                _consistency_state['catalog_version'] = catalog_version
+
+            results = {}
+            to_check = {}
+            for row in rows:
+                row_id = row['idsuppliernewproducts']
+                fingerprint = _consistency_fingerprint(row)
+                cached = _consistency_cache.get(row_id)
+                if cached is not None and cached[0] == fingerprint:
+                    if cached[1] is not None:
+                        results[row_id] = cached[1]
+                elif row.get('Status') == 'CREATE PRODUCT' and row.get('code'):
+                    to_check[row_id] = fingerprint
+                else:
+                    _consistency_cache[row_id] = (fingerprint, None)
+
+        if to_check:
+            with get_db() as db:
+                matches = dict(db.query(
+                    SupplierNewProducts.idsuppliernewproducts,
+                    func.min(SupplierProduct.idsupplierproduct)
+                ).join(
+                    SupplierProduct,
+                    and_(
+                        SupplierProduct.idsupplier == SupplierNewProducts.idsupplier,
+                        SupplierProduct.code == SupplierNewProducts.code
+                    )
+                ).filter(
+                    SupplierNewProducts.idsuppliernewproducts.in_(list(to_check)),
+                    SupplierNewProducts.Status == 'CREATE PRODUCT'
+                ).group_by(
+                    SupplierNewProducts.idsuppliernewproducts
+                ).all())
+            with _consistency_lock:
+                for row_id, fingerprint in to_check.items():
+                    _consistency_cache[row_id] = (fingerprint, matches.get(row_id))
+            results.update(matches)
+            logger.info(f"Consistency check: {len(to_check)} row(s) re-checked, {len(matches)} with existing product")
+
+        return results
+
+    @staticmethod
+    def purge_closed(job: Optional[JobContext] = None) -> int:
+        """Delete all records with STATUS = 'CLOSED'.
+
+        As a job, a cancellation requested before the transaction commits
+        rolls the purge back.
+        """
         with get_db() as db:
+            if job:
+                job.check_cancelled()
             count = CoreSupplierService.purge_closed_staging(db)
-            logger.info(f"Purged {count} CLOSED records from staging table")
-            return count
+            if job:
+                job.check_cancelled()
+        logger.info(f"Purged {count} CLOSED records from staging table")
+        return count
 
     @staticmethod
-    def undo_facture(facture_id: str) -> bool:
-        """Undo a staged facture - mark staging as OBSOLETE and delete facture items."""
+    def undo_facture(facture_id: str, job: Optional[JobContext] = None) -> bool:
+        """Undo a staged facture - mark staging as OBSOLETE and delete facture items.
+
+        As a job, a cancellation requested before the transaction commits
+        rolls the undo back.
+        """
         with get_db() as db:
-            return CoreSupplierService.undo_facture(db, facture_id)
+            if job:
+                job.check_cancelled()
+            undone = CoreSupplierService.undo_facture(db, facture_id)
+            if job:
+                job.check_cancelled()
+        FactureService.invalidate_detail()
+        SupplierStats.invalidate()
+        return undone
+
+
+def _on_resolved(supplier_ids: Optional[set] = None) -> None:
+    """Resolution creates products and facture items behind the other services' backs.
+
+    Args:
+        supplier_ids: Suppliers whose rows were touched, None if unknown
+    """
+    ProductService.invalidate_search_index()
+    FactureService.invalidate_detail()
+    if supplier_ids is None:
+        SupplierStats.invalidate()
+    else:
+        SupplierStats.refresh(supplier_ids)
+
+
+def _plan_suppliers(plan: dict) -> set:
+    """Suppliers affected by a resolution plan."""
+    return {p['idsupplier'] for p in plan['products']} | {i['idsupplier'] for i in plan['items']}
+
+
+def _consistency_fingerprint(row: dict) -> tuple:
+    """The staging fields the product consistency check depends on."""
+    return (row.get('Status'), row.get('code'), row.get('idsupplier'))
+
+
+def _staging_columns() -> dict:
+    """Column objects of the staging table, keyed by ORM attribute name."""
+    return {attr.key: attr.columns[0] for attr in inspect(SupplierNewProducts).column_attrs}
+
+
+def _coerce(column, value):
+    """Convert a value edited in the UI (often a string) to the column's type.
+
+    Raises:
+        ValueError: A numeric column given a string that is not a number
+    """
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is str or value is None:
+        return value
+    if value == '':
+        return None
+    if isinstance(value, str):
+        try:
+            return python_type(value)
+        except (TypeError, ValueError, ArithmeticError):
+            if issubclass(python_type, (int, float, Decimal)):
+                raise ValueError(f"Invalid number for {column.key}: {value!r}")
+            # Dates and the like: MySQL parses the string itself
+            return value
+    return value
+
+
+def _insert_rows(db, rows: list[dict]) -> None:
+    """Insert staging rows as multi-row INSERTs, one per distinct set of fields."""
+    by_fields: dict[tuple, list[dict]] = {}
+    for row in rows:
+        by_fields.setdefault(tuple(sorted(row)), []).append(row)
+    for batch in by_fields.values():
+        db.execute(insert(SupplierNewProducts), batch)
@@ -0,0 +1,140 @@
+"""Batch matching of staging rows against existing supplier products."""
+import heapq
+import math
+import threading
+from collections import defaultdict
+from typing import Optional
+
+from app.logging_config import get_logger
+from app.services.product_service import ProductService
+from app.services.search_index import fold
+
+logger = get_logger(__name__)
+
+# Trigrams present in more than this share of a supplier's products carry
+# almost no information; skipping them keeps scoring cheap on big catalogs
+MAX_DOCUMENT_FREQUENCY = 0.2
+# Candidates scoring below this are not worth suggesting
+MIN_SCORE = 0.3
+
+
+def _features(text: str) -> dict[str, int]:
+    """Character trigram counts of a folded designation, with word boundaries."""
+    counts: dict[str, int] = defaultdict(int)
+    for word in fold(text).split():
+        padded = f' {word} '
+        for i in range(len(padded) - 2):
+            counts[padded[i:i + 3]] += 1
+    return counts
+
+
+class _SupplierIndex:
+    """TF-IDF trigram vectors of one supplier's products, stored as an inverted index."""
+
+    def __init__(self, products: list[dict]):
+        self.products = products
+        self.by_code: dict[str, int] = {}
+        vectors = []
+        document_frequency: dict[str, int] = defaultdict(int)
+        for i, product in enumerate(products):
+            code = fold(product.get('code'))
+            if code:
+                self.by_code.setdefault(code, i)
+            features = _features(product.get('designation'))
+            vectors.append(features)
+            for gram in features:
+                document_frequency[gram] += 1
+
+        total = len(products)
+        max_df = max(1, int(total * MAX_DOCUMENT_FREQUENCY))
+        self.idf = {
+            gram: math.log((1 + total) / (1 + df)) + 1.0
+            for gram, df in document_frequency.items()
+            if df <= max_df or total < 20
+        }
+
+        # postings: trigram -> [(product index, normalized weight)]
+        self.postings: dict[str, list[tuple[int, float]]] = defaultdict(list)
+        for i, features in enumerate(vectors):
+            weights = {g: c * self.idf[g] for g, c in features.items() if g in self.idf}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for gram, weight in weights.items():
+                self.postings[gram].append((i, weight / norm))
+
+    def top_matches(self, code: Optional[str], designation: Optional[str], top_k: int) -> list[tuple[int, float]]:
+        """Best (product index, score) pairs for one staging row, score in [0, 1]."""
+        scores: dict[int, float] = defaultdict(float)
+        features = _features(designation)
+        weights = {g: c * self.idf[g] for g, c in features.items() if g in self.idf}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        for gram, weight in weights.items():
+            query_weight = weight / norm
+            for i, product_weight in self.postings.get(gram, ()):
+                scores[i] += query_weight * product_weight
+
+        # Same supplier code is the strongest signal there is
+        exact = self.by_code.get(fold(code)) if code else None
+        if exact is not None:
+            scores[exact] = 1.0
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda s: s[1])
+        return [(i, min(score, 1.0)) for i, score in best if score >= MIN_SCORE]
+
+
+class ProductMatchService:
+    """Suggests existing products for staging rows.
+
+    A normalized index of each supplier's catalog is built once (and rebuilt
+    when one of that supplier's products changes); all rows of a facture are then scored against
+    it in a single pass.
+    """
+
+    _indexes: dict[int, tuple[int, _SupplierIndex]] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def suggest(rows: list[dict], top_k: int = 3) -> dict[int, list[dict]]:
+        """Score staging rows against their supplier's products.
+
+        Args:
+            rows: Staging row dictionaries (code, designation, idsupplier)
+            top_k: Number of candidates to return per row
+
+        Returns:
+            Dict mapping idsuppliernewproducts to a list of candidates, best
+            first, each with 'idsupplierproduct', 'code', 'designation',
+            'unitprice' and 'score' (0-1)
+        """
+        by_supplier: dict[int, list[dict]] = defaultdict(list)
+        for row in rows:
+            if row.get('idsupplier'):
+                by_supplier[int(row['idsupplier'])].append(row)
+
+        suggestions = {}
+        for supplier_id, supplier_rows in by_supplier.items():
+            index = ProductMatchService._get_index(supplier_id)
+            for row in supplier_rows:
+                suggestions[row['idsuppliernewproducts']] = [
+                    {
+                        'idsupplierproduct': index.products[i]['idsupplierproduct'],
+                        'code': index.products[i].get('code'),
+                        'designation': index.products[i].get('designation'),
+                        'unitprice': index.products[i].get('unitprice'),
+                        'score': round(score, 3),
+                    }
+                    for i, score in index.top_matches(row.get('code'), row.get('designation'), top_k)
+                ]
+        return suggestions
+
+    @staticmethod
+    def _get_index(supplier_id: int) -> _SupplierIndex:
+        version, products = ProductService.get_cached_for_supplier(supplier_id)
+        with ProductMatchService._lock:
+            cached = ProductMatchService._indexes.get(supplier_id)
+            if cached and cached[0] == version:
+                return cached[1]
+        index = _SupplierIndex(products)
+        with ProductMatchService._lock:
+            ProductMatchService._indexes[supplier_id] = (version, index)
+        logger.info(f"Built match index for supplier {supplier_id}: {len(products)} product(s)")
+        return index
@@ -1,7 +1,45 @@
+import threading
+import time
+from decimal import Decimal
 from typing import Optional
 
+from sqlalchemy import func, inspect
+
 from analysercomptacore.services import SupplierService as CoreSupplierService
 from app.database import get_db
+from app.logging_config import get_logger
+from app.models import Supplier, SupplierProduct
+from app.shared_cache import SharedCache
+from app.services.search_index import TrigramIndex
+from app.services.supplier_stats import SupplierStats
+
+logger = get_logger(__name__)
+
+# Delay between two checks of the product table for external changes
+INDEX_SYNC_INTERVAL = 5.0  # seconds
+# Full reload period, to pick up edits made outside the web app (CLI, resolve)
+INDEX_REFRESH_INTERVAL = 600.0  # seconds
+# Longest a caller waits for the first load of the catalog
+INDEX_LOAD_TIMEOUT = 60.0  # seconds
+# Products read per query when picking up rows added outside the web app
+SYNC_BATCH_SIZE = 1000
+
+# In-memory catalog and code/designation search index, updated by ProductService writes and
+# kept in sync with the table by the 'product-index' thread
+_products: dict[int, dict] = {}
+_product_index = TrigramIndex()
+_index_state = {'loaded': False, 'stale': False, 'reloading': False, 'max_id': 0, 'count': 0,
+                'loaded_at': 0.0, 'version': 0, 'thread': None}
+_index_lock = threading.RLock()
+_index_loaded = threading.Event()
+# Wakes the index thread before INDEX_SYNC_INTERVAL (catalog marked stale)
+_index_wake = threading.Event()
+# Per-supplier version, bumped when one of the supplier's products changes: {idsupplier: version}
+_supplier_versions: dict[Optional[int], int] = {}
+# Catalog sorted by code, per supplier filter (None = all), for browse(): {'version', 'lists'}
+_browse_cache = {'version': None, 'lists': {}}
+# Writes made while a full reload runs, replayed on the new catalog: [('write', product) | ('delete', id)]
+_pending_writes: list[tuple[str, object]] = []
 
 
 class ProductService:
@@ -24,7 +62,7 @@ class ProductService:
                category: str = None, idsupplier: int = None) -> dict:
         """Create a new product."""
         with get_db() as db:
-            return CoreSupplierService.create_product(
+            product = CoreSupplierService.create_product(
                 db,
                 code=code,
                 designation=designation,
@@ -33,27 +71,338 @@ class ProductService:
                 category=category,
                 idsupplier=idsupplier
             )
+        _on_product_written(product)
+        SupplierStats.product_added(idsupplier)
+        return product
 
     @staticmethod
     def update(product_id: int, **kwargs) -> Optional[dict]:
         """Update a product."""
+        previous_supplier = _cached_supplier(product_id)
         with get_db() as db:
-            return CoreSupplierService.update_product(db, product_id, **kwargs)
+            product = CoreSupplierService.update_product(db, product_id, **kwargs)
+        if product:
+            _on_product_written(product)
+            if 'idsupplier' in kwargs and product.get('idsupplier') != previous_supplier:
+                SupplierStats.refresh([previous_supplier, product.get('idsupplier')])
+        return product
 
     @staticmethod
     def delete(product_id: int) -> bool:
         """Delete a product."""
+        supplier_id = _cached_supplier(product_id)
         with get_db() as db:
-            return CoreSupplierService.delete_product(db, product_id)
+            deleted = CoreSupplierService.delete_product(db, product_id)
+        if deleted:
+            _on_product_deleted(product_id)
+            if supplier_id is not None:
+                SupplierStats.product_removed(supplier_id)
+            else:
+                SupplierStats.invalidate()
+        return deleted
 
     @staticmethod
-    def search(query: str) -> list[dict]:
-        """Search products by code or designation."""
-        with get_db() as db:
-            return CoreSupplierService.search_products(db, query)
+    def get_cached(product_id: int) -> Optional[dict]:
+        """Get a product from the in-memory catalog, without a DB round trip."""
+        _ensure_index()
+        product = _products.get(product_id)
+        return dict(product) if product else None
+
+    @staticmethod
+    def is_loaded() -> bool:
+        """Whether the in-memory catalog is loaded; starts loading it otherwise, without waiting.
+
+        Lets code running on the event loop fall back to a direct query rather
+        than block on the first load.
+        """
+        _start_index_thread()
+        return _index_loaded.is_set()
+
+    @staticmethod
+    def catalog_version() -> int:
+        """Version number of the in-memory catalog, bumped on every product change."""
+        _ensure_index()
+        return _index_state['version']
+
+    @staticmethod
+    def get_cached_for_supplier(supplier_id: int) -> tuple[int, list[dict]]:
+        """Get a supplier's products from the in-memory catalog.
+
+        Returns:
+            Tuple of (supplier version, products). The version changes whenever
+            one of this supplier's products does, so callers can cache data
+            derived from it.
+        """
+        _ensure_index()
+        with _index_lock:
+            products = [dict(p) for p in _products.values() if p.get('idsupplier') == supplier_id]
+            return _supplier_versions.get(supplier_id, 0), products
+
+    @staticmethod
+    def browse(supplier_id: Optional[int] = None, offset: int = 0, limit: int = 100) -> list[dict]:
+        """Page through the in-memory catalog ordered by code.
+
+        Args:
+            supplier_id: Restrict to one supplier
+            offset: Number of products to skip
+            limit: Maximum number of products to return
+
+        Returns:
+            List of product dictionaries
+        """
+        _ensure_index()
+        with _index_lock:
+            # Sorted once per catalog version, not on every page request
+            if _browse_cache['version'] != _index_state['version']:
+                _browse_cache['version'] = _index_state['version']
+                _browse_cache['lists'] = {}
+            products = _browse_cache['lists'].get(supplier_id)
+            if products is None:
+                products = [p for p in _products.values()
+                            if supplier_id is None or p.get('idsupplier') == supplier_id]
+                products.sort(key=lambda p: (p.get('code') or '', p['idsupplierproduct']))
+                _browse_cache['lists'][supplier_id] = products
+        return [dict(p) for p in products[offset:offset + limit]]
+
+    @staticmethod
+    def search(query: str, supplier_id: Optional[int] = None,
+               category: Optional[str] = None, limit: int = 100, offset: int = 0) -> list[dict]:
+        """Search products by code or designation.
+
+        Uses the in-memory index: matching is case and accent insensitive,
+        supports substrings and word prefixes, and returns the best hits first.
+
+        Args:
+            query: Search text
+            supplier_id: Restrict to one supplier
+            category: Restrict to one category
+            limit: Maximum number of products to return
+            offset: Number of best hits to skip (paging)
+
+        Returns:
+            List of product dictionaries, best match first
+        """
+        _ensure_index()
+        # A reload swaps both: search the pair current at the start
+        products, index = _products, _product_index
+
+        where = None
+        if supplier_id is not None or category is not None:
+            def where(product_id):
+                product = products.get(product_id)
+                return product is not None \
+                    and (supplier_id is None or product.get('idsupplier') == supplier_id) \
+                    and (category is None or product.get('category') == category)
+
+        hits = index.search(query, limit=offset + limit, where=where)[offset:]
+        return [dict(products[product_id]) for product_id, _ in hits if product_id in products]
+
+    @staticmethod
+    def invalidate_search_index() -> None:
+        """Force the product index to reload on next use (after bulk changes outside this service)."""
+        _mark_stale()
+        SharedCache.publish('products')
 
     @staticmethod
     def get_categories() -> list[str]:
         """Get all unique categories."""
         with get_db() as db:
             return CoreSupplierService.get_product_categories(db)
+
+
+def _ensure_index() -> None:
+    """Start the index thread if needed and wait for the first load of the catalog.
+
+    Later refreshes happen in that thread: callers never wait for them and
+    keep reading the current catalog meanwhile.
+    """
+    _start_index_thread()
+    if not _index_loaded.wait(INDEX_LOAD_TIMEOUT):
+        raise RuntimeError("The product catalog is still loading, try again shortly")
+
+
+def _start_index_thread() -> None:
+    state = _index_state
+    if state['thread'] is None:
+        with _index_lock:
+            if state['thread'] is None:
+                state['thread'] = threading.Thread(target=_index_loop, name='product-index', daemon=True)
+                state['thread'].start()
+
+
+def _index_loop() -> None:
+    """Body of the 'product-index' thread."""
+    while True:
+        try:
+            state = _index_state
+            if not state['loaded'] or state['stale'] or time.monotonic() - state['loaded_at'] > INDEX_REFRESH_INTERVAL:
+                _reload_index()
+            else:
+                _apply_table_changes()
+        except Exception as e:
+            logger.error(f"Product search index update failed: {e}")
+        _index_wake.wait(INDEX_SYNC_INTERVAL)
+        _index_wake.clear()
+
+
+def _reload_index() -> None:
+    """Load the whole catalog into a new index and swap it in."""
+    global _products, _product_index
+    state = _index_state
+    with _index_lock:
+        state['reloading'] = True
+        state['stale'] = False
+        _pending_writes.clear()
+    try:
+        with get_db() as db:
+            max_id, count = _table_signature(db)
+            loaded = CoreSupplierService.get_all_products(db, None, None)
+        products, index = {}, TrigramIndex()
+        for product in loaded:
+            products[product['idsupplierproduct']] = product
+            index.add(product['idsupplierproduct'], product.get('code'), product.get('designation'))
+    except Exception:
+        with _index_lock:
+            state['reloading'] = False
+        raise
+    with _index_lock:
+        for supplier_id in _changed_suppliers(_products, products):
+            _bump_supplier(supplier_id)
+        _products, _product_index = products, index
+        state.update(loaded=True, reloading=False, max_id=max_id, count=count, loaded_at=time.monotonic())
+        for kind, item in _pending_writes:
+            if kind == 'write':
+                _apply_write(item)
+            else:
+                _apply_delete(item)
+        _pending_writes.clear()
+        state['version'] += 1
+    _index_loaded.set()
+    logger.info(f"Product search index loaded: {len(products)} product(s)")
+
+
+def _apply_table_changes() -> None:
+    """Apply products added or removed outside the web app, without a full reload."""
+    state = _index_state
+    with get_db() as db:
+        max_id, count = _table_signature(db)
+        if (max_id, count) == (state['max_id'], state['count']):
+            return
+        new_ids = [product_id for (product_id,) in db.query(SupplierProduct.idsupplierproduct).filter(
+            SupplierProduct.idsupplierproduct > state['max_id'])]
+        removed = []
+        if count - len(new_ids) < state['count']:
+            existing = {product_id for (product_id,) in db.query(SupplierProduct.idsupplierproduct)}
+            removed = [product_id for product_id in list(_products) if product_id not in existing]
+        added = []
+        for start in range(0, len(new_ids), SYNC_BATCH_SIZE):
+            rows = db.query(SupplierProduct, Supplier.name).outerjoin(
+                Supplier, Supplier.idsupplier == SupplierProduct.idsupplier
+            ).filter(SupplierProduct.idsupplierproduct.in_(new_ids[start:start + SYNC_BATCH_SIZE]))
+            added.extend(_product_to_dict(product, supplier_name) for product, supplier_name in rows)
+    for product in added:
+        _on_product_written(product, publish=False)
+    for product_id in removed:
+        _on_product_deleted(product_id, publish=False)
+    with _index_lock:
+        state['max_id'], state['count'] = max_id, count
+    logger.info(f"Product search index updated: {len(added)} added, {len(removed)} removed")
+
+
+def _product_to_dict(product: SupplierProduct, supplier_name: Optional[str]) -> dict:
+    """Convert a SupplierProduct to the dictionary shape returned by Core."""
+    values = {}
+    for attr in inspect(SupplierProduct).column_attrs:
+        value = getattr(product, attr.key)
+        values[attr.key] = float(value) if isinstance(value, Decimal) else value
+    values['supplier_name'] = supplier_name
+    return values
+
+
+def _table_signature(db) -> tuple[int, int]:
+    max_id, count = db.query(
+        func.max(SupplierProduct.idsupplierproduct), func.count(SupplierProduct.idsupplierproduct)
+    ).one()
+    return max_id or 0, count or 0
+
+
+def _mark_stale(payload=None) -> None:
+    """Reload the catalog in the background, as soon as possible."""
+    with _index_lock:
+        _index_state['stale'] = True
+    _index_wake.set()
+
+
+def _cached_supplier(product_id: int) -> Optional[int]:
+    """Supplier of a product according to the in-memory catalog, if loaded."""
+    product = _products.get(product_id)
+    return product.get('idsupplier') if product else None
+
+
+def _changed_suppliers(old: dict[int, dict], new: dict[int, dict]) -> set[Optional[int]]:
+    """Suppliers with a product added, removed or modified between two catalogs."""
+    changed = set()
+    for product_id, product in new.items():
+        previous = old.get(product_id)
+        if previous != product:
+            changed.add(product.get('idsupplier'))
+            if previous is not None:
+                changed.add(previous.get('idsupplier'))
+    for product_id in old.keys() - new.keys():
+        changed.add(old[product_id].get('idsupplier'))
+    return changed
+
+
+def _bump_supplier(supplier_id: Optional[int]) -> None:
+    _supplier_versions[supplier_id] = _supplier_versions.get(supplier_id, 0) + 1
+
+
+def _apply_write(product: dict) -> None:
+    product_id = product['idsupplierproduct']
+    previous = _products.get(product_id)
+    if previous is not None and 'supplier_name' not in product:
+        product = {**product, 'supplier_name': previous.get('supplier_name')}
+    if previous is None:
+        _index_state['count'] += 1
+        _index_state['max_id'] = max(_index_state['max_id'], product_id)
+    else:
+        _bump_supplier(previous.get('idsupplier'))
+    _bump_supplier(product.get('idsupplier'))
+    _products[product_id] = product
+    _product_index.add(product_id, product.get('code'), product.get('designation'))
+
+
+def _apply_delete(product_id: int) -> None:
+    previous = _products.pop(product_id, None)
+    if previous is not None:
+        _index_state['count'] -= 1
+        _bump_supplier(previous.get('idsupplier'))
+    _product_index.remove(product_id)
+
+
+def _on_product_written(product: dict, publish: bool = True) -> None:
+    """Apply a product create/update to the index without reloading it."""
+    with _index_lock:
+        if _index_state['reloading']:
+            _pending_writes.append(('write', product))
+        if _index_state['loaded']:
+            _apply_write(product)
+            _index_state['version'] += 1
+    if publish:
+        SharedCache.publish('products')
+
+
+def _on_product_deleted(product_id: int, publish: bool = True) -> None:
+    """Apply a product delete to the index without reloading it."""
+    with _index_lock:
+        if _index_state['reloading']:
+            _pending_writes.append(('delete', product_id))
+        if _index_state['loaded']:
+            _apply_delete(product_id)
+            _index_state['version'] += 1
+    if publish:
+        SharedCache.publish('products')
+
+
+# Other workers' product writes: reload the catalog on next use
+SharedCache.subscribe('products', _mark_stale)
@@ -0,0 +1,180 @@
+"""Cancellable, coalesced execution of blocking read queries for interactive filters."""
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Hashable, Optional
+
+from nicegui import run
+from sqlalchemy.orm import Session
+
+from app.database import get_connection_id, kill_query
+from app.logging_config import get_logger
+from app.tracing import bind
+
+logger = get_logger(__name__)
+
+# Statements running longer than this are killed even if nobody superseded them
+DEFAULT_MAX_EXECUTION_TIME = 30.0  # seconds
+
+
+class QuerySuperseded(Exception):
+    """Raised when a newer request replaced the one being awaited."""
+
+
+class QueryToken:
+    """Handle on a running query that allows killing its DB statement.
+
+    Services bind the token to their session before running the statement;
+    cancelling the token then issues a MySQL ``KILL QUERY`` for that connection.
+    """
+
+    def __init__(self, max_execution_time: float = DEFAULT_MAX_EXECUTION_TIME):
+        self.max_execution_time = max_execution_time
+        self.cancelled = False
+        self._connection_id: Optional[int] = None
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    @contextmanager
+    def bound(self, db: Session):
+        """Bind the token to a session for the duration of the block."""
+        connection_id = get_connection_id(db)
+        with self._lock:
+            if self.cancelled:
+                raise QuerySuperseded()
+            self._connection_id = connection_id
+        self._timer = threading.Timer(self.max_execution_time, self._on_timeout)
+        self._timer.daemon = True
+        self._timer.start()
+        try:
+            yield
+        finally:
+            self._timer.cancel()
+            with self._lock:
+                self._connection_id = None
+
+    def cancel(self) -> None:
+        """Cancel the query, killing its statement if it is running."""
+        with self._lock:
+            self.cancelled = True
+            bound = self._connection_id is not None
+        if bound:
+            # KILL needs its own DB round trip - never block the caller (event loop) on it
+            threading.Thread(target=self._kill_if_bound, daemon=True).start()
+
+    def _kill_if_bound(self) -> None:
+        # Holding the lock keeps bound() from handing the connection back to the pool
+        # before the KILL lands: once unbound, the ID may belong to another request
+        with self._lock:
+            if self._connection_id is not None:
+                _kill(self._connection_id)
+                self._connection_id = None
+
+    def _on_timeout(self) -> None:
+        logger.warning(f"Query exceeded {self.max_execution_time}s, killing it")
+        self.cancel()
+
+
+class _SharedQuery:
+    """A query in flight, awaited by one or more runners."""
+
+    def __init__(self, token: QueryToken):
+        self.token = token
+        self.task: Optional[asyncio.Future] = None
+        self.waiters = 0
+
+
+class QueryRunner:
+    """Runs blocking queries off the event loop, keeping only the newest request.
+
+    Each call to :meth:`run` supersedes the previous one made through the same
+    runner: the older caller gets :class:`QuerySuperseded` instead of a stale
+    result, and its DB statement is killed unless another runner is still
+    waiting on it. Identical concurrent requests (same key) share one query.
+
+    Usage:
+        runner = QueryRunner()
+        try:
+            rows = await runner.run(key, Service.get_all, date_from=..., query_token=...)
+        except QuerySuperseded:
+            return
+    """
+
+    # In-flight queries shared by all runners (all clients), keyed by request
+    _inflight: dict[Hashable, _SharedQuery] = {}
+
+    def __init__(self):
+        self._generation = 0
+        self._current: Optional[_SharedQuery] = None
+
+    async def run(self, key: Hashable, func: Callable[..., Any], **kwargs) -> Any:
+        """Run ``func(query_token=..., **kwargs)`` in a worker thread.
+
+        Args:
+            key: Hashable identity of the request, used to coalesce duplicates
+            func: Blocking function accepting a ``query_token`` keyword argument
+            **kwargs: Arguments forwarded to ``func``
+
+        Returns:
+            The function result
+
+        Raises:
+            QuerySuperseded: If a newer request was made before this one finished
+        """
+        self._generation += 1
+        generation = self._generation
+        self._release()
+
+        shared = QueryRunner._inflight.get(key)
+        if shared is None:
+            shared = _SharedQuery(QueryToken())
+            shared.task = asyncio.ensure_future(run.io_bound(bind(func), query_token=shared.token, **kwargs))
+            QueryRunner._inflight[key] = shared
+            shared.task.add_done_callback(lambda _, k=key, s=shared: _forget(k, s))
+        shared.waiters += 1
+        self._current = shared
+
+        try:
+            result = await asyncio.shield(shared.task)
+        except Exception:
+            if generation != self._generation:
+                raise QuerySuperseded()
+            raise
+        finally:
+            if generation == self._generation:
+                self._release()
+
+        if generation != self._generation:
+            raise QuerySuperseded()
+        return result
+
+    def cancel(self) -> None:
+        """Drop the pending request, if any (e.g. when the page is closed)."""
+        self._generation += 1
+        self._release()
+
+    def _release(self) -> None:
+        shared = self._current
+        self._current = None
+        if shared is None:
+            return
+        shared.waiters -= 1
+        if shared.waiters <= 0 and not shared.task.done():
+            # Nobody wants this result anymore: stop sharing it and kill the statement
+            for key, inflight in list(QueryRunner._inflight.items()):
+                if inflight is shared:
+                    del QueryRunner._inflight[key]
+            shared.token.cancel()
+
+
+def _forget(key: Hashable, shared: _SharedQuery) -> None:
+    if QueryRunner._inflight.get(key) is shared:
+        del QueryRunner._inflight[key]
+
+
+def _kill(connection_id: int) -> None:
+    try:
+        kill_query(connection_id)
+        logger.info(f"Killed superseded query on connection {connection_id}")
+    except Exception as e:
+        logger.warning(f"Failed to kill query on connection {connection_id}: {e}")
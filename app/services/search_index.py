@@ -0,0 +1,164 @@
+"""In-memory trigram index for fast accent/case-insensitive text search."""
+import heapq
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Callable, Hashable, Iterable, Optional
+
+# Rank bonuses for where a query token matches inside a document
+_SCORE_DOC_PREFIX = 3.0
+_SCORE_WORD_PREFIX = 2.0
+_SCORE_SUBSTRING = 1.0
+
+
+def fold(text: Optional[str]) -> str:
+    """Normalize text for searching: lowercase, strip accents, collapse whitespace."""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.lower().split())
+
+
+def _trigrams(token: str) -> set[str]:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+def _document_keys(doc: str) -> set[str]:
+    """Posting keys for a folded document: all trigrams plus 1-2 char word prefixes."""
+    keys = _trigrams(doc)
+    for word in doc.split():
+        keys.add('^' + word[:1])
+        keys.add('^' + word[:2])
+    return keys
+
+
+class TrigramIndex:
+    """Inverted trigram index supporting substring and prefix queries with ranking.
+
+    Each document is one or more text fields folded with :func:`fold`. A query is
+    split into tokens and every token must appear in the document; tokens of 3+
+    characters match anywhere (substring), shorter tokens match word prefixes.
+    Hits are ranked by where the tokens match (start of document, start of a
+    word, elsewhere), then by document length.
+
+    The index is safe to use from several threads.
+    """
+
+    def __init__(self):
+        self._docs: dict[Hashable, str] = {}
+        self._postings: dict[str, set[Hashable]] = defaultdict(set)
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._docs
+
+    def add(self, key: Hashable, *fields: Optional[str]) -> None:
+        """Index (or re-index) a document made of the given text fields."""
+        # Fields are separated by newlines so tokens never match across them
+        doc = '\n'.join(fold(f) for f in fields if f)
+        with self._lock:
+            self._remove(key)
+            self._docs[key] = doc
+            for posting_key in _document_keys(doc):
+                self._postings[posting_key].add(key)
+
+    def add_many(self, documents: Iterable[tuple]) -> None:
+        """Index several ``(key, *fields)`` tuples."""
+        with self._lock:
+            for key, *fields in documents:
+                self.add(key, *fields)
+
+    def remove(self, key: Hashable) -> None:
+        """Remove a document from the index (no-op if absent)."""
+        with self._lock:
+            self._remove(key)
+
+    def clear(self) -> None:
+        """Remove all documents."""
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+
+    def search(self, query: str, limit: Optional[int] = 50,
+               where: Optional[Callable[[Hashable], bool]] = None) -> list[tuple[Hashable, float]]:
+        """Find documents containing every token of the query.
+
+        Args:
+            query: Free text query
+            limit: Maximum number of hits to return, None for all of them
+            where: Optional predicate on keys, applied before ranking
+
+        Returns:
+            List of (key, score) tuples, best first. Scores are in ]0, 1].
+        """
+        tokens = fold(query).split()
+        if not tokens:
+            return []
+
+        with self._lock:
+            candidates = None
+            # Most selective tokens first so the intersection shrinks quickly
+            for posting in sorted((self._token_candidates(t) for t in tokens), key=len):
+                candidates = set(posting) if candidates is None else candidates & posting
+                if not candidates:
+                    return []
+
+            hits = []
+            for key in candidates:
+                if where is not None and not where(key):
+                    continue
+                doc = self._docs[key]
+                score = _score(doc, tokens)
+                if score:
+                    hits.append((key, score, len(doc)))
+
+        max_score = _SCORE_DOC_PREFIX * len(tokens)
+        ranked = (
+            heapq.nsmallest(limit, hits, key=lambda h: (-h[1], h[2]))
+            if limit is not None else sorted(hits, key=lambda h: (-h[1], h[2]))
+        )
+        return [(key, score / max_score) for key, score, _ in ranked]
+
+    def _token_candidates(self, token: str) -> set[Hashable]:
+        if len(token) < 3:
+            return self._postings.get('^' + token, set())
+        result = None
+        for gram in sorted(_trigrams(token), key=lambda g: len(self._postings.get(g, ()))):
+            posting = self._postings.get(gram)
+            if not posting:
+                return set()
+            result = set(posting) if result is None else result & posting
+            if not result:
+                break
+        return result
+
+    def _remove(self, key: Hashable) -> None:
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        for posting_key in _document_keys(doc):
+            posting = self._postings.get(posting_key)
+            if posting is not None:
+                posting.discard(key)
+                if not posting:
+                    del self._postings[posting_key]
+
+
+def _score(doc: str, tokens: list[str]) -> float:
+    """Score a candidate, or 0 if a token does not actually occur (trigram false positive)."""
+    total = 0.0
+    bounded = ' ' + doc.replace('\n', ' ')
+    for token in tokens:
+        if doc.startswith(token):
+            total += _SCORE_DOC_PREFIX
+        elif ' ' + token in bounded:
+            total += _SCORE_WORD_PREFIX
+        elif len(token) >= 3 and token in doc:
+            total += _SCORE_SUBSTRING
+        else:
+            return 0.0
+    return total
@@ -0,0 +1,325 @@
+"""Set-based resolution of staging rows: plan every action in memory, then apply it in a few statements."""
+import hashlib
+import re
+import unicodedata
+from decimal import Decimal
+from typing import Optional
+
+from sqlalchemy import func, insert, tuple_
+
+from app.logging_config import get_logger
+from app.models import SupplierNewProducts, SupplierProduct, SupplierFactItem
+
+logger = get_logger(__name__)
+
+# Statuses handled by a resolve run; other rows (INCOMPLETE...) are left alone
+RESOLVABLE_STATUSES = ('CREATE PRODUCT', 'IGNORE PRODUCT', 'FULL IGNORE')
+# Reference to an existing product written in misc by reviewers and auto-flagging
+PRODUCT_REFERENCE = re.compile(r'Product Reference ID:\s*(\d+)')
+# Maximum number of IDs per IN (...) clause
+BATCH_SIZE = 1000
+
+# Fields covered by a staging row's version: any change to one of them by
+# another reviewer makes a pending edit of that row a conflict
+VERSIONED_FIELDS = (
+    'code', 'designation', 'unitprice', 'tva', 'category', 'misc',
+    'quantity', 'ItemPrice', 'Status', 'idFacture', 'idsupplier',
+)
+
+
+class PlanOutdated(Exception):
+    """Raised when staging rows changed between planning and execution."""
+
+
+def plan_resolution(db, facture_id: Optional[str] = None, lock: bool = False) -> dict:
+    """Compute everything a resolve run would do, without writing anything.
+
+    Three reads: the staging rows to resolve, the products they may already
+    exist as, and the products referenced in misc.
+
+    Args:
+        db: Database session
+        facture_id: Restrict to one facture
+        lock: Lock the staging rows until the end of the transaction (use when
+            the plan is executed in the same session)
+
+    Returns:
+        Plan dictionary:
+            'facture_id': the filter the plan was computed for
+            'products': products to create ({idsupplier, code, designation, unitprice, tva, category})
+            'items': facture items to create ({row_id, kind, idsupplier, idsupplierfacture,
+                idsupplierproduct or product_key, quantity, itemPrice, unitPriceSnap}),
+                kind being 'create', 'link' or 'duplicate'
+            'close': {status: [row IDs]} staging rows to mark CLOSED, by current status
+            'skipped': FULL IGNORE row IDs (closed, nothing else to do)
+            'errors': {row_id: reason} for rows that cannot be resolved (left untouched)
+            'rows': {row_id: {code, designation, Status}} of every row read, for display
+            'versions': {row_id: row_version()} of every row read, checked before execution
+            'stats': counters, same keys as Core's resolve ('created', 'ignored',
+                'full_ignored', 'duplicates_converted', 'errors')
+    """
+    query = db.query(SupplierNewProducts).filter(SupplierNewProducts.Status.in_(RESOLVABLE_STATUSES))
+    if facture_id:
+        query = query.filter(SupplierNewProducts.idFacture == facture_id)
+    if lock:
+        query = query.with_for_update()
+    rows = query.order_by(SupplierNewProducts.idsuppliernewproducts).all()
+
+    # Products that already exist, by (supplier, code) as the collation compares them
+    keys = {(row.idsupplier, row.code) for row in rows if row.Status == 'CREATE PRODUCT' and row.code}
+    existing = {}
+    for batch in _batches(sorted(keys, key=str)):
+        existing.update({
+            _code_key(supplier_id, code): product_id
+            for supplier_id, code, product_id in db.query(
+                SupplierProduct.idsupplier, SupplierProduct.code, func.min(SupplierProduct.idsupplierproduct)
+            ).filter(
+                tuple_(SupplierProduct.idsupplier, SupplierProduct.code).in_(batch)
+            ).group_by(SupplierProduct.idsupplier, SupplierProduct.code)
+        })
+
+    # Products referenced in misc by IGNORE PRODUCT rows
+    references = {row.idsuppliernewproducts: _product_reference(row.misc)
+                  for row in rows if row.Status == 'IGNORE PRODUCT'}
+    referenced = set()
+    for batch in _batches(sorted({r for r in references.values() if r})):
+        referenced.update(product_id for (product_id,) in db.query(SupplierProduct.idsupplierproduct).filter(
+            SupplierProduct.idsupplierproduct.in_(batch)
+        ))
+
+    plan = {
+        'facture_id': facture_id,
+        'products': [],
+        'items': [],
+        'close': {status: [] for status in RESOLVABLE_STATUSES},
+        'skipped': [],
+        'errors': {},
+        'rows': {
+            row.idsuppliernewproducts: {'code': row.code, 'designation': row.designation, 'Status': row.Status}
+            for row in rows
+        },
+        'versions': {row.idsuppliernewproducts: _version_of(row) for row in rows},
+        'stats': {'created': 0, 'ignored': 0, 'full_ignored': 0, 'duplicates_converted': 0, 'errors': 0},
+    }
+    planned_keys = set()
+    for row in rows:
+        row_id = row.idsuppliernewproducts
+        if row.Status == 'FULL IGNORE':
+            # Items were created at ingestion: nothing to do but close the row
+            plan['close'][row.Status].append(row_id)
+            plan['skipped'].append(row_id)
+            plan['stats']['full_ignored'] += 1
+            continue
+
+        facture = _to_int(row.idFacture)
+        if facture is None:
+            plan['errors'][row_id] = 'No facture'
+            continue
+
+        item = {
+            'row_id': row_id,
+            'idsupplier': row.idsupplier,
+            'idsupplierfacture': facture,
+            'quantity': row.quantity,
+            'itemPrice': row.ItemPrice,
+            'unitPriceSnap': row.unitprice,
+        }
+        if row.Status == 'IGNORE PRODUCT':
+            product_id = references.get(row_id)
+            if not product_id:
+                plan['errors'][row_id] = 'No product reference in misc'
+                continue
+            if product_id not in referenced:
+                plan['errors'][row_id] = f'Referenced product {product_id} does not exist'
+                continue
+            item['idsupplierproduct'] = product_id
+            item['kind'] = 'link'
+            plan['stats']['ignored'] += 1
+        else:  # CREATE PRODUCT
+            if not row.code:
+                plan['errors'][row_id] = 'No product code'
+                continue
+            key = _code_key(row.idsupplier, row.code)
+            if key in existing:
+                # Same code already in the catalog: link instead of creating a duplicate
+                item['idsupplierproduct'] = existing[key]
+                item['kind'] = 'duplicate'
+                plan['stats']['duplicates_converted'] += 1
+            elif key in planned_keys:
+                # Same code earlier in this run: link to the product created for it
+                item['product_key'] = key
+                item['kind'] = 'duplicate'
+                plan['stats']['duplicates_converted'] += 1
+            else:
+                planned_keys.add(key)
+                plan['products'].append({
+                    'idsupplier': row.idsupplier,
+                    'code': row.code,
+                    'designation': row.designation,
+                    'unitprice': row.unitprice,
+                    'tva': row.tva,
+                    'category': row.category,
+                })
+                item['product_key'] = key
+                item['kind'] = 'create'
+                plan['stats']['created'] += 1
+        plan['items'].append(item)
+        plan['close'][row.Status].append(row_id)
+
+    plan['stats']['errors'] = len(plan['errors'])
+    return plan
+
+
+def execute_plan(db, plan: dict, job=None) -> dict:
+    """Apply a resolution plan with multi-row statements, in the caller's transaction.
+
+    The plan is checked against the database first, under row locks: its
+    staging rows must have the version they were planned with, the products
+    it links to must still exist and the ones it creates must not exist yet.
+    A plan made stale by another reviewer or process is never applied.
+
+    Args:
+        db: Database session (committed or rolled back by the caller)
+        plan: Plan returned by plan_resolution()
+        job: Optional JobContext, for progress and cancellation between steps
+
+    Returns:
+        The plan's stats
+
+    Raises:
+        PlanOutdated: Some planned rows or products changed since planning;
+            the caller's transaction must be rolled back
+    """
+    _step(job, 0, 'Checking the plan')
+    _check_plan(db, plan)
+
+    _step(job, 0, 'Closing staging rows')
+    for status, row_ids in plan['close'].items():
+        for batch in _batches(row_ids):
+            closed = db.query(SupplierNewProducts).filter(
+                SupplierNewProducts.idsuppliernewproducts.in_(batch),
+                SupplierNewProducts.Status == status
+            ).update({SupplierNewProducts.Status: 'CLOSED'}, synchronize_session=False)
+            if closed != len(batch):
+                raise PlanOutdated('Staging rows changed since the resolve plan was made')
+
+    _step(job, 1, 'Creating products')
+    created = {}
+    if plan['products']:
+        db.execute(insert(SupplierProduct), plan['products'])
+        # Multi-row INSERT only reports the first ID: read the new ones back by key
+        keys = [(p['idsupplier'], p['code']) for p in plan['products']]
+        for batch in _batches(keys):
+            created.update({
+                _code_key(supplier_id, code): product_id
+                for supplier_id, code, product_id in db.query(
+                    SupplierProduct.idsupplier, SupplierProduct.code, func.max(SupplierProduct.idsupplierproduct)
+                ).filter(
+                    tuple_(SupplierProduct.idsupplier, SupplierProduct.code).in_(batch)
+                ).group_by(SupplierProduct.idsupplier, SupplierProduct.code)
+            })
+
+    _step(job, 2, 'Creating facture items')
+    if plan['items']:
+        db.execute(insert(SupplierFactItem), [
+            {
+                'idsupplier': item['idsupplier'],
+                'idsupplierfacture': item['idsupplierfacture'],
+                'idsupplierproduct': item.get('idsupplierproduct') or created[item['product_key']],
+                'quantity': item['quantity'],
+                'itemPrice': item['itemPrice'],
+                'unitPriceSnap': item['unitPriceSnap'],
+            }
+            for item in plan['items']
+        ])
+
+    _step(job, 3, None)
+    closed = sum(len(row_ids) for row_ids in plan['close'].values())
+    logger.info(f"Bulk resolve: {len(plan['products'])} product(s) created, {len(plan['items'])} item(s) linked, "
+                f"{closed} row(s) closed, {len(plan['errors'])} error(s)")
+    return dict(plan['stats'])
+
+
+def row_version(values) -> str:
+    """Hash of a row's versioned field values, insensitive to float/Decimal/str representation."""
+    normalized = []
+    for value in values:
+        if isinstance(value, str):
+            try:
+                value = Decimal(value.strip())
+            except ArithmeticError:
+                pass
+        if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+            value = repr(round(float(value), 6))
+        normalized.append('' if value is None else str(value))
+    return hashlib.sha1('\x1f'.join(normalized).encode()).hexdigest()[:16]
+
+
+def _check_plan(db, plan: dict) -> None:
+    """Raise PlanOutdated if the database no longer matches what the plan was computed from."""
+    planned = plan.get('versions', {})
+    current = {}
+    for batch in _batches(sorted(planned)):
+        current.update({
+            row.idsuppliernewproducts: _version_of(row)
+            for row in db.query(SupplierNewProducts).filter(
+                SupplierNewProducts.idsuppliernewproducts.in_(batch)
+            ).with_for_update()
+        })
+    changed = [row_id for row_id, version in planned.items() if current.get(row_id) != version]
+    if changed:
+        raise PlanOutdated(f'{len(changed)} staging row(s) changed since the resolve plan was made')
+
+    linked = sorted({item['idsupplierproduct'] for item in plan['items'] if item.get('idsupplierproduct')})
+    found = set()
+    for batch in _batches(linked):
+        found.update(product_id for (product_id,) in db.query(SupplierProduct.idsupplierproduct).filter(
+            SupplierProduct.idsupplierproduct.in_(batch)
+        ).with_for_update())
+    if len(found) != len(linked):
+        raise PlanOutdated('Products linked by the resolve plan were deleted since it was made')
+
+    keys = [(p['idsupplier'], p['code']) for p in plan['products']]
+    for batch in _batches(keys):
+        if db.query(SupplierProduct.idsupplierproduct).filter(
+            tuple_(SupplierProduct.idsupplier, SupplierProduct.code).in_(batch)
+        ).first() is not None:
+            raise PlanOutdated('Products the resolve plan creates were created by someone else since it was made')
+
+
+def _version_of(row) -> str:
+    return row_version(getattr(row, field) for field in VERSIONED_FIELDS)
+
+
+def _step(job, done: int, message: Optional[str]) -> None:
+    if job is not None:
+        # Cancelling between steps rolls the whole transaction back
+        job.check_cancelled()
+        job.progress(done, 3, message)
+
+
+def _code_key(supplier_id: Optional[int], code: str) -> tuple[Optional[int], str]:
+    """(supplier, code) compared the way the code column's collation does.
+
+    The case and accent insensitive, PAD SPACE collation makes "ab1", "AB1"
+    and "AB1 " the same code in IN and GROUP BY: matching on the raw strings
+    would miss existing products and recreate them.
+    """
+    decomposed = unicodedata.normalize('NFKD', code.rstrip(' '))
+    return supplier_id, ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def _product_reference(misc: Optional[str]) -> Optional[int]:
+    match = PRODUCT_REFERENCE.search(misc or '')
+    return int(match.group(1)) if match else None
+
+
+def _to_int(value) -> Optional[int]:
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _batches(values: list) -> list[list]:
+    return [values[i:i + BATCH_SIZE] for i in range(0, len(values), BATCH_SIZE)]
@@ -1,15 +1,28 @@
 """Service for Superset API integration and guest token generation."""
+import threading
+import time
+from functools import lru_cache
+
 import requests
 from app.logging_config import get_logger
 from app.config import config
+from app.shared_cache import SharedCache
+from app.tracing import span
 
 logger = get_logger(__name__)
 
-# Superset configuration from YAML
-_superset_config = config.get_superset_config()
-SUPERSET_URL = _superset_config['url']
-SUPERSET_USERNAME = _superset_config['username']
-SUPERSET_PASSWORD = _superset_config['password']
+# Token lifetimes when shared between workers, kept below Superset's defaults
+# (15 min for access tokens, 5 min for guest tokens)
+ACCESS_TOKEN_TTL = 600  # seconds
+GUEST_TOKEN_TTL = 240  # seconds
+# Circuit breaker: after this many consecutive failures, calls fail fast for BREAKER_COOLDOWN
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 60.0  # seconds
+REQUEST_TIMEOUT = 10  # seconds
+
+
+class SupersetUnavailable(requests.RequestException):
+    """Raised without calling Superset while the circuit breaker is open."""
 
 
 class SupersetService:
@@ -18,6 +31,57 @@ class SupersetService:
     _session: requests.Session | None = None
     _access_token: str | None = None
     _csrf_token: str | None = None
+    _dashboard_uuids: dict[str, str] = {}
+    _breaker = {'failures': 0, 'opened_at': None}
+    _breaker_lock = threading.Lock()
+
+    @classmethod
+    def breaker_state(cls) -> str:
+        """'closed' (calls go through), 'open' (failing fast) or 'half-open' (next call is a trial)."""
+        opened_at = cls._breaker['opened_at']
+        if opened_at is None:
+            return 'closed'
+        return 'open' if time.monotonic() - opened_at < BREAKER_COOLDOWN else 'half-open'
+
+    @classmethod
+    def _request(cls, method: str, url: str, **kwargs) -> requests.Response:
+        """Call Superset through the circuit breaker.
+
+        While Superset keeps failing, pages get an immediate error instead of
+        each waiting for the timeout.
+        """
+        with cls._breaker_lock:
+            state = cls.breaker_state()
+            if state == 'open':
+                raise SupersetUnavailable(f'Superset unavailable, retrying after {BREAKER_COOLDOWN:.0f}s cooldown')
+            if state == 'half-open':
+                # This call is the trial: restart the cooldown so concurrent callers keep failing fast
+                cls._breaker['opened_at'] = time.monotonic()
+        try:
+            with span(f'superset {method.upper()}', root=False, **{'http.url': url}) as current:
+                response = cls._get_session().request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+                if current is not None:
+                    current.set('http.status_code', response.status_code)
+        except requests.RequestException:
+            cls._record_failure()
+            raise
+        if response.status_code >= 500:
+            cls._record_failure()
+        else:
+            with cls._breaker_lock:
+                cls._breaker['failures'] = 0
+                cls._breaker['opened_at'] = None
+        return response
+
+    @classmethod
+    def _record_failure(cls) -> None:
+        with cls._breaker_lock:
+            cls._breaker['failures'] += 1
+            if cls._breaker['failures'] >= BREAKER_THRESHOLD or cls._breaker['opened_at'] is not None:
+                # (Re)open, also when the half-open trial call failed
+                if cls._breaker['opened_at'] is None:
+                    logger.warning(f"Superset circuit breaker opened after {cls._breaker['failures']} failure(s)")
+                cls._breaker['opened_at'] = time.monotonic()
 
     @classmethod
     def _get_session(cls) -> requests.Session:
@@ -33,20 +97,28 @@ class SupersetService:
             return cls._access_token
 
         session = cls._get_session()
-        login_url = f'{SUPERSET_URL}/api/v1/security/login'
+        # Another worker may already be logged in
+        shared_token = SharedCache.get('superset:access_token')
+        if shared_token:
+            cls._access_token = shared_token
+            session.headers['Authorization'] = f'Bearer {shared_token}'
+            return shared_token
+
+        login_url = f'{_settings()["url"]}/api/v1/security/login'
         payload = {
-            'username': SUPERSET_USERNAME,
-            'password': SUPERSET_PASSWORD,
+            'username': _settings()['username'],
+            'password': _settings()['password'],
             'provider': 'db',
             'refresh': True,
         }
 
         try:
-            response = session.post(login_url, json=payload, timeout=10)
+            response = cls._request('post', login_url, json=payload)
             response.raise_for_status()
             data = response.json()
             cls._access_token = data['access_token']
             session.headers['Authorization'] = f'Bearer {cls._access_token}'
+            SharedCache.set('superset:access_token', cls._access_token, ttl=ACCESS_TOKEN_TTL)
             logger.info('Superset access token obtained')
             return cls._access_token
         except requests.RequestException as e:
@@ -61,10 +133,10 @@ class SupersetService:
 
         cls._get_access_token()  # Ensure we have access token
         session = cls._get_session()
-        csrf_url = f'{SUPERSET_URL}/api/v1/security/csrf_token/'
+        csrf_url = f'{_settings()["url"]}/api/v1/security/csrf_token/'
 
         try:
-            response = session.get(csrf_url, timeout=10)
+            response = cls._request('get', csrf_url)
             response.raise_for_status()
             data = response.json()
             cls._csrf_token = data['result']
@@ -87,11 +159,17 @@ class SupersetService:
         Returns:
             Guest token string for embedding
         """
+        # Tokens for the default guest user are the same for every worker
+        shared_key = f'superset:guest_token:{dashboard_id}' if user is None else None
+        if shared_key:
+            shared_token = SharedCache.get(shared_key)
+            if shared_token:
+                return shared_token
+
         cls._get_access_token()  # Ensure we have access token
         cls._get_csrf_token()  # Ensure we have CSRF token
-        session = cls._get_session()
 
-        guest_token_url = f'{SUPERSET_URL}/api/v1/security/guest_token/'
+        guest_token_url = f'{_settings()["url"]}/api/v1/security/guest_token/'
 
         # Default user if not provided
         if user is None:
@@ -106,10 +184,12 @@ class SupersetService:
         }
 
         try:
-            response = session.post(guest_token_url, json=payload, timeout=10)
+            response = cls._request('post', guest_token_url, json=payload)
             response.raise_for_status()
             data = response.json()
             logger.info(f'Guest token generated for dashboard {dashboard_id}')
+            if shared_key:
+                SharedCache.set(shared_key, data['token'], ttl=GUEST_TOKEN_TTL)
             return data['token']
         except requests.RequestException as e:
             logger.error(f'Failed to get Superset guest token: {e}')
@@ -126,13 +206,15 @@ class SupersetService:
         Returns:
             Dashboard embedded UUID or None if not found
         """
+        if dashboard_slug in cls._dashboard_uuids:
+            return cls._dashboard_uuids[dashboard_slug]
+
         cls._get_access_token()  # Ensure we have access token
-        session = cls._get_session()
 
         try:
             # Get all dashboards and find by slug
-            dashboard_url = f'{SUPERSET_URL}/api/v1/dashboard/'
-            response = session.get(dashboard_url, timeout=10)
+            dashboard_url = f'{_settings()["url"]}/api/v1/dashboard/'
+            response = cls._request('get', dashboard_url)
             response.raise_for_status()
             data = response.json()
 
@@ -148,8 +230,8 @@ class SupersetService:
                 return None
 
             # Get the embedded UUID from the embedded endpoint
-            embedded_url = f'{SUPERSET_URL}/api/v1/dashboard/{dashboard_id}/embedded'
-            response = session.get(embedded_url, timeout=10)
+            embedded_url = f'{_settings()["url"]}/api/v1/dashboard/{dashboard_id}/embedded'
+            response = cls._request('get', embedded_url)
 
             if response.status_code == 404:
                 logger.warning(f'Dashboard "{dashboard_slug}" does not have embedding enabled')
@@ -160,14 +242,29 @@ class SupersetService:
 
             uuid = embedded_data['result'].get('uuid')
             logger.info(f'Found dashboard "{dashboard_slug}" with embedded UUID: {uuid}')
+            if uuid:
+                cls._dashboard_uuids[dashboard_slug] = uuid
             return uuid
         except requests.RequestException as e:
             logger.error(f'Failed to get dashboard UUID: {e}')
             return None
 
+    @classmethod
+    def connect(cls) -> None:
+        """Log in and get the CSRF token now, ahead of the first guest token request."""
+        cls._get_csrf_token()
+
     @classmethod
     def clear_tokens(cls):
         """Clear cached tokens and session (useful if they expire)."""
         cls._access_token = None
         cls._csrf_token = None
         cls._session = None
+        cls._dashboard_uuids.clear()
+        SharedCache.delete('superset:access_token')
+
+
+@lru_cache(maxsize=1)
+def _settings() -> dict:
+    """Superset configuration from YAML, read on first use."""
+    return config.get_superset_config()
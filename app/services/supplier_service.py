@@ -2,6 +2,7 @@ from typing import Optional
 
 from analysercomptacore.services import SupplierService as CoreSupplierService
 from app.database import get_db
+from app.services.supplier_stats import SupplierStats
 
 
 class SupplierService:
@@ -19,6 +20,23 @@ class SupplierService:
         with get_db() as db:
             return CoreSupplierService.get_all_suppliers_with_counts(db)
 
+    @staticmethod
+    def get_all_with_stats(query: Optional[str] = None) -> list[dict]:
+        """Get suppliers (optionally matching a name search) with their counters.
+
+        Counters come from the in-memory SupplierStats store, so this costs
+        one read of the supplier table instead of aggregates over products
+        and factures.
+        """
+        with get_db() as db:
+            if query:
+                suppliers = CoreSupplierService.search_suppliers(db, query)
+            else:
+                suppliers = CoreSupplierService.get_all_suppliers(db)
+        stats = SupplierStats.get_all()
+        empty = {'product_count': 0, 'facture_count': 0, 'last_facture_date': None, 'total_spend': 0.0}
+        return [{**supplier, **stats.get(supplier['idsupplier'], empty)} for supplier in suppliers]
+
     @staticmethod
     def get_by_id(supplier_id: int) -> Optional[dict]:
         """Get a supplier by ID."""
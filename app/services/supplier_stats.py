@@ -0,0 +1,216 @@
+"""Per-supplier counters (products, factures, last facture date, spend) kept up to date in memory."""
+import threading
+import time
+from typing import Iterable, Optional
+
+from sqlalchemy import func
+
+from app.database import get_db
+from app.logging_config import get_logger
+from app.models import SupplierFacture, SupplierProduct
+from app.shared_cache import SharedCache
+
+logger = get_logger(__name__)
+
+# Full recount period, to pick up changes made outside the web app (CLI uploads...)
+RECONCILE_INTERVAL = 600.0  # seconds
+# Longest a read waits for the first count
+LOAD_TIMEOUT = 60.0  # seconds
+
+# {idsupplier: {'product_count', 'facture_count', 'last_facture_date', 'total_spend'}}
+_stats: dict[int, dict] = {}
+_state = {'loaded': False, 'reconciling': False, 'thread': None}
+# Suppliers adjusted while a full recount runs: recounted again once it is applied
+_touched: set[int] = set()
+_lock = threading.RLock()
+_loaded = threading.Event()
+# Wakes the 'supplier-stats' thread for an early full recount
+_wake = threading.Event()
+
+
+class SupplierStats:
+    """Store of supplier counters, updated by writes instead of recounted on every read.
+
+    Product and facture writes made through the services adjust the counters
+    directly; bulk operations refresh just the suppliers they touched. A full
+    recount (two GROUP BY queries) runs in the 'supplier-stats' thread on
+    first use and then every RECONCILE_INTERVAL to correct any drift: reads
+    only copy the counters.
+    """
+
+    @staticmethod
+    def get(supplier_id: int) -> dict:
+        """Counters of one supplier (zeros if it has no products or factures)."""
+        return SupplierStats.get_all().get(supplier_id, _empty())
+
+    @staticmethod
+    def get_all() -> dict[int, dict]:
+        """Counters of every supplier having products or factures."""
+        _start()
+        if not _loaded.wait(LOAD_TIMEOUT):
+            raise RuntimeError("Supplier statistics are still being computed, try again shortly")
+        with _lock:
+            return {supplier_id: dict(stats) for supplier_id, stats in _stats.items()}
+
+    @staticmethod
+    def reconcile() -> None:
+        """Recount everything from the product and facture tables."""
+        with _lock:
+            _state['reconciling'] = True
+            _touched.clear()
+        try:
+            started = time.perf_counter()
+            with get_db() as db:
+                fresh = _count(db)
+        finally:
+            with _lock:
+                _state['reconciling'] = False
+        with _lock:
+            _stats.clear()
+            _stats.update(fresh)
+            _state['loaded'] = True
+            touched = set(_touched)
+            _touched.clear()
+        _loaded.set()
+        # Writes made during the count may or may not be in it
+        _recount(touched)
+        logger.info(f"Supplier stats reconciled: {len(fresh)} supplier(s) in {time.perf_counter() - started:.1f}s")
+
+    @staticmethod
+    def refresh(supplier_ids: Iterable[Optional[int]]) -> None:
+        """Recount only the given suppliers (after bulk changes to their rows)."""
+        supplier_ids = {int(s) for s in supplier_ids if s}
+        _recount(supplier_ids)
+        _publish(supplier_ids)
+
+    @staticmethod
+    def invalidate() -> None:
+        """Recount everything in the background (after changes affecting unknown suppliers)."""
+        _wake.set()
+        _publish(None)
+
+    @staticmethod
+    def product_added(supplier_id: Optional[int], count: int = 1) -> None:
+        _adjust(supplier_id, 'product_count', count)
+
+    @staticmethod
+    def product_removed(supplier_id: Optional[int], count: int = 1) -> None:
+        _adjust(supplier_id, 'product_count', -count)
+
+    @staticmethod
+    def facture_added(supplier_id: Optional[int], fact_date, amount_ht: Optional[float]) -> None:
+        if not supplier_id:
+            return
+        with _lock:
+            _note_touched(supplier_id)
+            if _state['loaded']:
+                stats = _stats.setdefault(int(supplier_id), _empty())
+                stats['facture_count'] += 1
+                stats['total_spend'] += float(amount_ht or 0)
+                date_text = _date_text(fact_date)
+                if date_text and (stats['last_facture_date'] is None or date_text > stats['last_facture_date']):
+                    stats['last_facture_date'] = date_text
+        _publish({supplier_id})
+
+
+def _empty() -> dict:
+    return {'product_count': 0, 'facture_count': 0, 'last_facture_date': None, 'total_spend': 0.0}
+
+
+def _start() -> None:
+    """Start the 'supplier-stats' thread if it is not running yet."""
+    if _state['thread'] is None:
+        with _lock:
+            if _state['thread'] is None:
+                _state['thread'] = threading.Thread(target=_reconcile_loop, name='supplier-stats', daemon=True)
+                _state['thread'].start()
+
+
+def _reconcile_loop() -> None:
+    while True:
+        try:
+            SupplierStats.reconcile()
+        except Exception as e:
+            logger.error(f"Supplier stats reconcile failed: {e}")
+        _wake.wait(RECONCILE_INTERVAL)
+        _wake.clear()
+
+
+def _note_touched(supplier_id) -> None:
+    if _state['reconciling']:
+        _touched.add(int(supplier_id))
+
+
+def _adjust(supplier_id: Optional[int], field: str, delta: int) -> None:
+    if not supplier_id:
+        return
+    with _lock:
+        _note_touched(supplier_id)
+        if _state['loaded']:
+            stats = _stats.setdefault(int(supplier_id), _empty())
+            stats[field] = max(0, stats[field] + delta)
+    _publish({supplier_id})
+
+
+def _recount(supplier_ids: set[int]) -> None:
+    if not _state['loaded'] or not supplier_ids:
+        return
+    with _lock:
+        for supplier_id in supplier_ids:
+            _note_touched(supplier_id)
+    with get_db() as db:
+        fresh = _count(db, supplier_ids)
+    with _lock:
+        for supplier_id in supplier_ids:
+            _stats[supplier_id] = fresh.get(supplier_id, _empty())
+
+
+def _publish(supplier_ids: Optional[set[int]]) -> None:
+    """Have the other workers recount these suppliers (or everything, for None)."""
+    if supplier_ids is None:
+        SharedCache.publish('supplier_stats')
+    elif supplier_ids:
+        SharedCache.publish('supplier_stats', sorted(int(s) for s in supplier_ids))
+
+
+def _on_remote_change(supplier_ids: Optional[list[int]]) -> None:
+    if supplier_ids is None:
+        _wake.set()
+    else:
+        _recount(set(supplier_ids))
+
+
+def _date_text(value) -> Optional[str]:
+    if not value:
+        return None
+    return value.strftime('%Y-%m-%d') if hasattr(value, 'strftime') else str(value)[:10]
+
+
+def _count(db, supplier_ids: Optional[set[int]] = None) -> dict[int, dict]:
+    """Aggregate counters per supplier, for all suppliers or the given ones."""
+    products = db.query(SupplierProduct.idsupplier, func.count(SupplierProduct.idsupplierproduct))
+    factures = db.query(
+        SupplierFacture.idsupplier,
+        func.count(SupplierFacture.idFacture),
+        func.max(SupplierFacture.factDate),
+        func.coalesce(func.sum(SupplierFacture.factmontantHT), 0),
+    )
+    if supplier_ids is not None:
+        products = products.filter(SupplierProduct.idsupplier.in_(supplier_ids))
+        factures = factures.filter(SupplierFacture.idsupplier.in_(supplier_ids))
+
+    stats: dict[int, dict] = {}
+    for supplier_id, count in products.group_by(SupplierProduct.idsupplier):
+        if supplier_id is not None:
+            stats.setdefault(supplier_id, _empty())['product_count'] = count
+    for supplier_id, count, last_date, spend in factures.group_by(SupplierFacture.idsupplier):
+        if supplier_id is not None:
+            entry = stats.setdefault(supplier_id, _empty())
+            entry['facture_count'] = count
+            entry['last_facture_date'] = _date_text(last_date)
+            entry['total_spend'] = float(spend)
+    return stats
+
+
+# Supplier rows written by other workers
+SharedCache.subscribe('supplier_stats', _on_remote_change)
@@ -0,0 +1,238 @@
+"""Cache state shared between web workers: a key/value store and an invalidation bus on a local SQLite file."""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Shared store - configurable via environment variable (must be on a local disk: WAL needs shared memory)
+SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH', 'shared_cache.sqlite3')
+# Number of web workers; the store is only used when there are several
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', '1'))
+# Delay between two checks for invalidations published by other workers
+POLL_INTERVAL = 1.0  # seconds
+# Invalidation events older than this are pruned
+EVENT_RETENTION = 3600.0  # seconds
+
+_subscribers: dict[str, list[Callable[[Any], None]]] = {}
+_state = {'last_event': None, 'listener': None, 'pruned_at': 0.0}
+_local = threading.local()
+_lock = threading.Lock()
+
+
+class SharedCache:
+    """State that must agree across web workers.
+
+    With a single worker (the default) every call is a no-op or a miss and
+    caches stay purely in-process. With WEB_WORKERS > 1:
+
+    - get()/set() share computed values (e.g. tokens) so each is computed
+      once, not once per worker;
+    - publish() records an invalidation; a listener thread in every other
+      worker picks it up within POLL_INTERVAL and calls the callbacks
+      registered with subscribe(), which drop their local copies;
+    - acquire()/release() guard operations that must not run in two workers
+      at once.
+    """
+
+    @staticmethod
+    def enabled() -> bool:
+        return WEB_WORKERS > 1
+
+    @staticmethod
+    def get(key: str) -> Optional[Any]:
+        """Get a shared value, or None if missing, expired or not shared."""
+        if not SharedCache.enabled():
+            return None
+        try:
+            row = _connect().execute('SELECT value, expires_at FROM kv WHERE key = ?', (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Could not read shared cache {SHARED_CACHE_PATH}: {e}")
+            return None
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return json.loads(row[0])
+
+    @staticmethod
+    def set(key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Share a JSON serializable value, optionally for ttl seconds only."""
+        if not SharedCache.enabled():
+            return
+        expires_at = time.time() + ttl if ttl else None
+        try:
+            conn = _connect()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+                             (key, json.dumps(value), expires_at))
+        except sqlite3.Error as e:
+            logger.error(f"Could not write shared cache {SHARED_CACHE_PATH}: {e}")
+
+    @staticmethod
+    def delete(key: str) -> None:
+        """Remove a shared value."""
+        if not SharedCache.enabled():
+            return
+        try:
+            conn = _connect()
+            with conn:
+                conn.execute('DELETE FROM kv WHERE key = ?', (key,))
+        except sqlite3.Error as e:
+            logger.error(f"Could not write shared cache {SHARED_CACHE_PATH}: {e}")
+
+    @staticmethod
+    def acquire(name: str, ttl: float) -> bool:
+        """Take a lock shared by all workers, held for ttl seconds at most.
+
+        Returns:
+            True if the lock was free (or expired) and is now held by this
+            worker; always True when the store is not shared
+        """
+        if not SharedCache.enabled():
+            return True
+        key, now = f'lock:{name}', time.time()
+        try:
+            conn = _connect()
+            with conn:
+                # Both statements run in one write transaction: two workers cannot both get the lock
+                conn.execute('DELETE FROM kv WHERE key = ? AND expires_at < ?', (key, now))
+                inserted = conn.execute('INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+                                        (key, json.dumps(os.getpid()), now + ttl)).rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Could not take shared lock {name}: {e}")
+            return False
+        return inserted == 1
+
+    @staticmethod
+    def renew(name: str, ttl: float) -> None:
+        """Keep a lock held by this worker for ttl more seconds."""
+        if not SharedCache.enabled():
+            return
+        try:
+            conn = _connect()
+            with conn:
+                conn.execute('UPDATE kv SET expires_at = ? WHERE key = ? AND value = ?',
+                             (time.time() + ttl, f'lock:{name}', json.dumps(os.getpid())))
+        except sqlite3.Error as e:
+            logger.error(f"Could not renew shared lock {name}: {e}")
+
+    @staticmethod
+    def clear_locks(prefix: str) -> None:
+        """Drop every lock whose name starts with prefix, whichever worker took it.
+
+        Only for a process starting up before any worker runs: the holders
+        of such locks are gone.
+        """
+        if not SharedCache.enabled():
+            return
+        try:
+            conn = _connect()
+            with conn:
+                conn.execute('DELETE FROM kv WHERE key LIKE ?', (f'lock:{prefix}%',))
+        except sqlite3.Error as e:
+            logger.error(f"Could not clear shared locks {prefix}*: {e}")
+
+    @staticmethod
+    def release(name: str) -> None:
+        """Release a lock taken by this worker with acquire()."""
+        if not SharedCache.enabled():
+            return
+        try:
+            conn = _connect()
+            with conn:
+                conn.execute('DELETE FROM kv WHERE key = ? AND value = ?', (f'lock:{name}', json.dumps(os.getpid())))
+        except sqlite3.Error as e:
+            logger.error(f"Could not release shared lock {name}: {e}")
+
+    @staticmethod
+    def publish(topic: str, payload: Any = None) -> None:
+        """Tell the other workers to invalidate their cache for a topic.
+
+        Args:
+            topic: Cache name, as given to subscribe()
+            payload: JSON serializable detail passed to the callbacks (e.g. the
+                IDs that changed); None means everything
+        """
+        if not SharedCache.enabled():
+            return
+        try:
+            conn = _connect()
+            with conn:
+                conn.execute('INSERT INTO events (topic, payload, pid, created_at) VALUES (?, ?, ?, ?)',
+                             (topic, json.dumps(payload), os.getpid(), time.time()))
+        except sqlite3.Error as e:
+            logger.error(f"Could not publish {topic} invalidation: {e}")
+
+    @staticmethod
+    def subscribe(topic: str, callback: Callable[[Any], None]) -> None:
+        """Call callback(payload) when another worker publishes on topic."""
+        with _lock:
+            _subscribers.setdefault(topic, []).append(callback)
+            if SharedCache.enabled() and _state['listener'] is None:
+                _state['listener'] = threading.Thread(target=_listen, name='shared-cache', daemon=True)
+                _state['listener'].start()
+
+
+def _connect() -> sqlite3.Connection:
+    """Per-thread connection to the shared store."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(SHARED_CACHE_PATH, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    payload TEXT,
+                    pid INTEGER,
+                    created_at REAL
+                )
+            ''')
+        _local.conn = conn
+    return conn
+
+
+def _listen() -> None:
+    """Dispatch invalidations published by other workers to the local subscribers."""
+    while True:
+        try:
+            _poll()
+        except Exception as e:
+            logger.error(f"Shared cache listener error: {e}")
+        time.sleep(POLL_INTERVAL)
+
+
+def _poll() -> None:
+    conn = _connect()
+    if _state['last_event'] is None:
+        # Only events published after this worker started matter
+        _state['last_event'] = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+        return
+    events = conn.execute(
+        'SELECT id, topic, payload, pid FROM events WHERE id > ? ORDER BY id', (_state['last_event'],)
+    ).fetchall()
+    for event_id, topic, payload, pid in events:
+        _state['last_event'] = event_id
+        if pid == os.getpid():
+            continue
+        with _lock:
+            callbacks = list(_subscribers.get(topic, ()))
+        for callback in callbacks:
+            try:
+                callback(json.loads(payload))
+            except Exception as e:
+                logger.error(f"Shared cache {topic} invalidation failed: {e}")
+
+    now = time.time()
+    if now - _state['pruned_at'] > EVENT_RETENTION:
+        with conn:
+            conn.execute('DELETE FROM events WHERE created_at < ?', (now - EVENT_RETENTION,))
+            conn.execute('DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?', (now,))
+        _state['pruned_at'] = now
@@ -0,0 +1,288 @@
+"""Lightweight tracing: nested timing spans with correlation IDs, exported as OTLP JSON lines."""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Tracing settings - configurable via environment variables (off unless TRACING=1)
+TRACING_ENABLED = os.environ.get('TRACING', '0') == '1'
+TRACE_PATH = os.environ.get('TRACE_PATH', 'traces.jsonl')
+# Rollover settings, as for the log file
+TRACE_MAX_BYTES = 20 * 1024 * 1024  # 20 MB
+TRACE_BACKUP_COUNT = 3
+SERVICE_NAME = 'analyzercompta-web'
+# Delay between two writes of finished spans
+EXPORT_INTERVAL = 1.0  # seconds
+# Longest SQL text kept on a span
+MAX_STATEMENT_LENGTH = 500
+
+_current: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('current_span', default=None)
+_finished: queue.SimpleQueue = queue.SimpleQueue()
+_exporter = {'thread': None}
+_exporter_lock = threading.Lock()
+
+
+class Span:
+    """One timed operation; spans of the same trace share its trace_id."""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'attributes', 'start_ns', 'end_ns', 'error')
+
+    def __init__(self, name: str, parent: Optional['Span'], attributes: dict):
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+@contextmanager
+def span(name: str, root: bool = True, **attributes):
+    """Time the enclosed block as a span, child of the current one.
+
+    Args:
+        name: Span name
+        root: Start a new trace when there is no current span; with False
+            the block is only traced inside an existing trace (service calls,
+            SQL, HTTP), so background polling does not produce traces
+        **attributes: Span attributes
+
+    Yields:
+        The Span, or None when not traced
+    """
+    parent = _current.get()
+    if not TRACING_ENABLED or (parent is None and not root):
+        yield None
+        return
+    current = Span(name, parent, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        _current.reset(token)
+        _finish(current)
+
+
+def traced(name: Optional[str] = None, root: bool = True):
+    """Decorator running a function (sync, async or generator) in a span named after it.
+
+    For a generator the span covers the iteration, not the creation of the
+    generator object, so streamed exports are timed as they are consumed.
+    """
+    def decorator(func: Callable) -> Callable:
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                parent = _current.get()
+                if not TRACING_ENABLED or (parent is None and not root):
+                    return (yield from func(*args, **kwargs))
+                # The span is only current while the generator runs: each step may be
+                # resumed from another context (Starlette iterates in its thread pool)
+                current = Span(span_name, parent, {})
+                iterator = func(*args, **kwargs)
+                try:
+                    while True:
+                        token = _current.set(current)
+                        try:
+                            item = next(iterator)
+                        except StopIteration as stop:
+                            return stop.value
+                        finally:
+                            _current.reset(token)
+                        yield item
+                except GeneratorExit:
+                    raise
+                except BaseException as e:
+                    current.error = f'{type(e).__name__}: {e}'
+                    raise
+                finally:
+                    iterator.close()
+                    _finish(current)
+            return generator_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, root=root):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, root=root):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument(cls: type) -> type:
+    """Trace the public static and class methods of a service class, inside existing traces only.
+
+    With tracing off the class is returned unchanged, so service calls pay nothing.
+    """
+    if not TRACING_ENABLED:
+        return cls
+    for attr_name, attr in list(vars(cls).items()):
+        if attr_name.startswith('_') or not isinstance(attr, (staticmethod, classmethod)):
+            continue
+        wrapped = traced(f'{cls.__name__}.{attr_name}', root=False)(attr.__func__)
+        setattr(cls, attr_name, type(attr)(wrapped))
+    return cls
+
+
+def bind(func: Callable) -> Callable:
+    """Carry the current trace into another thread (run.io_bound, executors).
+
+    Executors do not copy context variables: without this, work done in the
+    thread would start unrelated traces or none.
+    """
+    context = contextvars.copy_context()
+    return functools.partial(context.run, func)
+
+
+def detach(func: Callable) -> Callable:
+    """Run a callback outside any trace.
+
+    Timers and tasks created inside a traced handler copy its context: without
+    this, their every call would add spans to a trace that already ended.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current.set(None)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return wrapper
+
+
+def current_ids() -> tuple[Optional[str], Optional[str]]:
+    """(trace_id, span_id) of the current span, for log records."""
+    current = _current.get()
+    return (current.trace_id, current.span_id) if current else (None, None)
+
+
+def instrument_engine(engine) -> None:
+    """Record a span for every SQL statement run inside a trace."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = _current.get()
+        if TRACING_ENABLED and parent is not None:
+            conn.info.setdefault('trace_spans', []).append(Span('sql', parent, {
+                'db.system': 'mysql',
+                'db.statement': statement[:MAX_STATEMENT_LENGTH],
+                'db.executemany': executemany,
+            }))
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get('trace_spans')
+        if spans:
+            current = spans.pop()
+            if cursor.rowcount is not None and cursor.rowcount >= 0:
+                current.set('db.rowcount', cursor.rowcount)
+            _finish(current)
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(exception_context):
+        spans = exception_context.connection.info.get('trace_spans') if exception_context.connection else None
+        if spans:
+            current = spans.pop()
+            current.error = str(exception_context.original_exception)
+            _finish(current)
+
+
+def _finish(current: Span) -> None:
+    current.end_ns = time.time_ns()
+    _finished.put(current)
+    if _exporter['thread'] is None:
+        with _exporter_lock:
+            if _exporter['thread'] is None:
+                _exporter['thread'] = threading.Thread(target=_export_loop, name='trace-export', daemon=True)
+                _exporter['thread'].start()
+
+
+def _export_loop() -> None:
+    """Append finished spans to TRACE_PATH, one OTLP/JSON ExportTraceServiceRequest per line."""
+    # One file per worker: rollover renames are not safe across processes
+    path = TRACE_PATH
+    worker_port = os.environ.get('WEB_WORKER_PORT')
+    if worker_port:
+        base, ext = os.path.splitext(TRACE_PATH)
+        path = f'{base}.{worker_port}{ext}'
+    while True:
+        time.sleep(EXPORT_INTERVAL)
+        spans = []
+        while not _finished.empty():
+            spans.append(_finished.get())
+        if not spans:
+            continue
+        request = {'resourceSpans': [{
+            'resource': {'attributes': [_attribute('service.name', SERVICE_NAME),
+                                        _attribute('process.pid', os.getpid())]},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': [_to_otlp(s) for s in spans]}],
+        }]}
+        try:
+            _rollover(path)
+            with open(path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(request, default=str) + '\n')
+        except OSError as e:
+            logger.error(f"Could not write traces to {path}: {e}")
+
+
+def _rollover(path: str) -> None:
+    """Shift path to path.1, path.1 to path.2... once it reaches TRACE_MAX_BYTES."""
+    if not os.path.exists(path) or os.path.getsize(path) < TRACE_MAX_BYTES:
+        return
+    for index in range(TRACE_BACKUP_COUNT - 1, 0, -1):
+        if os.path.exists(f'{path}.{index}'):
+            os.replace(f'{path}.{index}', f'{path}.{index + 1}')
+    os.replace(path, f'{path}.1')
+
+
+def _to_otlp(current: Span) -> dict:
+    otlp = {
+        'traceId': current.trace_id,
+        'spanId': current.span_id,
+        'name': current.name,
+        'kind': 1,  # SPAN_KIND_INTERNAL
+        'startTimeUnixNano': str(current.start_ns),
+        'endTimeUnixNano': str(current.end_ns),
+        'attributes': [_attribute(key, value) for key, value in current.attributes.items()],
+        'status': {'code': 2, 'message': current.error} if current.error else {'code': 1},
+    }
+    if current.parent_id:
+        otlp['parentSpanId'] = current.parent_id
+    return otlp
+
+
+def _attribute(key: str, value: Any) -> dict:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
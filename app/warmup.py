@@ -0,0 +1,150 @@
+"""Background warm-up after startup: database pool, Superset session and in-memory caches."""
+import os
+import threading
+import time
+from datetime import date
+from typing import Callable
+
+from dateutil.relativedelta import relativedelta
+
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Warm-up settings - configurable via environment variables
+WARMUP_ENABLED = os.environ.get('WARMUP', '1') != '0'
+# Pool connections opened ahead of the first requests (capped to the pool size)
+WARMUP_CONNECTIONS = int(os.environ.get('WARMUP_CONNECTIONS', '5'))
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+DISABLED = 'disabled'
+
+_status = {'state': PENDING, 'started_at': None, 'finished_at': None, 'steps': {}}
+_lock = threading.Lock()
+
+
+class Warmup:
+    """Runs the first-visit costs (connections, logins, reference queries) right after startup.
+
+    Steps run one after the other in a background thread; a failing step is
+    logged and skipped, the others still run. The app reports ready once
+    every step has been attempted.
+    """
+
+    @staticmethod
+    def start() -> None:
+        """Start the warm-up in the background (once)."""
+        with _lock:
+            if _status['state'] != PENDING:
+                return
+            if not WARMUP_ENABLED:
+                _status['state'] = DISABLED
+                logger.info('Warm-up disabled, ready')
+                return
+            _status['state'] = RUNNING
+            _status['started_at'] = time.time()
+        threading.Thread(target=_run, name='warmup', daemon=True).start()
+
+    @staticmethod
+    def is_ready() -> bool:
+        """Whether the warm-up has completed (or is disabled)."""
+        return _status['state'] in (DONE, DISABLED)
+
+    @staticmethod
+    def status() -> dict:
+        """State, timestamps and per-step results ({name: {'seconds', 'error'}})."""
+        with _lock:
+            return {**_status, 'steps': {name: dict(step) for name, step in _status['steps'].items()}}
+
+
+def _run() -> None:
+    started = time.perf_counter()
+    for name, step in STEPS:
+        step_started = time.perf_counter()
+        error = None
+        try:
+            step()
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Warm-up step '{name}' failed: {e}")
+        seconds = round(time.perf_counter() - step_started, 3)
+        with _lock:
+            _status['steps'][name] = {'seconds': seconds, 'error': error}
+        logger.info(f"Warm-up step '{name}' done in {seconds:.2f}s")
+    with _lock:
+        _status['state'] = DONE
+        _status['finished_at'] = time.time()
+    logger.info(f"Warm-up completed in {time.perf_counter() - started:.2f}s, ready")
+
+
+def _import_pages() -> None:
+    from app.pages import import_pages
+    import_pages()
+
+
+def _open_pool() -> None:
+    """Open connections up to WARMUP_CONNECTIONS and give them back to the pool."""
+    from sqlalchemy import text
+    from app.database import get_engine
+
+    engine = get_engine()
+    count = min(WARMUP_CONNECTIONS, engine.pool.size())
+    connections = []
+    try:
+        for _ in range(count):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text('SELECT 1'))
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def _connect_superset() -> None:
+    from app.pages.dashboard import SUPERSET_DASHBOARD_SLUG
+    from app.services import SupersetService
+
+    SupersetService.connect()
+    SupersetService.get_dashboard_uuid(SUPERSET_DASHBOARD_SLUG)
+
+
+def _load_reference_data() -> None:
+    from app.services import ProductService
+    from app.services.supplier_stats import SupplierStats
+
+    ProductService.catalog_version()  # loads the catalog and search index
+    SupplierStats.get_all()  # starts the background recount and waits for the first one
+
+
+def _load_bank_months() -> None:
+    """Summaries and classified transactions of the current and previous month."""
+    from app.services import BankInstructionService
+
+    current = date.today().replace(day=1)
+    for month in (current, current - relativedelta(months=1)):
+        BankInstructionService.get_monthly_summary(month.month, month.year)
+        BankInstructionService.get_classified_transactions(month.month, month.year)
+
+
+def _build_bank_index() -> None:
+    from app.services import BankInstructionService
+    BankInstructionService.start_search_index(wait=True)
+
+
+def _compute_kpis() -> None:
+    from app.services import KpiService
+    KpiService.refresh()
+
+
+# Run in this order: later steps reuse the connections opened by 'pool'
+STEPS: list[tuple[str, Callable[[], None]]] = [
+    ('pages', _import_pages),
+    ('pool', _open_pool),
+    ('superset', _connect_superset),
+    ('reference_data', _load_reference_data),
+    ('bank_months', _load_bank_months),
+    ('bank_index', _build_bank_index),
+    ('kpis', _compute_kpis),
+]
@@ -0,0 +1,72 @@
+"""Multi-worker mode: several web worker processes behind the sticky proxy."""
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+from app.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Port of this process when it is one of several workers (None when running alone)
+WORKER_PORT = os.environ.get('WEB_WORKER_PORT')
+# Delay before restarting a worker that exited
+RESTART_DELAY = 2.0  # seconds
+
+_MAIN = Path(__file__).parent.parent / 'main.py'
+
+
+def is_worker() -> bool:
+    """Whether this process is a worker started by run_workers()."""
+    return WORKER_PORT is not None
+
+
+def run_workers(port: int, count: int) -> None:
+    """Start `count` workers on the ports after `port`, and serve them on `port`.
+
+    Workers are plain `main.py` processes bound to localhost; a worker that
+    exits is restarted. Blocks until interrupted, then stops the workers.
+    """
+    from app.proxy import StickyProxy
+    from app.services.job_service import JobService
+
+    # Before any worker runs: jobs left running by the previous processes
+    JobService.init_history()
+
+    worker_ports = [port + 1 + i for i in range(count)]
+    processes = {worker_port: _start(worker_port) for worker_port in worker_ports}
+    stopping = threading.Event()
+
+    def watch():
+        while not stopping.wait(RESTART_DELAY):
+            for worker_port, process in list(processes.items()):
+                if process.poll() is not None and not stopping.is_set():
+                    logger.warning(f"Worker on port {worker_port} exited ({process.returncode}), restarting")
+                    processes[worker_port] = _start(worker_port)
+
+    threading.Thread(target=watch, name='worker-watch', daemon=True).start()
+    try:
+        asyncio.run(StickyProxy('0.0.0.0', port, worker_ports).serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopping.set()
+        for process in processes.values():
+            process.terminate()
+        deadline = time.monotonic() + 10
+        for process in processes.values():
+            try:
+                process.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+        logger.info('Workers stopped')
+
+
+def _start(worker_port: int) -> subprocess.Popen:
+    env = {**os.environ, 'WEB_WORKER_PORT': str(worker_port)}
+    process = subprocess.Popen([sys.executable, str(_MAIN)], env=env, cwd=str(_MAIN.parent))
+    logger.info(f"Worker started on port {worker_port} (pid {process.pid})")
+    return process
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Startup cost benchmark: time to import the application, from `python -X importtime`.
+
+Usage:
+    python benchmarks/import_time.py [--module main] [--top 20] [--budget 1000]
+
+Imports the module in a fresh interpreter (without starting the server),
+then prints the wall time, the slowest imports by cumulative time, and the
+application's own modules. With --budget (milliseconds), exits with status 1
+when the import takes longer, so it can guard against startup regressions.
+"""
+import argparse
+import re
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+
+def measure(module: str) -> tuple[float, list[tuple[str, int, int, int]]]:
+    """Import `module` in a subprocess.
+
+    Returns:
+        Tuple of (wall time in ms, [(name, self us, cumulative us, depth)])
+    """
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr[-4000:])
+        raise SystemExit(f'Importing {module} failed')
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return wall_ms, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--module', default='main', help='Module to import (default: main)')
+    parser.add_argument('--top', type=int, default=20, help='Number of slowest imports to list')
+    parser.add_argument('--budget', type=float, help='Fail if the import takes longer (ms)')
+    args = parser.parse_args()
+
+    wall_ms, imports = measure(args.module)
+    total_ms = sum(self_us for _, self_us, _, _ in imports) / 1000
+
+    print(f'{args.module}: {wall_ms:.0f} ms wall, {total_ms:.0f} ms in {len(imports)} imports')
+    print('\nSlowest top-level imports (cumulative):')
+    top_level = sorted((i for i in imports if i[3] == 0), key=lambda i: i[2], reverse=True)
+    for name, _, cumulative_us, _ in top_level[:args.top]:
+        print(f'  {cumulative_us / 1000:8.1f} ms  {name}')
+
+    print('\nApplication modules (self):')
+    own = sorted((i for i in imports if i[0] == 'main' or i[0].startswith('app')), key=lambda i: i[1], reverse=True)
+    for name, self_us, _, _ in own[:args.top]:
+        print(f'  {self_us / 1000:8.1f} ms  {name}')
+
+    if args.budget is not None and wall_ms > args.budget:
+        print(f'\nOver budget: {wall_ms:.0f} ms > {args.budget:.0f} ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
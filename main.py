@@ -11,21 +11,25 @@ logger = get_logger(__name__)
 
 from nicegui import ui, app
 
-# Import all pages to register routes
-from app.pages import (
-    dashboard_page,
-    suppliers_page,
-    products_page,
-    factures_page,
-    review_page,
-    transactions_page,
-    explore_transactions_page,
-)
+from app.downloads import register_download_routes
+from app.health import register_health_routes
+from app.warmup import Warmup
+from app.workers import WORKER_PORT, is_worker, run_workers
+
+# Register page routes; page modules are imported on first visit
+from app.pages import register_pages
+register_pages()
 
 # Configure app
 app.native.window_args['resizable'] = True
 app.native.start_args['debug'] = False
 app.add_static_files('/static', 'app')
+# Pre-open connections and fill caches once the server is up
+app.on_startup(Warmup.start)
+# /healthz and /readyz for the orchestrator
+register_health_routes()
+# Streamed file exports
+register_download_routes()
 
 
 def main():
@@ -34,12 +38,24 @@ def main():
     # Use port 8099 for production, 9090 for development
     port = 8099 if os.environ.get('APP_ENV') == 'production' else 9090
     show_browser = os.environ.get('APP_ENV') != 'production'
+    # Several workers use several cores: WEB_WORKERS=4 runs 4 workers behind a sticky proxy on `port`
+    workers = int(os.environ.get('WEB_WORKERS', '1'))
+
+    if workers > 1 and not is_worker():
+        logger.info(f"Starting AnalyzerComptaWeb on port {port} with {workers} workers")
+        run_workers(port, workers)
+        return
+
+    if is_worker():
+        # Only reachable through the proxy
+        port, show_browser = int(WORKER_PORT), False
 
     logger.info(f"Starting AnalyzerComptaWeb on port {port}")
     ui.run(
         title='AnalyzerCompta - Supplier Management',
         favicon='app/isotipo-preferente-color_positivo.png',
         dark=None,  # Auto-detect system preference
+        host='127.0.0.1' if is_worker() else None,
         port=port,
         reload=False,  # Disabled for now
         show=show_browser,  # Don't open browser in production